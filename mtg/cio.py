@@ -301,12 +301,94 @@ class CatOption:
         self.title: str = title if title is not None else displayed
 
 
+class CatPage:
+    """
+    One page of items returned by a paged fetch function. total is the number
+    of items across all pages with the given fetch filters applied, and
+    next_cursor is the value to pass back to the fetch function to get the page
+    that follows this one.
+    """
+    def __init__(self, items: list[tuple[any, str]], total: int, next_cursor: any=None):
+        self.items = items
+        self.total = total
+        self.next_cursor = next_cursor
+
+    def __repr__(self) -> str:
+        return "CatPage(items=[{:d} items], total={!r}, next_cursor={!r})".format(len(self.items), self.total, self.next_cursor)
+
+
+class CatPagedItems:
+    """
+    Read-only sequence of all items that a paged fetch function returns for a
+    set of fetch filters. Pages are fetched only when an item on them is
+    accessed, so this can stand in for the full list of filtered items without
+    loading every item up front.
+    """
+    def __init__(
+            self,
+            fetch: Callable[[dict[str, str], int, any], CatPage],
+            fetch_filters: dict[str, str],
+            per_page: int,
+            total: int,
+            page_cursors: list[any],
+            loaded_pages: dict[int, list[tuple[any, str]]] | None=None
+        ):
+        self._fetch = fetch
+        self._filters = dict(fetch_filters)
+        self._per_page = per_page
+        self._total = total
+        self._cursors = list(page_cursors)
+        self._pages = dict(loaded_pages) if loaded_pages is not None else {}
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __getitem__(self, idx: int) -> tuple[any, str]:
+        if idx < 0:
+            idx += self._total
+        if idx < 0 or idx >= self._total:
+            raise IndexError("item index out of range")
+
+        page = self._load_page(idx // self._per_page)
+        offset = idx % self._per_page
+        if offset >= len(page):
+            # items were removed since the total was counted
+            raise IndexError("item index out of range")
+        return page[offset]
+
+    def __iter__(self):
+        for i in range(self._total):
+            yield self[i]
+
+    def _load_page(self, page_num: int) -> list[tuple[any, str]]:
+        if page_num in self._pages:
+            return self._pages[page_num]
+
+        # cursors are only known for pages up to the one after the last one
+        # fetched, so walk forward to the requested page. If a page gives no
+        # cursor to go on from, there are no pages past it; items were removed
+        # since the total was counted.
+        while len(self._cursors) <= page_num:
+            known = len(self._cursors)
+            self._load_page(known - 1)
+            if len(self._cursors) == known:
+                return []
+
+        cursor = self._cursors[page_num]
+        result = self._fetch(self._filters, self._per_page, cursor)
+        self._pages[page_num] = result.items
+        if len(self._cursors) == page_num + 1 and len(result.items) > 0 and result.next_cursor is not None and result.next_cursor != cursor:
+            self._cursors.append(result.next_cursor)
+        return result.items
+
+
 class CatState:
-    def __init__(self, page_num: int, active_list_filters: dict, active_fetch_filters: dict, page: list[tuple[any, str]]):
+    def __init__(self, page_num: int, active_list_filters: dict, active_fetch_filters: dict, page: list[tuple[any, str]], page_cursors: list[any] | None=None):
         self.page_num = page_num
         self.active_list_filters = active_list_filters
         self.active_fetch_filters = active_fetch_filters
         self.page = page
+        self.page_cursors = page_cursors
 
 
 def catalogprint_page(page: list[tuple[any, str]], top_prompt: Optional[str]=None, per_page: int=10, fill_empty: bool=True):
@@ -360,7 +442,7 @@ class CatFilter:
 
 
 class CatResult:
-    def __init__(self, action: str, item: Optional[any], state: CatState, filtered_items: list[tuple[any, str]]):
+    def __init__(self, action: str, item: Optional[any], state: CatState, filtered_items: list[tuple[any, str]] | CatPagedItems):
         self.action = action
         self.item = item
         self.state = state
@@ -381,14 +463,15 @@ class CatResult:
 
 def catalog_select(
         top_prompt: Optional[str],
-        items: list[tuple[any, str]] | Callable[[dict[str, str]], list[tuple[any, str]]],
+        items: list[tuple[any, str]] | Callable[[dict[str, str]], list[tuple[any, str]]] | Callable[[dict[str, str], int, any], CatPage],
         per_page: int=10,
         filters: list[CatFilter]=None,
         fill_empty: bool=True,
         state: Optional[CatState]=None,
         include_create: bool=True,
         include_select: bool=True,
-        extra_options: Optional[list[CatOption]]=None
+        extra_options: Optional[list[CatOption]]=None,
+        paged: bool=False
     ) -> CatResult:
     """
     Select an item from a paginated catalog, or exit the catalog. Returns a
@@ -398,15 +481,26 @@ def catalog_select(
     is a fetch function, it will be passed the dict of active fetch-filters that
     map filter names to current values.
 
+    If paged is set, items must be a fetch function that returns only one page
+    at a time as a CatPage. It is passed the active fetch-filters, the number of
+    items per page, and the next_cursor of the CatPage before the one wanted (or
+    None for the first page). If it is passed 0 for the number per page, it must
+    return every item in a single page; this is done while any list filters are
+    active, as those can only be applied to the full list.
+
     Return a tuple containing the selected action, the selected item (if
     applicable, else None), the state of the catalog, the current list of
-    filtered items as was displayed at the time of the selection.
+    filtered items as was displayed at the time of the selection. In paged mode,
+    the filtered items are given as a CatPagedItems that fetches pages as they
+    are accessed.
     """
 
     # it is illegal to have fetch filters if items is not a function. Check that
     # now.
     if any([f.on_fetch for f in filters]) and not callable(items):
         raise ValueError("Cannot have fetch filters if items is not a fetch-function")
+    if paged and not callable(items):
+        raise ValueError("Cannot be paged if items is not a fetch-function")
 
     filter_by: dict[str, CatFilter] = None
     if filters is not None:
@@ -448,21 +542,85 @@ def catalog_select(
     active_list_filters = state.active_list_filters if state is not None else {}
     if active_fetch_filters is None:
         active_fetch_filters = {}
+    if active_list_filters is None:
+        active_list_filters = {}
+
+    page_cursors = state.page_cursors if state is not None else None
+    if page_cursors is None:
+        page_cursors = [None]
 
-    # TODO: probably want pagination AFTER this 38/
-    # - We should get it for free with the apply_list_filters function ::::)
     fetch_items_fn = None
     if callable(items):
         fetch_items_fn = items
-        items = fetch_items_fn(active_fetch_filters)
+        items = None
+
+    # the current page, the total shown for it, and how many pages there are.
+    # When not fetching a page at a time, pages holds every page.
+    pages: list[list[tuple[any, str]]] = []
+    page: list[tuple[any, str]] = []
+    total = 0
+    page_count = 0
+
+    def fetching_pages() -> bool:
+        # list filters can only be applied to the full list of items, so those
+        # are fetched in one go whenever any are active.
+        return paged and len(active_list_filters) == 0
+
+    def refresh(refetch: bool):
+        """
+        Bring the current page up to date with the filters. If refetch is set,
+        the fetch filters have changed and anything fetched before is stale.
+        """
+        nonlocal items, pages, page, page_num, total, page_count, page_cursors
+
+        if fetching_pages():
+            items = None
+            if refetch:
+                page_num = 0
+                page_cursors = [None]
+            page_num = max(min(page_num, len(page_cursors) - 1), 0)
+            page_cursors = page_cursors[:page_num + 1]
+
+            result = fetch_items_fn(active_fetch_filters, per_page, page_cursors[page_num])
+
+            # if items were removed since we last looked, the page could be
+            # empty now; back up until there's one that isn't.
+            while len(result.items) < 1 and page_num > 0:
+                page_num -= 1
+                page_cursors = page_cursors[:page_num + 1]
+                result = fetch_items_fn(active_fetch_filters, per_page, page_cursors[page_num])
+
+            page = result.items
+            total = result.total
+            page_count = (total + per_page - 1) // per_page
+            if page_num < page_count - 1:
+                page_cursors.append(result.next_cursor)
+            return
+
+        if items is None or (refetch and fetch_items_fn is not None):
+            if paged:
+                items = fetch_items_fn(active_fetch_filters, 0, None).items
+            else:
+                items = fetch_items_fn(active_fetch_filters)
 
-    if active_list_filters is None:
-        active_list_filters = {}
-        pages = paginate(items, per_page)
-        if page_num >= len(pages):
-            page_num = len(pages) - 1
-    else:
         pages, page_num = apply_list_filters(items, page_num, active_list_filters)
+        page = pages[page_num] if len(pages) > 0 else []
+        total = len(items)
+        page_count = len(pages)
+
+    def current_filtered_items() -> list[tuple[any, str]] | CatPagedItems:
+        if fetching_pages():
+            return CatPagedItems(fetch_items_fn, active_fetch_filters, per_page, total, page_cursors, {page_num: page})
+        filtered_items = []
+        for p in pages:
+            filtered_items.extend(p)
+        return filtered_items
+
+    def current_state() -> CatState:
+        cursors = page_cursors if fetching_pages() else None
+        return CatState(page_num, active_list_filters, active_fetch_filters, page, cursors)
+
+    refresh(False)
 
     # for selection prompts:
     extra_lines = 3  # 1 for end bar, 1 for total count, 1 for actions
@@ -472,11 +630,6 @@ def catalog_select(
     while True:
         clear()
 
-        if len(pages) > 0:
-            page = pages[page_num]
-        else:
-            page = []
-        
         catalogprint_page(page, top_prompt, per_page, fill_empty)
         if filter_by is not None:
             if len(active_list_filters) > 0 or len(active_fetch_filters) > 0:
@@ -486,14 +639,14 @@ def catalog_select(
                 print(' AND '.join(["{:s}:{!r}".format(k.upper(), v) for k, v in all_active_filters.items()]))
             else:
                 print("(NO FILTERS)")
-        print("{:d} total (Page {:d}/{:d})".format(len(items), max(page_num+1, 1), max(len(pages), 1)))
+        print("{:d} total (Page {:d}/{:d})".format(total, max(page_num+1, 1), max(page_count, 1)))
 
         avail_choices = []
-        if len(pages) > 1:
+        if page_count > 1:
             if page_num > 0:
                 print("(P)revious Page,", end=' ')
                 avail_choices.append('P')
-            if page_num < len(pages) - 1:
+            if page_num < page_count - 1:
                 print("(N)ext Page,", end=' ')
                 avail_choices.append('N')
         if filter_by is not None and len(filter_by) > 0:
@@ -514,10 +667,18 @@ def catalog_select(
 
         choice = prompt_choice(prompt=None, choices=avail_choices, transform=lambda x: x.strip().upper())
 
-        if choice == 'N' and page_num < len(pages) - 1:
+        if choice == 'N' and page_num < page_count - 1:
             page_num += 1
+            if fetching_pages():
+                refresh(False)
+            else:
+                page = pages[page_num]
         elif choice == 'P' and page_num > 0:
             page_num -= 1
+            if fetching_pages():
+                refresh(False)
+            else:
+                page = pages[page_num]
         elif choice == 'F' and filter_by is not None and len(filter_by) > 0:
             clear()
             catalogprint_page(page, top_prompt, per_page, fill_empty)
@@ -540,10 +701,7 @@ def catalog_select(
                 active_list_filters.clear()
                 active_fetch_filters.clear()
 
-                if refetch:
-                    items = fetch_items_fn(active_fetch_filters)
-
-                pages, page_num = apply_list_filters(items, page_num, active_list_filters)
+                refresh(refetch)
                 continue
             elif filter_key == '><*>CANCEL<*><':
                 continue
@@ -589,12 +747,9 @@ def catalog_select(
             else:
                 active_list_filters[filter_key] = filter_expr
 
-            # refetch if we just altered a fetch filter
-            if f.on_fetch:
-                items = fetch_items_fn(active_fetch_filters)
-
-            # update pages to be filtered
-            pages, page_num = apply_list_filters(items, page_num, active_list_filters)
+            # refetch if we just altered a fetch filter, and update pages to be
+            # filtered
+            refresh(f.on_fetch)
         elif include_select and choice == 'S':
             clear()
             # print the entire top prompt EXCEPT for the last line
@@ -605,20 +760,11 @@ def catalog_select(
             selected = select("Which one?\n" + ("-" * 22), page, non_number_choices=[('C', '><*>CANCEL<*><', 'CANCEL')], fill_to=per_page+extra_lines)
             if isinstance(selected, str) and selected == '><*>CANCEL<*><':
                 continue
-            filtered_items = []
-            for p in pages:
-                filtered_items.extend(p)
-            return CatResult('SELECT', selected, CatState(page_num, active_list_filters, active_fetch_filters, page), filtered_items)
+            return CatResult('SELECT', selected, current_state(), current_filtered_items())
         elif include_create and choice == 'C':
-            filtered_items = []
-            for p in pages:
-                filtered_items.extend(p)
-            return CatResult('CREATE', None, CatState(page_num, active_list_filters, active_fetch_filters, page), filtered_items)
+            return CatResult('CREATE', None, current_state(), current_filtered_items())
         elif choice == 'X':
-            filtered_items = []
-            for p in pages:
-                filtered_items.extend(p)
-            return CatResult(None, None, CatState(page_num, active_list_filters, active_fetch_filters, page), filtered_items)
+            return CatResult(None, None, current_state(), current_filtered_items())
         elif choice in extra_opts_dict:
             eo = extra_opts_dict[choice]
             selected = None
@@ -637,10 +783,7 @@ def catalog_select(
                 if not confirm(eo.confirm):
                     continue
             
-            filtered_items = []
-            for p in pages:
-                filtered_items.extend(p)
-            return CatResult(eo.returned_action, selected, CatState(page_num, active_list_filters, active_fetch_filters, page), filtered_items)
+            return CatResult(eo.returned_action, selected, current_state(), current_filtered_items())
         else:
             print("Unknown option")
             pause()
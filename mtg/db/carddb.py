@@ -1,30 +1,161 @@
-from typing import Tuple
+from typing import Iterable, Iterator, Tuple
 import datetime
+import sqlite3
 
-from . import util, editiondb, filters
-from .errors import MultipleFoundError, NotFoundError, ForeignKeyError
+from . import util, editiondb, filters, schema
+from .errors import DBError, MultipleFoundError, NotFoundError, ForeignKeyError
 
-from ..types import Card, CardWithUsage, Usage, DeckChangeRecord, ScryfallCardData, ScryfallFace
+from ..types import Card, CardWithUsage, Usage, DeckChangeRecord, ScryfallCardData, ScryfallFace, InventoryTotals
 
 DEFAULT_EXPIRE_DAYS = 90
 
 
 def get_all(db_filename: str) -> list[CardWithUsage]:
+    return list(iter_all(db_filename))
+
+
+def iter_all(db_filename: str) -> Iterator[CardWithUsage]:
+    """
+    Yield every card in the inventory in order of ID, one at a time, without
+    loading the entire inventory.
+    """
     con = util.connect(db_filename)
-    cur = con.cursor()
+    try:
+        for card, _ in _group_card_rows(con.execute(sql_get_all_cards)):
+            yield card
+    finally:
+        con.close()
 
-    unique_cards: dict[int, tuple[int, CardWithUsage]] = {}  # int in tuple is for ordering
-    order = 0
-    
-    for r in cur.execute(sql_get_all_cards):
-        if r[0] not in unique_cards:
+
+def get_all_with_scryfall_data(db_filename: str) -> list[Tuple[CardWithUsage, ScryfallCardData]]:
+    return list(iter_all_with_scryfall_data(db_filename))
+
+
+def iter_all_with_scryfall_data(db_filename: str) -> Iterator[Tuple[CardWithUsage, ScryfallCardData]]:
+    """
+    Yield every card in the inventory that has scryfall data along with that
+    data, in order of ID.
+
+    Deck usage, scryfall data, and faces are each read with their own query
+    and joined to the cards here, as joining them all in SQL returns a row for
+    every combination of deck and face of each card.
+    """
+    con = util.connect(db_filename)
+    try:
+        usages: dict[int, list[Usage]] = {}
+        for r in con.execute(sql_get_usage_of_cards_with_scryfall_data):
+            usages.setdefault(r[0], []).append(Usage(
+                count=r[1],
+                wishlist_count=r[2],
+                deck_id=r[3],
+                deck_name=r[4],
+                deck_state=r[5]
+            ))
+
+        faces: dict[str, list[ScryfallFace]] = {}
+        for r in con.execute(sql_get_faces_of_inventory_scryfall_data):
+            faces.setdefault(r[0], []).append(ScryfallFace(
+                index=r[1],
+                name=r[2],
+                cost=r[3],
+                type=r[4],
+                power=r[5],
+                toughness=r[6],
+                text=r[7]
+            ))
+
+        scryfall_data: dict[str, ScryfallCardData] = {}
+        for r in con.execute(sql_get_inventory_scryfall_data):
+            scryfall_data[r[0]] = ScryfallCardData(
+                *faces.get(r[0], []),
+                id=r[0],
+                rarity=r[1],
+                uri=r[2],
+                last_updated=datetime.datetime.fromisoformat(r[3])
+            )
+        del faces
+
+        for r in con.execute(sql_get_cards_with_scryfall_data):
+            card = CardWithUsage(util.card_row_to_card(r), usages.get(r[0], None))
+            data = scryfall_data.get(card.scryfall_id, None)
+            if data is None:
+                # scryfall data was removed after it was read; treat it as
+                # never having been there.
+                continue
+            yield card, data
+    finally:
+        con.close()
+
+
+def get_all_without_scryfall_data(db_filename: str, days: int=DEFAULT_EXPIRE_DAYS) -> list[CardWithUsage]:
+    return list(iter_all_without_scryfall_data(db_filename, days))
+
+
+def iter_all_without_scryfall_data(db_filename: str, days: int=DEFAULT_EXPIRE_DAYS) -> Iterator[CardWithUsage]:
+    """
+    Yield every card in the inventory whose scryfall data is missing or older
+    than the given number of days, in order of ID.
+    """
+    con = util.connect(db_filename)
+    try:
+        for card, _ in _group_card_rows(con.execute(sql_get_all_cards_without_scryfall_data, (f'-{days} days',))):
+            yield card
+    finally:
+        con.close()
+
+
+def get_page_without_scryfall_data(db_filename: str, after_id: int | None, per_page: int, days: int=DEFAULT_EXPIRE_DAYS) -> list[CardWithUsage]:
+    """
+    Return up to per_page of the cards in the inventory whose scryfall data is
+    missing or older than the given number of days, in order of ID, starting
+    after the card with ID after_id (or from the first card if it is None).
+
+    Each page is read in full before returning, so that callers who store data
+    for the cards between pages do not hold a read open on the DB meanwhile.
+    """
+    con = util.connect(db_filename)
+    try:
+        params = (after_id if after_id is not None else -1, f'-{days} days', per_page)
+        cards = [card for card, _ in _group_card_rows(con.execute(sql_get_page_cards_without_scryfall_data, params))]
+    finally:
+        con.close()
+    return cards
+
+
+def count_without_scryfall_data(db_filename: str, days: int=DEFAULT_EXPIRE_DAYS) -> int:
+    """
+    Return the number of cards in the inventory whose scryfall data is missing
+    or older than the given number of days.
+    """
+    con = util.connect(db_filename)
+    count = con.execute(sql_count_cards_without_scryfall_data, (f'-{days} days',)).fetchone()[0]
+    con.close()
+    return count
+
+
+def _group_card_rows(rows: Iterable[tuple]) -> Iterator[Tuple[CardWithUsage, list[tuple]]]:
+    """
+    Build a CardWithUsage from each group of consecutive rows for the same card
+    and yield it along with the rows it was built from as soon as its last row
+    has been read. Rows for the same card must be consecutive (ordering by card
+    ID does this) and must begin with the columns of sql_get_all_cards; any
+    columns after those are left to the caller.
+    """
+    card: CardWithUsage | None = None
+    group: list[tuple] = []
+
+    for r in rows:
+        if card is not None and r[0] != card.id:
+            yield card, group
+            card = None
+
+        if card is None:
             card = CardWithUsage(util.card_row_to_card(r))
-            new_entry = (order, card)
-            unique_cards[card.id] = new_entry
-            order += 1
+            group = []
+        group.append(r)
 
-        if r[19] is not None:
-            card = unique_cards[r[0]][1]
+        # a deck's row may be repeated if the query joins other tables.
+        if r[19] is not None and not any(u.deck_id == r[19] for u in card.usage):
             card.usage.append(Usage(
                 count=r[17],
                 wishlist_count=r[18],
@@ -33,129 +164,130 @@ def get_all(db_filename: str) -> list[CardWithUsage]:
                 deck_state=r[21]
             ))
 
-            unique_cards[card.id] = (unique_cards[card.id][0], card)
-        
-    con.close()
+    if card is not None:
+        yield card, group
 
-    # sort on order.
-    rows = [x for x in unique_cards.values()]
-    rows.sort(key=lambda x: x[0])
-    rows = [x[1] for x in rows]
-    
-    return rows
 
+def get_totals(db_filename: str, used_states: list[str]) -> InventoryTotals:
+    """
+    Return the number of inventory entries and the total count of cards that
+    are owned, wishlisted in decks, in use in decks whose state is one of
+    used_states, and free for use.
 
-def get_all_with_scryfall_data(db_filename: str) -> list[Tuple[CardWithUsage, ScryfallCardData]]:
+    While a connection pool is open for the DB, the result is cached until the
+    DB is next modified, so repeated calls are cheap.
+    """
     con = util.connect(db_filename)
-    cur = con.cursor()
-
-    unique_cards: dict[int, tuple[int, CardWithUsage]] = {}  # int in tuple is for ordering
-    unique_scryfall_data: dict[int, ScryfallCardData] = {}
-
-    order = 0
-    
-    for r in cur.execute(sql_get_all_cards_with_scryfall_data):
-        if r[0] not in unique_cards:
-            card = CardWithUsage(util.card_row_to_card(r))
-            new_entry = (order, card)
-            unique_cards[card.id] = new_entry
-            order += 1
-
-        scryfall_id = r[16]
-
-        if scryfall_id in unique_scryfall_data:
-            scryfall_data = unique_scryfall_data[scryfall_id]
-        else:
-            scryfall_data = ScryfallCardData(
-                id=scryfall_id,
-                rarity=r[22],
-                uri=r[23],
-                last_updated=datetime.datetime.fromisoformat(r[24])
-            )
-            unique_scryfall_data[scryfall_id] = scryfall_data
-
-        scryfall_face = ScryfallFace(
-            index=r[25],
-            name=r[26],
-            cost=r[27],
-            type=r[28],
-            power=r[29],
-            toughness=r[30],
-            text=r[31]
+    try:
+        cache = None
+        cache_key = tuple(sorted(used_states))
+        version = None
+        if getattr(con, 'pool', None) is not None:
+            if con.cached_results is None:
+                con.cached_results = {}
+            cache = con.cached_results.setdefault('get_totals', {})
+
+            # data_version changes when any other connection commits a change
+            # and total_changes when this one makes one.
+            version = (con.execute('PRAGMA data_version').fetchone()[0], con.total_changes)
+
+            cached = cache.get(cache_key, None)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        query = sql_get_totals.format(used_states=','.join(['?'] * len(used_states)) if len(used_states) > 0 else 'NULL')
+        r = con.execute(query, used_states).fetchone()
+        totals = InventoryTotals(
+            entries=r[0],
+            owned=r[1],
+            wishlisted=r[2],
+            in_use=r[3],
+            free=r[4]
         )
 
-        # check if the face is new
-        if not any(f.index == scryfall_face.index for f in scryfall_data.faces):
-            scryfall_data.faces.append(scryfall_face)
-            unique_scryfall_data[scryfall_id] = scryfall_data
-
+        if cache is not None:
+            cache[cache_key] = (version, totals)
+    finally:
+        con.close()
 
-        if r[19] is not None:
-            card = unique_cards[r[0]][1]
+    return totals
 
-            if not any(u.deck_id == r[19] for u in card.usage):
-                card.usage.append(Usage(
-                    count=r[17],
-                    wishlist_count=r[18],
-                    deck_id=r[19],
-                    deck_name=r[20],
-                    deck_state=r[21]
-                ))
 
-                unique_cards[card.id] = (unique_cards[card.id][0], card)
-        
-    con.close()
+def diff_import(db_filename: str, cards: list[Card]) -> tuple[list[Card], list[Tuple[Card, CardWithUsage]], int]:
+    """
+    Compare cards being imported against the inventory without loading the
+    inventory. The cards are bulk-loaded into a temporary staging table and
+    matched against inventory in SQL; a card matches an inventory entry if it
+    is the same print and instance of a card, comparing text fields without
+    regard to case. If several entries match, the one with the lowest ID is
+    used.
+
+    Returns the cards that match nothing, a (card, existing) pair for each card
+    whose match has a different count or scryfall ID, and the number of cards
+    whose match has no differences. Both lists are in the order the cards were
+    given in.
+    """
+    staging_data = list()
+    for idx, c in enumerate(cards):
+        staging_row = (
+            idx,
+            c.count,
+            c.edition.upper(),
+            c.tcg_num,
+            c.foil,
+            c.signed,
+            c.artist_proof,
+            c.altered_art,
+            c.misprint,
+            c.promo,
+            c.textless,
+            c.printing_id,
+            c.scryfall_id,
+            c.name.lower(),
+            c.condition.lower(),
+            c.language.lower(),
+            c.printing_note.lower()
+        )
+        staging_data.append(staging_row)
 
-    # sort on order.
-    card_rows = [x for x in unique_cards.values()]
-    card_rows.sort(key=lambda x: x[0])
-    card_rows = [x[1] for x in card_rows]
+    con = util.connect(db_filename)
+    cur = con.cursor()
 
-    # paste on the scryfall data
-    rows = []
-    for r in card_rows:
-        rows.append((r, unique_scryfall_data[r.scryfall_id]))
-    
-    return rows
+    try:
+        cur.execute(sql_create_import_staging)
+        cur.execute(sql_create_import_matches)
+        cur.executemany(sql_insert_import_staging, staging_data)
+        cur.execute(sql_normalize_import_staging_editions)
+        cur.execute(sql_match_import_staging)
 
+        new_cards = [cards[r[0]] for r in cur.execute(sql_get_unmatched_import_staging)]
 
+        matched_count = cur.execute(sql_count_import_matches).fetchone()[0]
 
-def get_all_without_scryfall_data(db_filename: str, days: int=DEFAULT_EXPIRE_DAYS) -> list[CardWithUsage]:
-    con = util.connect(db_filename)
-    cur = con.cursor()
+        changed: dict[int, CardWithUsage] = {}
+        for r in cur.execute(sql_get_changed_import_matches):
+            row_num = r[22]
+            if row_num not in changed:
+                changed[row_num] = CardWithUsage(util.card_row_to_card(r))
 
-    unique_cards: dict[int, tuple[int, CardWithUsage]] = {}  # int in tuple is for ordering
-    order = 0
-    
-    # TODO: rly need to encapsulate this in a function it is repeated several
-    # times glub 38O
-    for r in cur.execute(sql_get_all_cards_without_scryfall_data, (f'-{days} days',)):
-        if r[0] not in unique_cards:
-            card = CardWithUsage(util.card_row_to_card(r))
-            new_entry = (order, card)
-            unique_cards[card.id] = new_entry
-            order += 1
-        
             if r[19] is not None:
-                card = unique_cards[r[0]][1]
-                card.usage.append(Usage(
+                changed[row_num].usage.append(Usage(
                     count=r[17],
                     wishlist_count=r[18],
                     deck_id=r[19],
                     deck_name=r[20],
                     deck_state=r[21]
                 ))
+    finally:
+        cur.execute(sql_drop_import_matches)
+        cur.execute(sql_drop_import_staging)
+        con.commit()
+        con.close()
 
-                unique_cards[card.id] = (unique_cards[card.id][0], card)
-        
-    con.close()
-
-    # sort on order.
-    rows = [x for x in unique_cards.values()]
-    rows.sort(key=lambda x: x[0])
-    rows = [x[1] for x in rows]
+    changed_pairs = [(cards[row_num], existing) for row_num, existing in sorted(changed.items())]
+    unchanged_count = matched_count - len(changed_pairs)
 
-    return rows
+    return new_cards, changed_pairs, unchanged_count
 
 
 def get_id_by_reverse_search(db_filename: str, name: str, edition: str, tcg_num: int, condition: str, language: str, foil: bool, signed: bool, artist_proof: bool, altered_art: bool, misprint: bool, promo: bool, textless: bool, printing_id: int, printing_note: str):
@@ -164,7 +296,14 @@ def get_id_by_reverse_search(db_filename: str, name: str, edition: str, tcg_num:
     
     matching_ids = list()
     
-    for r in cur.execute(sql_reverse_search, (name, edition, tcg_num, condition, language, foil, signed, artist_proof, altered_art, misprint, promo, textless, printing_id, printing_note)):
+    query = sql_reverse_search
+    name_match = name
+    phrase = filters.fts_phrase(name)
+    if phrase is not None and schema.has_search_index(db_filename):
+        query = sql_reverse_search_indexed
+        name_match = phrase
+
+    for r in cur.execute(query, (name_match, edition, tcg_num, condition, language, foil, signed, artist_proof, altered_art, misprint, promo, textless, printing_id, printing_note)):
         matching_ids.append(r[0])
 
     con.close()
@@ -177,37 +316,10 @@ def get_id_by_reverse_search(db_filename: str, name: str, edition: str, tcg_num:
 
 def get_one(db_filename: str, cid: int) -> CardWithUsage:
     con = util.connect(db_filename)
-    cur = con.cursor()
-    
-    query = sql_find_card_by_id_in_use
-    unique_cards: dict[int, tuple[CardWithUsage, int]] = {}  # int in tuple is for ordering
-    order = 0
-    
-    rows = []
-    for r in cur.execute(query, (cid,)):
-        if r[0] not in unique_cards:
-            card = CardWithUsage(util.card_row_to_card(r))
-            new_entry = (card, order)
-            unique_cards[card.id] = new_entry
-            order += 1
-
-        if r[19] is not None:
-            card = unique_cards[r[0]][0]
-            card.usage.append(Usage(
-                count=r[17],
-                wishlist_count=r[18],
-                deck_id=r[19],
-                deck_name=r[20],
-                deck_state=r[21]
-            ))
-
-            unique_cards[card.id] = (card, unique_cards[card.id][1])
-    con.close()
-
-    # sort on order.
-    rows = [x for x in unique_cards.values()]
-    rows.sort(key=lambda x: x[1])
-    rows = [x[0] for x in rows]
+    try:
+        rows = [card for card, _ in _group_card_rows(con.execute(sql_find_card_by_id_in_use, (cid,)))]
+    finally:
+        con.close()
 
     count = len(rows)        
     if count < 1:
@@ -220,76 +332,167 @@ def get_one(db_filename: str, cid: int) -> CardWithUsage:
     return rows[0]
 
 
-def find(db_filename: str, name: str | None, card_num: str | None, edition: str | None, types: list[str] | None=None) -> list[CardWithUsage]:
-    query = sql_select_in_use
-    params = list()
+def get_many(db_filename: str, ids: Iterable[int]) -> dict[int, CardWithUsage]:
+    """
+    Return every given card along with its usage, keyed by card ID. IDs that
+    are not in the inventory are left out of the returned dict. The lookup
+    takes one query per MAX_IN_PARAMS IDs no matter how many are given.
+    """
+    ids = list(dict.fromkeys(ids))
+
+    cards: dict[int, CardWithUsage] = {}
+    con = util.connect(db_filename)
+    try:
+        for chunk in util.chunked(ids):
+            query = sql_select_in_use + " WHERE c.id IN ({:s})".format(util.in_params(len(chunk))) + sql_order_by_card_id
+            for card, _ in _group_card_rows(con.execute(query, chunk)):
+                cards[card.id] = card
+    finally:
+        con.close()
+
+    return cards
+
+
+def find(db_filename: str, name: str | None, card_num: str | None, edition: str | None, types: list[str] | None=None, catalog: dict[str, str] | None=None) -> list[CardWithUsage]:
+    return list(iter_find(db_filename, name, card_num, edition, types, catalog))
+
+
+def iter_find(db_filename: str, name: str | None, card_num: str | None, edition: str | None, types: list[str] | None=None, catalog: dict[str, str] | None=None) -> Iterator[CardWithUsage]:
+    """
+    Yield each card in the inventory that matches the given filters, in order
+    of ID. catalog is the active filters of a card catalog; see
+    filters.card_catalog for the ones supported.
+    """
+    where_clause, params = _find_inventory_clause(db_filename, name, card_num, edition, types, catalog)
+    query = sql_select_in_use + where_clause + sql_order_by_card_id
+    
+    con = util.connect(db_filename)
+    try:
+        for card, _ in _group_card_rows(con.execute(query, params)):
+            yield card
+    finally:
+        con.close()
+
+
+def find_page(db_filename: str, name: str | None, card_num: str | None, edition: str | None, types: list[str] | None=None, catalog: dict[str, str] | None=None, per_page: int=0, after: Tuple[str, int, int] | None=None) -> Tuple[list[CardWithUsage], int]:
+    """
+    Return one page of the cards in the inventory that match the given filters,
+    in order of edition, then TCG number, then ID, along with the total number
+    of cards that match. after gives the page_cursor() of the last card on the
+    previous page, or None for the first page. If per_page is 0, every card
+    after the cursor is returned.
+
+    The start of the page is found with the edition/TCG number index rather
+    than by skipping over all the cards before it, so any page of even a very
+    large inventory is quick to get.
+    """
+    where_clause, params = _find_inventory_clause(db_filename, name, card_num, edition, types, catalog)
+
+    con = util.connect(db_filename)
+    try:
+        total = con.execute(sql_count_inventory + where_clause, params).fetchone()[0]
+
+        page_clause = where_clause
+        page_params = list(params)
+        if after is not None:
+            page_clause += (" AND" if page_clause != '' else " WHERE") + " (c.edition, c.tcg_num, c.id) > (?, ?, ?)"
+            page_params.extend(after)
+        page_params.append(per_page if per_page > 0 else -1)
+
+        query = sql_select_page_in_use.format(where=page_clause)
+        cards = [card for card, _ in _group_card_rows(con.execute(query, page_params))]
+    finally:
+        con.close()
+
+    return cards, total
+
+
+def page_cursor(card: Card) -> Tuple[str, int, int]:
+    """
+    Return the cursor that find_page() takes to get the cards after the given
+    one.
+    """
+    return (card.edition, card.tcg_num, card.id)
+
+
+def _find_inventory_clause(db_filename: str, name: str | None, card_num: str | None, edition: str | None, types: list[str] | None, catalog: dict[str, str] | None) -> Tuple[str, list]:
     ed_codes = None
     if edition is not None:
-        # we need to look up editions first or we are going to need to do a dynamically built
-        # join and i dont want to
-        matching_editions = editiondb.find(db_filename, edition)
-        
-        # match on any partial matches and get the codes
-        ed_codes = []
-        for ed in matching_editions:
-            ed_codes.append(ed.code)
+        # we need to look up editions first or we are going to need to do a
+        # dynamically built join and i dont want to
+        ed_codes = [ed.code for ed in editiondb.find(db_filename, edition)]
+
+    name_index = False
+    if name is not None or (catalog is not None and 'name' in (k.lower() for k in catalog)):
+        name_index = schema.has_search_index(db_filename)
 
-    has_scryfall_filters = types is not None
-    has_inven_filters = name is not None or card_num is not None or ed_codes is not None
+    conds = []
+    params = []
+
+    if name is not None or card_num is not None or ed_codes is not None:
+        inven_clause, inven_params = filters.card(name, card_num, ed_codes, include_where=False, name_index=name_index)
+        conds.append(inven_clause)
+        params.extend(inven_params)
 
-    # normalize types so they match title case
     if types is not None:
-        types = [t.title() for t in types]
+        # normalize types so they match title case
+        types_clause, types_params = filters.card_has_types([t.title() for t in types], card_table_alias='c')
+        if types_clause != '':
+            conds.append(types_clause)
+            params.extend(types_params)
 
-    # if there are scryfall-requiring filters, we need to join on scryfall data
-    if has_scryfall_filters:
-        query += filters.card_scryfall_data_joins(types, card_table_alias='c', create_alias_scryfall_types='st')
+    catalog_clause, catalog_params = filters.card_catalog(catalog, card_table_alias='c', name_index=name_index)
+    if catalog_clause != '':
+        conds.append(catalog_clause)
+        params.extend(catalog_params)
 
-    filter_clause, filter_params = filters.card_scryfall_data(types, lead='WHERE', scryfall_types_alias='st')
-    
-    if has_inven_filters:
-        if has_scryfall_filters:
-            filter_clause += " AND "
-        inven_filter_clause, inven_filter_params = filters.card(name, card_num, ed_codes, include_where=not has_scryfall_filters)
-        filter_clause += inven_filter_clause
-        filter_params += inven_filter_params
-    
-    if has_scryfall_filters or has_inven_filters:
-        query += filter_clause
-        params += filter_params
-    
-    con = util.connect(db_filename)
-    cur = con.cursor()
+    if len(conds) < 1:
+        return "", []
+    return " WHERE" + " AND".join(conds), params
 
-    unique_cards: dict[int, tuple[CardWithUsage, int]] = {}  # int in tuple is for ordering
-    order = 0
-    for r in cur.execute(query, params):
-        if r[0] not in unique_cards:
-            card = CardWithUsage(util.card_row_to_card(r))
-            new_entry = (card, order)
-            unique_cards[card.id] = new_entry
-            order += 1
 
-        if r[19] is not None:
-            card = unique_cards[r[0]][0]
-            card.usage.append(Usage(
-                count=r[17],
-                wishlist_count=r[18],
-                deck_id=r[19],
-                deck_name=r[20],
-                deck_state=r[21]
-            ))
+def search(db_filename: str, text: str, limit: int=50) -> list[Tuple[CardWithUsage, float]]:
+    """
+    Search the inventory using the full-text index and return the matching
+    cards along with their score, best match first. A card matches if every
+    term in text is found in its name, in the name, type line, or oracle text
+    of one of its faces in the stored scryfall data, or in the name of its
+    edition. Terms match anywhere in a word, but must be at least three
+    characters long; shorter ones are ignored. If limit is 0, every match is
+    returned.
+
+    Scores are relative to the other results of the same search only; higher
+    is better. Matches on the card's own name score above those on its text or
+    edition.
+    """
+    match_expr = _fts_query(text)
+    if match_expr is None:
+        return []
 
-            unique_cards[card.id] = (card, unique_cards[card.id][1])
+    params = {'match': match_expr, 'limit': limit if limit > 0 else -1}
 
-    con.close()
+    con = util.connect(db_filename)
+    try:
+        results = []
+        for card, rows in _group_card_rows(con.execute(sql_search_cards, params)):
+            results.append((card, -rows[0][22]))
+    except sqlite3.OperationalError as e:
+        if 'no such table' in str(e).lower():
+            raise DBError("DB has no search index; run migrate-db to add it (needs SQLite 3.34.0 or later)")
+        raise
+    finally:
+        con.close()
+
+    return results
 
-    # sort on order.
-    data_set = [x for x in unique_cards.values()]
-    data_set.sort(key=lambda x: x[1])
-    data_set = [x[0] for x in data_set]
 
-    return data_set
+def _fts_query(text: str) -> str | None:
+    # the trigram index cannot match anything shorter than three characters,
+    # and quoting each term keeps FTS5 from reading them as query syntax.
+    terms = [t for t in text.split() if len(t) >= 3]
+    if len(terms) < 1:
+        return None
+    return ' '.join('"' + t.replace('"', '""') + '"' for t in terms)
 
 
 def insert_multiple(db_filename: str, cards: list[Card]):
@@ -464,7 +667,7 @@ def delete(db_filename: str, cid: int):
     cur.execute('DELETE FROM inventory WHERE id = ?', (cid,))
     con.commit()
 
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("no card with ID {!r} exists".format(cid))
     
     con.close()
@@ -538,6 +741,26 @@ FROM inventory WHERE
     printing_note LIKE '%' || ? || '%';
 '''
 
+sql_reverse_search_indexed = '''
+SELECT
+    id
+FROM inventory WHERE
+    id IN (SELECT rowid FROM inventory_fts WHERE inventory_fts MATCH ?) AND
+    edition = ? AND
+    tcg_num = ? AND
+    condition = ? AND
+    language LIKE '%' || ? || '%' AND
+    foil = ? AND
+    signed = ? AND
+    artist_proof = ? AND
+    altered_art = ? AND
+    misprint = ? AND
+    promo = ? AND
+    textless = ? AND
+    printing_id = ? AND
+    printing_note LIKE '%' || ? || '%';
+'''
+
 sql_find_card_by_id_in_use = '''
 SELECT
     c.id,
@@ -600,8 +823,7 @@ LEFT OUTER JOIN deck_cards as dc ON dc.card = c.id
 LEFT OUTER JOIN decks as d ON dc.deck = d.id
 '''
 
-    
-sql_get_all_cards = '''
+sql_select_page_in_use = '''
 SELECT
     c.id,
     c.count,
@@ -625,14 +847,48 @@ SELECT
     d.id AS deck_id,
     d.name AS deck_name,
     d.state AS deck_state
-FROM 
-    inventory as c
+FROM
+    (
+        SELECT * FROM inventory AS c{where}
+        ORDER BY c.edition, c.tcg_num, c.id
+        LIMIT ?
+    ) AS c
 LEFT OUTER JOIN deck_cards as dc ON dc.card = c.id
-LEFT OUTER JOIN decks as d ON dc.deck = d.id;
+LEFT OUTER JOIN decks as d ON dc.deck = d.id
+ORDER BY c.edition, c.tcg_num, c.id
 '''
 
-
-sql_get_all_cards_with_scryfall_data = '''
+# bm25() gives lower (more negative) scores to better matches. Each source of
+# matches is weighted so that hits on a card's own name come first.
+sql_search_cards = '''
+WITH hits (card_id, score) AS (
+    SELECT m.rowid, bm25(inventory_fts)
+    FROM inventory_fts AS m
+    WHERE inventory_fts MATCH :match
+    UNION ALL
+    SELECT c.id, m.score
+    FROM (
+        SELECT rowid AS face_id, bm25(scryfall_faces_fts, 0.8, 0.4, 0.2) AS score
+        FROM scryfall_faces_fts
+        WHERE scryfall_faces_fts MATCH :match
+    ) AS m
+    INNER JOIN scryfall_faces AS sf ON sf.id = m.face_id
+    INNER JOIN inventory AS c ON c.scryfall_id = sf.scryfall_id
+    UNION ALL
+    SELECT c.id, m.score
+    FROM (
+        SELECT code AS edition_code, bm25(editions_fts) * 0.1 AS score
+        FROM editions_fts
+        WHERE editions_fts MATCH :match
+    ) AS m
+    INNER JOIN inventory AS c ON c.edition = m.edition_code
+),
+ranked (card_id, score) AS (
+    SELECT card_id, MIN(score) FROM hits
+    GROUP BY card_id
+    ORDER BY MIN(score), card_id
+    LIMIT :limit
+)
 SELECT
     c.id,
     c.count,
@@ -656,9 +912,113 @@ SELECT
     d.id AS deck_id,
     d.name AS deck_name,
     d.state AS deck_state,
+    r.score
+FROM ranked AS r
+INNER JOIN inventory AS c ON c.id = r.card_id
+LEFT OUTER JOIN deck_cards as dc ON dc.card = c.id
+LEFT OUTER JOIN decks as d ON dc.deck = d.id
+ORDER BY r.score, c.id
+'''
+
+sql_count_inventory = '''
+SELECT COUNT(*) FROM inventory AS c
+'''
+
+sql_order_by_card_id = '''
+ORDER BY c.id
+'''
+
+    
+sql_get_all_cards = '''
+SELECT
+    c.id,
+    c.count,
+    c.name,
+    c.edition,
+    c.tcg_num,
+    c.condition,
+    c.language,
+    c.foil,
+    c.signed,
+    c.artist_proof,
+    c.altered_art,
+    c.misprint,
+    c.promo,
+    c.textless,
+    c.printing_id,
+    c.printing_note,
+    c.scryfall_id,
+    dc.count AS count_in_deck,
+    dc.wishlist_count AS wishlist_count_in_deck,
+    d.id AS deck_id,
+    d.name AS deck_name,
+    d.state AS deck_state
+FROM 
+    inventory as c
+LEFT OUTER JOIN deck_cards as dc ON dc.card = c.id
+LEFT OUTER JOIN decks as d ON dc.deck = d.id
+ORDER BY c.id;
+'''
+
+
+sql_get_cards_with_scryfall_data = '''
+SELECT
+    c.id,
+    c.count,
+    c.name,
+    c.edition,
+    c.tcg_num,
+    c.condition,
+    c.language,
+    c.foil,
+    c.signed,
+    c.artist_proof,
+    c.altered_art,
+    c.misprint,
+    c.promo,
+    c.textless,
+    c.printing_id,
+    c.printing_note,
+    c.scryfall_id
+FROM 
+    inventory as c
+INNER JOIN scryfall AS s ON s.id = c.scryfall_id
+ORDER BY c.id
+'''
+
+
+sql_get_usage_of_cards_with_scryfall_data = '''
+SELECT
+    dc.card,
+    dc.count,
+    dc.wishlist_count,
+    d.id,
+    d.name,
+    d.state
+FROM
+    deck_cards AS dc
+INNER JOIN decks AS d ON dc.deck = d.id
+INNER JOIN inventory AS c ON dc.card = c.id
+INNER JOIN scryfall AS s ON s.id = c.scryfall_id
+ORDER BY dc.card, d.id
+'''
+
+
+sql_get_inventory_scryfall_data = '''
+SELECT
+    s.id,
     s.rarity,
     s.web_uri,
-    s.updated_at,
+    s.updated_at
+FROM
+    scryfall AS s
+WHERE s.id IN (SELECT scryfall_id FROM inventory)
+'''
+
+
+sql_get_faces_of_inventory_scryfall_data = '''
+SELECT
+    f.scryfall_id,
     f."index",
     f.name,
     f.cost,
@@ -666,12 +1026,9 @@ SELECT
     f.power,
     f.toughness,
     f.text
-FROM 
-    inventory as c
-LEFT OUTER JOIN deck_cards as dc ON dc.card = c.id
-LEFT OUTER JOIN decks as d ON dc.deck = d.id
-INNER JOIN scryfall AS s ON s.id = c.scryfall_id
-LEFT OUTER JOIN scryfall_faces AS f ON f.scryfall_id = s.id
+FROM
+    scryfall_faces AS f
+WHERE f.scryfall_id IN (SELECT scryfall_id FROM inventory)
 '''
 
 
@@ -706,6 +1063,220 @@ LEFT OUTER JOIN deck_cards as dc ON dc.card = c.id
 LEFT OUTER JOIN decks as d ON dc.deck = d.id
 LEFT OUTER JOIN scryfall AS s ON s.id = c.scryfall_id
 WHERE c.scryfall_id IS NULL OR s.updated_at IS NULL OR DATETIME(s.updated_at) < DATETIME('now', ?)
+ORDER BY c.id
+'''
+
+
+sql_get_page_cards_without_scryfall_data = '''
+SELECT
+    c.id,
+    c.count,
+    c.name,
+    c.edition,
+    c.tcg_num,
+    c.condition,
+    c.language,
+    c.foil,
+    c.signed,
+    c.artist_proof,
+    c.altered_art,
+    c.misprint,
+    c.promo,
+    c.textless,
+    c.printing_id,
+    c.printing_note,
+    c.scryfall_id,
+    dc.count AS count_in_deck,
+    dc.wishlist_count AS wishlist_count_in_deck,
+    d.id AS deck_id,
+    d.name AS deck_name,
+    d.state AS deck_state
+FROM
+    (
+        SELECT c.* FROM inventory AS c
+        LEFT OUTER JOIN scryfall AS s ON s.id = c.scryfall_id
+        WHERE c.id > ? AND (c.scryfall_id IS NULL OR s.updated_at IS NULL OR DATETIME(s.updated_at) < DATETIME('now', ?))
+        ORDER BY c.id
+        LIMIT ?
+    ) AS c
+LEFT OUTER JOIN deck_cards as dc ON dc.card = c.id
+LEFT OUTER JOIN decks as d ON dc.deck = d.id
+ORDER BY c.id
+'''
+
+
+sql_count_cards_without_scryfall_data = '''
+SELECT COUNT(*)
+FROM
+    inventory as c
+LEFT OUTER JOIN scryfall AS s ON s.id = c.scryfall_id
+WHERE c.scryfall_id IS NULL OR s.updated_at IS NULL OR DATETIME(s.updated_at) < DATETIME('now', ?)
+'''
+
+
+sql_create_import_staging = '''
+CREATE TEMP TABLE import_staging (
+    "row_num"            INTEGER NOT NULL,
+    "count"              INTEGER NOT NULL,
+    "edition"            TEXT NOT NULL,
+    "tcg_num"            INTEGER NOT NULL,
+    "foil"               INTEGER NOT NULL,
+    "signed"             INTEGER NOT NULL,
+    "artist_proof"       INTEGER NOT NULL,
+    "altered_art"        INTEGER NOT NULL,
+    "misprint"           INTEGER NOT NULL,
+    "promo"              INTEGER NOT NULL,
+    "textless"           INTEGER NOT NULL,
+    "printing_id"        INTEGER NOT NULL,
+    "scryfall_id"        TEXT,
+    "name_key"           TEXT NOT NULL,
+    "condition_key"      TEXT NOT NULL,
+    "language_key"       TEXT NOT NULL,
+    "printing_note_key"  TEXT NOT NULL,
+    PRIMARY KEY("row_num")
+);
+'''
+
+sql_drop_import_staging = '''
+DROP TABLE IF EXISTS temp.import_staging;
+'''
+
+sql_insert_import_staging = '''
+INSERT INTO temp.import_staging (
+    row_num,
+    count,
+    edition,
+    tcg_num,
+    foil,
+    signed,
+    artist_proof,
+    altered_art,
+    misprint,
+    promo,
+    textless,
+    printing_id,
+    scryfall_id,
+    name_key,
+    condition_key,
+    language_key,
+    printing_note_key
+)
+VALUES
+    (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+'''
+
+# inventory editions are stored as the code of their row in editions, so the
+# staged ones are given that same case; the match can then join on them as-is
+# and use the index on inventory's edition and tcg_num.
+sql_normalize_import_staging_editions = '''
+UPDATE temp.import_staging
+SET edition = (SELECT e.code FROM editions AS e WHERE e.code = import_staging.edition COLLATE NOCASE)
+WHERE EXISTS (SELECT 1 FROM editions AS e WHERE e.code = import_staging.edition COLLATE NOCASE);
+'''
+
+sql_create_import_matches = '''
+CREATE TEMP TABLE import_matches (
+    "row_num"    INTEGER NOT NULL,
+    "card_id"    INTEGER NOT NULL,
+    PRIMARY KEY("row_num")
+);
+'''
+
+sql_drop_import_matches = '''
+DROP TABLE IF EXISTS temp.import_matches;
+'''
+
+sql_match_import_staging = '''
+INSERT INTO temp.import_matches (row_num, card_id)
+SELECT
+    s.row_num,
+    MIN(c.id)
+FROM temp.import_staging AS s
+INNER JOIN inventory AS c ON c.edition = s.edition AND c.tcg_num = s.tcg_num
+WHERE
+    c.foil = s.foil AND
+    c.signed = s.signed AND
+    c.artist_proof = s.artist_proof AND
+    c.altered_art = s.altered_art AND
+    c.misprint = s.misprint AND
+    c.promo = s.promo AND
+    c.textless = s.textless AND
+    c.printing_id = s.printing_id AND
+    py_lower(c.name) = s.name_key AND
+    py_lower(c.condition) = s.condition_key AND
+    py_lower(c.language) = s.language_key AND
+    py_lower(c.printing_note) = s.printing_note_key
+GROUP BY s.row_num;
+'''
+
+sql_get_unmatched_import_staging = '''
+SELECT
+    s.row_num
+FROM temp.import_staging AS s
+LEFT OUTER JOIN temp.import_matches AS m ON m.row_num = s.row_num
+WHERE m.row_num IS NULL
+ORDER BY s.row_num;
+'''
+
+sql_count_import_matches = '''
+SELECT COUNT(*) FROM temp.import_matches;
+'''
+
+sql_get_changed_import_matches = '''
+SELECT
+    c.id,
+    c.count,
+    c.name,
+    c.edition,
+    c.tcg_num,
+    c.condition,
+    c.language,
+    c.foil,
+    c.signed,
+    c.artist_proof,
+    c.altered_art,
+    c.misprint,
+    c.promo,
+    c.textless,
+    c.printing_id,
+    c.printing_note,
+    c.scryfall_id,
+    dc.count AS count_in_deck,
+    dc.wishlist_count AS wishlist_count_in_deck,
+    d.id AS deck_id,
+    d.name AS deck_name,
+    d.state AS deck_state,
+    m.row_num
+FROM temp.import_matches AS m
+INNER JOIN temp.import_staging AS s ON s.row_num = m.row_num
+INNER JOIN inventory AS c ON c.id = m.card_id
+LEFT OUTER JOIN deck_cards AS dc ON dc.card = c.id
+LEFT OUTER JOIN decks AS d ON dc.deck = d.id
+WHERE
+    c.count != s.count OR
+    (s.scryfall_id IS NOT NULL AND (c.scryfall_id IS NULL OR c.scryfall_id = '' OR c.scryfall_id != s.scryfall_id))
+ORDER BY m.row_num;
+'''
+
+
+sql_get_totals = '''
+SELECT
+    COUNT(c.id),
+    IFNULL(SUM(c.count), 0),
+    IFNULL(SUM(u.wishlist_count), 0),
+    IFNULL(SUM(u.used_count), 0),
+    IFNULL(SUM(MAX(c.count - IFNULL(u.used_count, 0), 0)), 0)
+FROM
+    inventory AS c
+LEFT OUTER JOIN (
+    SELECT
+        dc.card AS card,
+        SUM(dc.wishlist_count) AS wishlist_count,
+        SUM(CASE WHEN d.state IN ({used_states}) THEN dc.count ELSE 0 END) AS used_count
+    FROM deck_cards AS dc
+    INNER JOIN decks AS d ON d.id = dc.deck
+    GROUP BY dc.card
+) AS u ON u.card = c.id;
 '''
 
 
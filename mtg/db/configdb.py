@@ -29,6 +29,13 @@ def set(db_filename: str, key: str, value: any) -> str:
     key_info = key_records[0]
     key_type = key_info[1]
 
+    if key_info[0] in util.connection_setting_defaults:
+        try:
+            value = util.check_connection_setting(key_info[0], value)
+        except ValueError:
+            con.close()
+            raise
+
     def convert(value: any, type_str: str):
         type_str = type_str.upper()
 
@@ -55,7 +62,7 @@ def set(db_filename: str, key: str, value: any) -> str:
     cur.execute(sql_set, (convert(value, key_type), key))
     con.commit()
 
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         con.close()
         raise NotFoundError("no config key with name {!r} exists".format(key))
 
@@ -80,30 +87,50 @@ def get(db_filename: str, key: str) -> any:
     t = records[0][0]
     v = records[0][1]
 
-    def convert(value: any, type_str: str):
-        type_str = type_str.upper()
+    v = _convert_from_db(v, t)
+    return v
 
-        if type_str == 'STR':
-            return str(value)
-        elif type_str == 'INT':
-            return int(value)
-        elif type_str == 'FLOAT':
-            return float(value)
-        elif type_str == 'BOOL':
-            return value.upper() == 'TRUE' or value.upper() == 'T' or value == '1'
-        elif type_str.startswith("COMMA-LIST"):
-            raw_vals = value.split(",")
-            sub_type = type_str[len("COMMA-LIST-"):]
-            vals = []
-            for rv in raw_vals:
-                vals.append(convert(rv, sub_type))
-            return vals
-        else:
-            raise ValueError("Unknown type string {!r}".format(type_str))
 
-    v = convert(v, t)
-    return v
+def get_all(db_filename: str) -> list[tuple[str, str, any, str]]:
+    """
+    Return every config key as a tuple of its name, type, value, and
+    description, ordered by name.
+    """
+    con = util.connect(db_filename)
+    cur = con.cursor()
 
+    records = []
+    for r in cur.execute(sql_get_all):
+        records.append((r[0], r[1], _convert_from_db(r[2], r[1]), r[3]))
+
+    con.close()
+
+    return records
+
+
+def _convert_from_db(value: any, type_str: str):
+    type_str = type_str.upper()
+
+    if value is None:
+        return None
+
+    if type_str == 'STR':
+        return str(value)
+    elif type_str == 'INT':
+        return int(value)
+    elif type_str == 'FLOAT':
+        return float(value)
+    elif type_str == 'BOOL':
+        return value.upper() == 'TRUE' or value.upper() == 'T' or value == '1'
+    elif type_str.startswith("COMMA-LIST"):
+        raw_vals = value.split(",")
+        sub_type = type_str[len("COMMA-LIST-"):]
+        vals = []
+        for rv in raw_vals:
+            vals.append(_convert_from_db(rv, sub_type))
+        return vals
+    else:
+        raise ValueError("Unknown type string {!r}".format(type_str))
 
 sql_set = '''
 UPDATE config SET value = ? WHERE key LIKE ?;
@@ -115,4 +142,8 @@ SELECT type, value FROM config WHERE key LIKE ?;
 
 sql_get_key = '''
 SELECT key, type, description FROM config WHERE key LIKE ?;
-'''
\ No newline at end of file
+'''
+
+sql_get_all = '''
+SELECT key, type, value, description FROM config ORDER BY key;
+'''
@@ -3,7 +3,7 @@ import sqlite3
 from typing import Optional
 
 from .errors import MultipleFoundError, NotFoundError, AlreadyExistsError
-from . import util, filters, editiondb
+from . import util, filters, editiondb, schema
 from ..types import Deck, DeckCard
 
 
@@ -13,7 +13,7 @@ def update_state(db_filename: str, name: str, state: str) -> str:
     cur.execute(sql_update_state, (state, name))
     con.commit()
     
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("no deck called {!r} exists".format(name))
     
     con.close()
@@ -33,7 +33,7 @@ def update_name(db_filename: str, name: str, new_name: str):
         con.close()
         raise AlreadyExistsError("A deck with that name already exists")
     
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("no deck called {!r} exists".format(name))
         
     con.close()
@@ -103,7 +103,7 @@ def delete_by_name(db_filename: str, name: str):
     cur.execute(sql_delete_deck_by_name, (name,))
     con.commit()
 
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         # TODO: con.close()????????
         raise NotFoundError("no deck called {!r} exists".format(name))
     
@@ -145,7 +145,12 @@ def get_one_card(db_filename: str, did: int, cid: int) -> DeckCard:
     return rows[0]
     
 
-def find_cards(db_filename: str, did: int, card_name: Optional[str], card_num: Optional[int], edition: Optional[str], types: list[str] | None=None) -> list[DeckCard]:
+def find_cards(db_filename: str, did: int, card_name: Optional[str], card_num: Optional[int], edition: Optional[str], types: list[str] | None=None, catalog: dict[str, str] | None=None) -> list[DeckCard]:
+    """
+    Return the cards in the given deck that match the given filters. catalog
+    is the active filters of a card catalog; see filters.card_catalog for the
+    ones supported.
+    """
     query = sql_get_deck_cards
     params = [did]
 
@@ -163,6 +168,10 @@ def find_cards(db_filename: str, did: int, card_name: Optional[str], card_num: O
     has_scryfall_filters = types is not None
     has_inven_filters = card_name is not None or card_num is not None or ed_codes is not None
 
+    name_index = False
+    if card_name is not None or (catalog is not None and 'name' in (k.lower() for k in catalog)):
+        name_index = schema.has_search_index(db_filename)
+
     # normalize types so they match title case
     if types is not None:
         types = [t.title() for t in types]
@@ -177,10 +186,17 @@ def find_cards(db_filename: str, did: int, card_name: Optional[str], card_num: O
     if has_inven_filters:
         if has_scryfall_filters:
             filter_clause += " AND "
-        inven_filter_clause, inven_filter_params = filters.card(card_name, card_num, ed_codes, include_where=False)
+        inven_filter_clause, inven_filter_params = filters.card(card_name, card_num, ed_codes, include_where=False, name_index=name_index)
         filter_clause += inven_filter_clause
         filter_params += inven_filter_params
 
+    catalog_clause, catalog_params = filters.card_catalog(catalog, card_table_alias='c', name_index=name_index)
+    if catalog_clause != '':
+        if filter_clause != '':
+            filter_clause += " AND"
+        filter_clause += catalog_clause
+        filter_params += catalog_params
+
     if filter_clause != '':
         query += ' AND' + filter_clause
         params += filter_params
@@ -204,7 +220,7 @@ def update_card_counts(db_filename: str, did: int, cid: int, count: int, wishlis
     cur.execute(sql_update_counts, (count, wishlist_count, cid, did))
     con.commit()
     
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("no card with that ID exists in deck")
     
     con.close()
@@ -233,7 +249,7 @@ def add_card(db_filename: str, did: int, cid: int, amount: int=1) -> int:
     
     con.commit()
     
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("tried to apply, but no changes ocurred")
     
     con.close()
@@ -262,7 +278,7 @@ def add_wishlisted_card(db_filename, did, cid, amount=1):
     
     con.commit()
     
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("tried to apply, but no changes ocurred")
     
     con.close()
@@ -296,7 +312,7 @@ def remove_wishlisted_card(db_filename, did, cid, amount=1):
         
     con.commit()
     
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("tried to apply, but no changes ocurred")
     
     con.close()
@@ -358,7 +374,7 @@ def remove_card(db_filename: str, did: int, cid: int, amount: int=1) -> int:
         
     con.commit()
     
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("tried to apply, but no changes ocurred")
     
     con.close()
@@ -377,7 +393,7 @@ def delete_card(db_filename: str, did: int, cid: int):
     cur.execute(sql_delete_deck_card, (cid, did))
     con.commit()
 
-    if con.total_changes < 1:
+    if cur.rowcount < 1:
         raise NotFoundError("no card with that ID exists in deck")
     
     con.close()
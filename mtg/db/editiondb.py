@@ -1,6 +1,8 @@
 import datetime
 
-from . import util
+from typing import Iterable
+
+from . import util, filters, schema
 from .errors import NotFoundError
 
 from ..types import Edition
@@ -28,13 +30,44 @@ def insert(db_filename: str, ed: Edition):
     con.close()
 
 
+def insert_missing(db_filename: str, eds: Iterable[Edition]) -> int:
+    """
+    Insert each of the given editions that is not already in the DB, leaving
+    existing ones as they are. Returns the number of editions inserted.
+    """
+    global _last_update
+
+    rows = [(ed.code.upper(), ed.name, ed.release_date.isoformat()) for ed in eds]
+
+    con = util.connect(db_filename)
+    cur = con.cursor()
+
+    cur.executemany(sql_insert_if_missing, rows)
+    inserted = max(cur.rowcount, 0)
+    con.commit()
+
+    if inserted > 0:
+        _last_update = datetime.datetime.now(tz=datetime.timezone.utc)
+
+    con.close()
+
+    return inserted
+
+
 def find(db_filename: str, name_filter: str='') -> list[Edition]:
     con = util.connect(db_filename)
     cur = con.cursor()
     
     data: list[Edition] = []
+
+    query = sql_find_editions
+    params = (name_filter,)
+    phrase = filters.fts_phrase(name_filter)
+    if phrase is not None and schema.has_search_index(db_filename):
+        query = sql_find_editions_indexed
+        params = (phrase,)
     
-    for r in cur.execute(sql_find_editions, (name_filter,)):
+    for r in cur.execute(query, params):
         row = Edition(code=r[0].upper(), name=r[1], release_date=datetime.date.fromisoformat(r[2]))
         data.append(row)
     
@@ -82,6 +115,11 @@ INSERT INTO editions (code, name, release_date) VALUES (?, ?, ?);
 '''
 
 
+sql_insert_if_missing = '''
+INSERT OR IGNORE INTO editions (code, name, release_date) VALUES (?, ?, ?);
+'''
+
+
 sql_get_one = '''
 SELECT code, name, release_date FROM editions WHERE code LIKE ?;
 '''
@@ -93,3 +131,7 @@ SELECT code, name, release_date FROM editions;
 sql_find_editions = '''
 SELECT code, name, release_date FROM editions WHERE name LIKE "%" || ? || "%";
 '''
+
+sql_find_editions_indexed = '''
+SELECT code, name, release_date FROM editions WHERE code IN (SELECT code FROM editions_fts WHERE editions_fts MATCH ?);
+'''
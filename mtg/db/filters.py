@@ -1,7 +1,13 @@
+import re
+
 from typing import Tuple
 
 
-def card(name=None, card_num=None, edition_codes=None, include_where=True) -> Tuple[str, list]:
+def card(name=None, card_num=None, edition_codes=None, include_where=True, name_index=False) -> Tuple[str, list]:
+    """
+    If name_index is set, the name is matched with the full-text index on
+    inventory where it can be instead of checking the name of every card.
+    """
     if name is None and card_num is None and edition_codes is None:
         return "", []
         
@@ -14,9 +20,14 @@ def card(name=None, card_num=None, edition_codes=None, include_where=True) -> Tu
     data_params = list()
     
     if name is not None:
-        clause += ' c.name LIKE "%" || ? || "%"'
+        phrase = fts_phrase(name) if name_index else None
+        if phrase is not None:
+            clause += ' c.id IN (SELECT rowid FROM inventory_fts WHERE inventory_fts MATCH ?)'
+            data_params.append(phrase)
+        else:
+            clause += ' c.name LIKE "%" || ? || "%"'
+            data_params.append(name)
         num_exprs += 1
-        data_params.append(name)
         
     if card_num is not None:
         ed = None
@@ -86,4 +97,97 @@ def card_scryfall_data(types: list[str] | None=None, lead: str='WHERE', scryfall
         num_exprs += 1
         data_params.extend(types)
     
-    return clause, data_params
\ No newline at end of file
+    return clause, data_params
+
+
+def card_has_types(types: list[str] | None=None, card_table_alias='c') -> Tuple[str, list]:
+    """
+    Return a condition (with no leading WHERE or AND) that matches cards whose
+    scryfall data has any of the given types. Unlike card_scryfall_data, this
+    does not need a join on scryfall_types, so a card with several matching
+    types still only comes up once.
+    """
+    if types is None or len(types) < 1:
+        return "", []
+    
+    clause = f" {card_table_alias}.scryfall_id IN (SELECT scryfall_id FROM scryfall_types WHERE type IN ({','.join(['?']*len(types))}))"
+    return clause, list(types)
+
+
+def card_catalog(catalog: dict[str, str] | None, card_table_alias='c', name_index: bool=False) -> Tuple[str, list]:
+    """
+    Return a condition (with no leading WHERE or AND) for the filters of a card
+    catalog, given as the dict of filter names to values that is passed to the
+    catalog's fetch function. Supported filters are:
+
+    * name - part of the card name, case-insensitive.
+    * edition - part of the edition code, case-insensitive.
+    * cardnum - part of the card number, formatted as EDN-001.
+    * in_decks - a comparison such as '>=2' against the number of decks that
+    the card is in.
+    * type - comma-separated types, of which the card must have at least one.
+
+    If name_index is set, the name filter is matched with the full-text index
+    on inventory where it can be.
+    """
+    if catalog is None or len(catalog) < 1:
+        return "", []
+
+    c = card_table_alias
+    conds = []
+    data_params = []
+
+    for k, v in catalog.items():
+        k = k.lower()
+        if k == 'name':
+            phrase = fts_phrase(v) if name_index else None
+            if phrase is not None:
+                conds.append(f" {c}.id IN (SELECT rowid FROM inventory_fts WHERE inventory_fts MATCH ?)")
+                data_params.append(phrase)
+            else:
+                conds.append(f" instr(py_lower({c}.name), py_lower(?)) > 0")
+                data_params.append(v)
+        elif k == 'edition':
+            conds.append(f" instr(py_lower({c}.edition), py_lower(?)) > 0")
+            data_params.append(v)
+        elif k == 'cardnum':
+            conds.append(f" instr({c}.edition || '-' || printf('%03d', {c}.tcg_num), ?) > 0")
+            data_params.append(v.upper())
+        elif k == 'in_decks':
+            op, num = _num_comparison(v)
+            conds.append(f" (SELECT COUNT(*) FROM deck_cards WHERE card = {c}.id) {op} ?")
+            data_params.append(num)
+        elif k == 'type':
+            types = [t.strip().title() for t in v.split(',')]
+            types_clause, types_params = card_has_types(types, card_table_alias=c)
+            if types_clause != '':
+                conds.append(types_clause)
+                data_params.extend(types_params)
+        else:
+            raise ValueError("Not a card catalog filter: {!r}".format(k))
+
+    return " AND".join(conds), data_params
+
+
+def fts_phrase(text: str) -> str | None:
+    """
+    Return the FTS5 query that matches text anywhere in a column with a trigram
+    index, the same as LIKE '%text%' does, or None if it cannot be matched that
+    way and LIKE has to be used instead. The trigram index cannot match text
+    shorter than three characters, and has no equivalent of LIKE's wildcards.
+    """
+    if len(text) < 3 or '%' in text or '_' in text:
+        return None
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _num_comparison(expr: str) -> Tuple[str, int]:
+    # no way to bind an operator, so it has to be checked against the allowed
+    # ones before it goes in the query.
+    m = re.fullmatch(r'\s*(<=|>=|!=|==|<|>|=)?\s*(\d+)\s*', expr)
+    if m is None:
+        raise ValueError("Not a numeric comparison: {!r}".format(expr))
+    op = m.group(1)
+    if op is None or op == '==':
+        op = '='
+    return op, int(m.group(2))
@@ -1,4 +1,52 @@
 import sqlite3
+import time
+
+from typing import Callable
+
+from . import util, configdb
+from .errors import NotFoundError
+from .. import elog
+
+
+# First schema version with the full-text search indexes. Migration to it is
+# skipped if SQLite lacks the trigram tokenizer, so any DB at or past it has
+# them.
+SEARCH_INDEX_VERSION = 3
+
+
+class Migration:
+    """
+    Migration is a single versioned step in upgrading the schema of a DB. Every
+    statement in it must be safe to run against a DB that already has it
+    applied, so that a step can be re-run to repair a DB.
+
+    If the step needs something that not every SQLite build has, check is a
+    function that is given a connection to the DB and returns the reason the
+    step cannot be applied with it, or None if it can.
+    """
+
+    def __init__(self, version: int, description: str, statements: list[str], check: Callable[[sqlite3.Connection], str | None] | None=None):
+        self.version = version
+        self.description = description
+        self.statements = statements
+        self.check = check
+
+    def __str__(self):
+        return "{:d}: {:s}".format(self.version, self.description)
+
+
+class MigrationResult:
+    """
+    MigrationResult is a POD class for the outcome of applying a Migration.
+    """
+
+    def __init__(self, version: int, description: str, seconds: float):
+        self.version = version
+        self.description = description
+        self.seconds = seconds
+
+    def __str__(self):
+        return "{:d}: {:s} ({:.3f}s)".format(self.version, self.description, self.seconds)
 
 
 def init(db_filename):
@@ -9,6 +57,9 @@ def init(db_filename):
     cur.execute(sql_enable_fks)
     
     # drop old tables
+    cur.execute(sql_drop_inventory_fts)
+    cur.execute(sql_drop_scryfall_faces_fts)
+    cur.execute(sql_drop_editions_fts)
     cur.execute(sql_drop_deck_cards)
     cur.execute(sql_drop_inventory)
     cur.execute(sql_drop_scryfall_types)
@@ -48,10 +99,274 @@ def init(db_filename):
     # commit inserted data
     con.commit()
     con.close()
+
+    # bring the new DB up to the latest schema version
+    migrate(db_filename)
     
     print("Set up new mtgdb database in {:s}".format(db_filename))
 
 
+def get_version(db_filename: str) -> int:
+    """
+    Return the schema version of the DB. DBs created before schema versions were
+    tracked are version 0.
+    """
+    try:
+        return configdb.get(db_filename, 'schema_version')
+    except NotFoundError:
+        return 0
+
+
+def latest_version() -> int:
+    return migrations[-1].version
+
+
+def has_search_index(db_filename: str) -> bool:
+    """
+    Return whether the DB has the full-text search indexes, so that name
+    lookups can use them instead of scanning every row with LIKE.
+    """
+    return get_version(db_filename) >= SEARCH_INDEX_VERSION
+
+
+def migrate(db_filename: str, rerun: bool=False, log: elog.Logger | None=None) -> list[MigrationResult]:
+    """
+    Upgrade the DB in place by applying each migration newer than its current
+    schema version, in order. Each migration is applied in its own transaction
+    along with the update to the recorded version, so an upgrade that fails
+    part way leaves the DB at the last version that completed.
+
+    If rerun is True, every migration is applied regardless of the current
+    version. This is safe as migrations are re-runnable.
+
+    If a migration cannot be applied with the SQLite library in use, a warning
+    is logged and migration stops there, leaving the DB at the version before
+    it; later migrations may depend on it, so they are not applied either.
+
+    Returns the results of the applied migrations, which will be empty if the DB
+    was already up to date.
+    """
+    if log is None:
+        log = elog.get(__name__)
+
+    current = get_version(db_filename)
+    results = list()
+
+    for m in migrations:
+        if m.version <= current and not rerun:
+            continue
+
+        if m.check is not None:
+            con = util.connect(db_filename)
+            try:
+                reason = m.check(con)
+            finally:
+                con.close()
+            if reason is not None:
+                log.warning("Cannot apply schema migration %s: %s", str(m), reason)
+                break
+
+        log.info("Applying schema migration %s...", str(m))
+        start = time.monotonic()
+
+        with util.transaction(db_filename) as con:
+            for stmt in m.statements:
+                con.execute(stmt)
+            con.execute(sql_set_schema_version, (str(max(m.version, current)),))
+
+        result = MigrationResult(m.version, m.description, time.monotonic() - start)
+        log.info("Applied schema migration %s", str(result))
+        results.append(result)
+
+    return results
+
+
+def _check_fts5_trigram(con: sqlite3.Connection) -> str | None:
+    try:
+        con.execute(sql_create_trigram_probe)
+        con.execute(sql_drop_trigram_probe)
+    except sqlite3.OperationalError as e:
+        return "SQLite {:s} does not support FTS5 with the trigram tokenizer ({!s}); SQLite 3.34.0 or later is needed".format(sqlite3.sqlite_version, e)
+    return None
+
+
+sql_create_trigram_probe = '''
+CREATE VIRTUAL TABLE temp."trigram_probe" USING fts5("text", tokenize='trigram');
+'''
+
+sql_drop_trigram_probe = '''
+DROP TABLE temp."trigram_probe";
+'''
+
+
+sql_set_schema_version = '''
+INSERT INTO "config"
+    ('key', 'type', 'value', 'description')
+VALUES
+    ('schema_version', 'int', ?, 'Version of the database schema. Updated automatically when the database is upgraded; do not change.')
+ON CONFLICT ("key") DO UPDATE SET "value" = excluded."value";
+'''
+
+
+sql_create_index_inventory_name = '''
+CREATE INDEX IF NOT EXISTS "idx_inventory_name" ON "inventory" ("name");
+'''
+
+sql_create_index_inventory_edition_tcg_num = '''
+CREATE INDEX IF NOT EXISTS "idx_inventory_edition_tcg_num" ON "inventory" ("edition", "tcg_num");
+'''
+
+sql_create_index_deck_cards_deck = '''
+CREATE INDEX IF NOT EXISTS "idx_deck_cards_deck" ON "deck_cards" ("deck");
+'''
+
+sql_create_index_scryfall_types_type = '''
+CREATE INDEX IF NOT EXISTS "idx_scryfall_types_type" ON "scryfall_types" ("type");
+'''
+
+
+sql_insert_connection_config = '''
+INSERT OR IGNORE INTO "config"
+    ('key', 'type', 'value', 'description')
+VALUES
+    ('journal_mode', 'str', 'WAL', 'SQLite journal mode; one of DELETE, TRUNCATE, PERSIST, MEMORY, WAL, or OFF. WAL lets the DB be read while another program is writing to it.'),
+    ('busy_timeout', 'int', '5000', 'Milliseconds to wait for another program to finish with the DB before giving up with a ''database is locked'' error.'),
+    ('cache_size', 'int', '-16000', 'Size of the SQLite page cache for each connection. Positive values are in pages; negative values are in KiB.'),
+    ('mmap_size', 'int', '268435456', 'Maximum bytes of the DB file to read via memory-mapping. Set to 0 to disable.'),
+    ('temp_store', 'str', 'MEMORY', 'Where SQLite keeps temporary tables and indexes; one of DEFAULT, FILE, or MEMORY.');
+'''
+
+
+
+sql_create_index_inventory_scryfall_id = '''
+CREATE INDEX IF NOT EXISTS "idx_inventory_scryfall_id" ON "inventory" ("scryfall_id");
+'''
+
+
+# The full-text indexes over inventory and scryfall_faces are external-content
+# FTS5 tables; they hold only the index and read the text itself from the table
+# they cover, by that table's INTEGER PRIMARY KEY. An implicit rowid would not
+# do, as VACUUM may renumber it and leave the index pointing at the wrong rows.
+# editions has no integer key, so its index is a regular FTS5 table that keeps
+# its own copy of the few edition names along with their codes. The trigram
+# tokenizer lets them match any substring of at least three characters as
+# well as whole words. Triggers keep each one in step with its table, and the
+# rebuild and fill statements (re)fill them from scratch so a re-run repairs
+# them.
+
+sql_drop_inventory_fts = '''
+DROP TABLE IF EXISTS "inventory_fts";
+'''
+
+sql_create_inventory_fts = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS "inventory_fts" USING fts5(
+    "name",
+    content='inventory',
+    content_rowid='id',
+    tokenize='trigram'
+);
+'''
+
+sql_create_inventory_fts_insert_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "inventory_fts_insert" AFTER INSERT ON "inventory" BEGIN
+    INSERT INTO "inventory_fts" (rowid, "name") VALUES (new."id", new."name");
+END;
+'''
+
+sql_create_inventory_fts_delete_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "inventory_fts_delete" AFTER DELETE ON "inventory" BEGIN
+    INSERT INTO "inventory_fts" ("inventory_fts", rowid, "name") VALUES ('delete', old."id", old."name");
+END;
+'''
+
+sql_create_inventory_fts_update_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "inventory_fts_update" AFTER UPDATE OF "id", "name" ON "inventory" BEGIN
+    INSERT INTO "inventory_fts" ("inventory_fts", rowid, "name") VALUES ('delete', old."id", old."name");
+    INSERT INTO "inventory_fts" (rowid, "name") VALUES (new."id", new."name");
+END;
+'''
+
+sql_rebuild_inventory_fts = '''
+INSERT INTO "inventory_fts" ("inventory_fts") VALUES ('rebuild');
+'''
+
+sql_drop_scryfall_faces_fts = '''
+DROP TABLE IF EXISTS "scryfall_faces_fts";
+'''
+
+sql_create_scryfall_faces_fts = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS "scryfall_faces_fts" USING fts5(
+    "name",
+    "type",
+    "text",
+    content='scryfall_faces',
+    content_rowid='id',
+    tokenize='trigram'
+);
+'''
+
+sql_create_scryfall_faces_fts_insert_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "scryfall_faces_fts_insert" AFTER INSERT ON "scryfall_faces" BEGIN
+    INSERT INTO "scryfall_faces_fts" (rowid, "name", "type", "text") VALUES (new."id", new."name", new."type", new."text");
+END;
+'''
+
+sql_create_scryfall_faces_fts_delete_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "scryfall_faces_fts_delete" AFTER DELETE ON "scryfall_faces" BEGIN
+    INSERT INTO "scryfall_faces_fts" ("scryfall_faces_fts", rowid, "name", "type", "text") VALUES ('delete', old."id", old."name", old."type", old."text");
+END;
+'''
+
+sql_create_scryfall_faces_fts_update_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "scryfall_faces_fts_update" AFTER UPDATE OF "id", "name", "type", "text" ON "scryfall_faces" BEGIN
+    INSERT INTO "scryfall_faces_fts" ("scryfall_faces_fts", rowid, "name", "type", "text") VALUES ('delete', old."id", old."name", old."type", old."text");
+    INSERT INTO "scryfall_faces_fts" (rowid, "name", "type", "text") VALUES (new."id", new."name", new."type", new."text");
+END;
+'''
+
+sql_rebuild_scryfall_faces_fts = '''
+INSERT INTO "scryfall_faces_fts" ("scryfall_faces_fts") VALUES ('rebuild');
+'''
+
+sql_drop_editions_fts = '''
+DROP TABLE IF EXISTS "editions_fts";
+'''
+
+sql_create_editions_fts = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS "editions_fts" USING fts5(
+    "code" UNINDEXED,
+    "name",
+    tokenize='trigram'
+);
+'''
+
+sql_create_editions_fts_insert_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "editions_fts_insert" AFTER INSERT ON "editions" BEGIN
+    INSERT INTO "editions_fts" ("code", "name") VALUES (new."code", new."name");
+END;
+'''
+
+sql_create_editions_fts_delete_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "editions_fts_delete" AFTER DELETE ON "editions" BEGIN
+    DELETE FROM "editions_fts" WHERE "code" = old."code";
+END;
+'''
+
+sql_create_editions_fts_update_trigger = '''
+CREATE TRIGGER IF NOT EXISTS "editions_fts_update" AFTER UPDATE OF "code", "name" ON "editions" BEGIN
+    DELETE FROM "editions_fts" WHERE "code" = old."code";
+    INSERT INTO "editions_fts" ("code", "name") VALUES (new."code", new."name");
+END;
+'''
+
+sql_clear_editions_fts = '''
+DELETE FROM "editions_fts";
+'''
+
+sql_fill_editions_fts = '''
+INSERT INTO "editions_fts" ("code", "name") SELECT "code", "name" FROM "editions";
+'''
+
 sql_enable_fks = '''
 PRAGMA foreign_keys = ON;
 '''
@@ -149,6 +464,43 @@ CREATE TABLE "scryfall" (
 '''
 
 
+# scryfall_faces was created keyed on its scryfall_id and index alone; it is
+# rebuilt with an INTEGER PRIMARY KEY for its search index to use.
+sql_drop_scryfall_faces_rekeyed = '''
+DROP TABLE IF EXISTS "scryfall_faces_rekeyed";
+'''
+
+sql_create_scryfall_faces_rekeyed = '''
+CREATE TABLE "scryfall_faces_rekeyed" (
+    "id"           INTEGER NOT NULL,
+    "scryfall_id"  TEXT NOT NULL,
+    "index"        INTEGER NOT NULL,
+    "name"         TEXT NOT NULL,
+    "cost"         TEXT NOT NULL,
+    "type"         TEXT NOT NULL,
+    "power"        TEXT,
+    "toughness"    TEXT,
+    "text"         TEXT,
+    FOREIGN KEY("scryfall_id") REFERENCES "scryfall"("id") ON DELETE CASCADE ON UPDATE CASCADE,
+    PRIMARY KEY ("id"),
+    UNIQUE ("scryfall_id", "index")
+)
+'''
+
+sql_fill_scryfall_faces_rekeyed = '''
+INSERT INTO "scryfall_faces_rekeyed" ("scryfall_id", "index", "name", "cost", "type", "power", "toughness", "text")
+SELECT "scryfall_id", "index", "name", "cost", "type", "power", "toughness", "text" FROM "scryfall_faces"
+ORDER BY "scryfall_id", "index";
+'''
+
+sql_drop_scryfall_faces_unkeyed = '''
+DROP TABLE "scryfall_faces";
+'''
+
+sql_rename_scryfall_faces_rekeyed = '''
+ALTER TABLE "scryfall_faces_rekeyed" RENAME TO "scryfall_faces";
+'''
+
 sql_drop_scryfall_faces = '''
 DROP TABLE IF EXISTS "scryfall_faces";
 '''
@@ -304,3 +656,43 @@ VALUES
     ('ODY', 'Odyssey', '2001-10-01'),
     ('8ED', 'Eighth Edition', '2003-07-28');
 '''
+
+
+# migrations must be kept in order of version, and versions must never be
+# reused or renumbered once released.
+migrations: list[Migration] = [
+    Migration(1, 'Add secondary indexes', [
+        sql_create_index_inventory_name,
+        sql_create_index_inventory_edition_tcg_num,
+        sql_create_index_deck_cards_deck,
+        sql_create_index_scryfall_types_type,
+        'ANALYZE;',
+    ]),
+    Migration(2, 'Add connection settings to config', [
+        sql_insert_connection_config,
+    ]),
+    Migration(3, 'Add full-text search index', [
+        sql_create_index_inventory_scryfall_id,
+        sql_create_inventory_fts,
+        sql_create_inventory_fts_insert_trigger,
+        sql_create_inventory_fts_delete_trigger,
+        sql_create_inventory_fts_update_trigger,
+        sql_rebuild_inventory_fts,
+        sql_drop_scryfall_faces_rekeyed,
+        sql_create_scryfall_faces_rekeyed,
+        sql_fill_scryfall_faces_rekeyed,
+        sql_drop_scryfall_faces_unkeyed,
+        sql_rename_scryfall_faces_rekeyed,
+        sql_create_scryfall_faces_fts,
+        sql_create_scryfall_faces_fts_insert_trigger,
+        sql_create_scryfall_faces_fts_delete_trigger,
+        sql_create_scryfall_faces_fts_update_trigger,
+        sql_rebuild_scryfall_faces_fts,
+        sql_create_editions_fts,
+        sql_create_editions_fts_insert_trigger,
+        sql_create_editions_fts_delete_trigger,
+        sql_create_editions_fts_update_trigger,
+        sql_clear_editions_fts,
+        sql_fill_editions_fts,
+    ], check=_check_fts5_trigram),
+]
@@ -2,6 +2,8 @@ import datetime
 
 import sqlite3
 
+from typing import Iterable
+
 from . import util
 
 from .errors import NotFoundError, AlreadyExistsError
@@ -33,112 +35,210 @@ def insert_type(db_filename: str, name: str) -> str:
 
 
 def get_one(db_filename: str, id: str) -> ScryfallCardData:
+    found = get_many(db_filename, [id])
+    if id not in found:
+        raise NotFoundError("No gameplay data found for card with scryfall_id {!r}".format(id))
+    return found[id]
+
+
+def get_many(db_filename: str, ids: Iterable[str]) -> dict[str, ScryfallCardData]:
+    """
+    Return the stored data of every given card, keyed by scryfall_id. IDs that
+    have no data in the DB are left out of the returned dict. The lookup takes
+    one query per MAX_IN_PARAMS IDs no matter how many are given.
+    """
+    ids = list(dict.fromkeys(ids))
+
     con = util.connect(db_filename)
     cur = con.cursor()
-    
-    faces: list[ScryfallFace] = list()
-    rarity: str = ''
-    uri: str = ''
-    last_updated: datetime.datetime = datetime.datetime.now(tz=datetime.timezone.utc)
-    for r in cur.execute(sql_get_scryfall_card_data, (id,)):
-        if r[0] != '' and rarity == '':
-            rarity = r[0]
-
-        if r[1] != '':
-            uri = r[1]
-
-        if r[2] != '':
-            last_updated = datetime.datetime.fromisoformat(r[2])
-        
-        faces.append(ScryfallFace(
-            index=r[3],
-            name=r[4],
-            cost=r[5],
-            type=r[6],
-            power=r[7],
-            toughness=r[8],
-            text=r[9]
-        ))
-    con.close()
 
-    if len(faces) == 0:
-        raise NotFoundError("No gameplay data found for card with scryfall_id {!r}".format(id))
+    # rows come back grouped by card, so each card is built from a run of rows
+    rows_by_id: dict[str, list[tuple]] = {}
+    for chunk in util.chunked(ids):
+        query = sql_get_many_scryfall_card_data.format(ids=util.in_params(len(chunk)))
+        for r in cur.execute(query, chunk):
+            rows_by_id.setdefault(r[0], []).append(r)
+    con.close()
 
-    gamedata = ScryfallCardData(
-        id=id,
-        rarity=rarity,
-        uri=uri,
-        last_updated=last_updated,
-        *faces
-    )
-    
-    return gamedata
+    data: dict[str, ScryfallCardData] = {}
+    for id, rows in rows_by_id.items():
+        faces: list[ScryfallFace] = list()
+        rarity: str = ''
+        uri: str = ''
+        last_updated: datetime.datetime = datetime.datetime.now(tz=datetime.timezone.utc)
+        for r in rows:
+            if r[1] != '' and rarity == '':
+                rarity = r[1]
+
+            if r[2] != '':
+                uri = r[2]
+
+            if r[3] != '':
+                last_updated = datetime.datetime.fromisoformat(r[3])
+            
+            faces.append(ScryfallFace(
+                index=r[4],
+                name=r[5],
+                cost=r[6],
+                type=r[7],
+                power=r[8],
+                toughness=r[9],
+                text=r[10]
+            ))
+
+        data[id] = ScryfallCardData(
+            id=id,
+            rarity=rarity,
+            uri=uri,
+            last_updated=last_updated,
+            *faces
+        )
+
+    return data
 
 
 def insert(db_filename: str, card_data: ScryfallCardData):
-    if card_data is None:
-        raise ValueError("Cannot insert None into database")
-    if card_data.id is None:
-        raise ValueError("Cannot insert CardGameData with no scryfall_id into database")
-    if card_data.faces is None or len(card_data.faces) < 1:
-        raise ValueError("Cannot insert CardGameData with no faces into database")
+    try:
+        insert_many(db_filename, [card_data])
+    except AlreadyExistsError:
+        raise AlreadyExistsError("Card data with scryfall_id {:s} already exists".format(card_data.id))
 
-    face_rows = []
 
-    for idx, f in enumerate(card_data.faces):
-        face_rows.append((
+def insert_many(db_filename: str, cards: Iterable[ScryfallCardData]):
+    """
+    Insert the data of every given card, along with any card types they use
+    that are not yet in the DB, in a single transaction. If data for any of the
+    cards already exists, none of them are inserted and AlreadyExistsError is
+    raised.
+    """
+    card_rows = []
+    face_rows = []
+    type_rows = []
+    type_names = set()
+
+    for card_data in cards:
+        if card_data is None:
+            raise ValueError("Cannot insert None into database")
+        if card_data.id is None:
+            raise ValueError("Cannot insert CardGameData with no scryfall_id into database")
+        if card_data.faces is None or len(card_data.faces) < 1:
+            raise ValueError("Cannot insert CardGameData with no faces into database")
+
+        card_rows.append((
             card_data.id,
-            idx,
-            f.name,
-            f.cost,
-            f.type,
-            f.power,
-            f.toughness,
-            f.text
+            card_data.rarity,
+            card_data.uri,
+            card_data.last_updated.isoformat()
         ))
 
-    card_row = (
-        card_data.id,
-        card_data.rarity,
-        card_data.uri,
-        card_data.last_updated.isoformat()
-    )
-
-    # first check if any types need to be inserted
-    types_to_insert = set()
-    for t in card_data.all_types:
-        try:
-            get_one_type(db_filename, t)
-        except NotFoundError:
-            types_to_insert.add(t)
-    for t in types_to_insert:
-        # TODO: could be an executemany instead of one at a time
-        insert_type(db_filename, t)
-
-        
-    # insert the actual card data
+        for idx, f in enumerate(card_data.faces):
+            face_rows.append((
+                card_data.id,
+                idx,
+                f.name,
+                f.cost,
+                f.type,
+                f.power,
+                f.toughness,
+                f.text
+            ))
+
+        # a type can be listed more than once if several faces have it
+        for t in dict.fromkeys(card_data.all_types):
+            type_rows.append((card_data.id, t))
+            type_names.add(t)
+
+    if len(card_rows) < 1:
+        return
+
     con = util.connect(db_filename)
     cur = con.cursor()
 
     try:
-        cur.execute(sql_insert_scryfall_card_data, card_row)
+        # types must exist before the type indexes that refer to them
+        cur.executemany(sql_insert_type_if_missing, [(t,) for t in sorted(type_names)])
+        cur.executemany(sql_insert_scryfall_card_data, card_rows)
+        cur.executemany(sql_insert_scryfall_card_face, face_rows)
+        cur.executemany(sql_insert_scryfall_type, type_rows)
     except sqlite3.IntegrityError:
         con.rollback()
         con.close()
-        raise AlreadyExistsError("Card data with scryfall_id {:s} already exists".format(card_data.id))
+        raise AlreadyExistsError("Card data for one or more of the given scryfall_ids already exists")
     con.commit()
+    con.close()
 
-    # insert the faces
-    cur.executemany(sql_insert_scryfall_card_face, face_rows)
-    con.commit()
 
-    # insert the type indexes
-    scryfall_type_rows = []
-    for t in card_data.all_types:
-        scryfall_type_rows.append((card_data.id, t))
-    cur.executemany(sql_insert_scryfall_type, scryfall_type_rows)
-    con.commit()
+def upsert(db_filename: str, card_data: ScryfallCardData):
+    upsert_many(db_filename, [card_data])
+
+
+def upsert_many(db_filename: str, cards: Iterable[ScryfallCardData]):
+    """
+    Store the data of every given card in a single transaction, inserting it
+    for cards that do not have any yet and bringing it up to date for cards that
+    do. Only what differs from the stored data is written, so refreshing a card
+    whose data has not changed only updates its updated_at.
+    """
+    card_rows = []
+    face_rows = []
+    face_counts = []
+    type_rows = []
+    type_names = set()
+
+    for card_data in cards:
+        if card_data is None:
+            raise ValueError("Cannot insert None into database")
+        if card_data.id is None:
+            raise ValueError("Cannot insert CardGameData with no scryfall_id into database")
+        if card_data.faces is None or len(card_data.faces) < 1:
+            raise ValueError("Cannot insert CardGameData with no faces into database")
+
+        card_rows.append((
+            card_data.id,
+            card_data.rarity,
+            card_data.uri,
+            card_data.last_updated.isoformat()
+        ))
+
+        for idx, f in enumerate(card_data.faces):
+            face_rows.append((
+                card_data.id,
+                idx,
+                f.name,
+                f.cost,
+                f.type,
+                f.power,
+                f.toughness,
+                f.text
+            ))
+        face_counts.append((card_data.id, len(card_data.faces)))
+
+        for t in dict.fromkeys(card_data.all_types):
+            type_rows.append((card_data.id, t))
+            type_names.add(t)
+
+    if len(card_rows) < 1:
+        return
 
+    con = util.connect(db_filename)
+    cur = con.cursor()
+
+    # find the type indexes that the new data no longer has
+    new_types = set(type_rows)
+    stale_type_rows = []
+    for chunk in util.chunked([r[0] for r in card_rows]):
+        query = sql_get_many_scryfall_types.format(ids=util.in_params(len(chunk)))
+        for r in cur.execute(query, chunk):
+            if (r[0], r[1]) not in new_types:
+                stale_type_rows.append((r[0], r[1]))
+
+    cur.executemany(sql_insert_type_if_missing, [(t,) for t in sorted(type_names)])
+    cur.executemany(sql_upsert_scryfall_card_data, card_rows)
+    cur.executemany(sql_upsert_scryfall_card_face, face_rows)
+    cur.executemany(sql_delete_scryfall_card_faces_from, face_counts)
+    cur.executemany(sql_delete_scryfall_type, stale_type_rows)
+    cur.executemany(sql_insert_scryfall_type_if_missing, type_rows)
+    con.commit()
     con.close()
 
 
@@ -154,8 +254,9 @@ sql_delete_scryfall_card_data = '''
 DELETE FROM scryfall WHERE id = ?
 '''
 
-sql_get_scryfall_card_data = '''
+sql_get_many_scryfall_card_data = '''
 SELECT
+    s.id,
     s.rarity,
     s.web_uri,
     s.updated_at,
@@ -168,7 +269,8 @@ SELECT
     f.text
 FROM scryfall AS s
 INNER JOIN scryfall_faces AS f ON s.id = f.scryfall_id
-WHERE s.id = ?
+WHERE s.id IN ({ids})
+ORDER BY s.id, f."index"
 '''
 
 sql_insert_scryfall_card_data = '''
@@ -193,6 +295,64 @@ INSERT INTO scryfall_faces (
 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
 '''
 
+sql_upsert_scryfall_card_data = '''
+INSERT INTO scryfall (
+    id,
+    rarity,
+    web_uri,
+    updated_at
+) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    rarity = excluded.rarity,
+    web_uri = excluded.web_uri,
+    updated_at = excluded.updated_at
+'''
+
+# faces that are unchanged are left alone so that their rows and the search
+# index over them are not rewritten.
+sql_upsert_scryfall_card_face = '''
+INSERT INTO scryfall_faces (
+    scryfall_id,
+    "index",
+    name,
+    cost,
+    type,
+    power,
+    toughness,
+    text
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (scryfall_id, "index") DO UPDATE SET
+    name = excluded.name,
+    cost = excluded.cost,
+    type = excluded.type,
+    power = excluded.power,
+    toughness = excluded.toughness,
+    text = excluded.text
+WHERE
+    name IS NOT excluded.name OR
+    cost IS NOT excluded.cost OR
+    type IS NOT excluded.type OR
+    power IS NOT excluded.power OR
+    toughness IS NOT excluded.toughness OR
+    text IS NOT excluded.text
+'''
+
+sql_delete_scryfall_card_faces_from = '''
+DELETE FROM scryfall_faces WHERE scryfall_id = ? AND "index" >= ?
+'''
+
+sql_get_many_scryfall_types = '''
+SELECT scryfall_id, type FROM scryfall_types WHERE scryfall_id IN ({ids})
+'''
+
+sql_delete_scryfall_type = '''
+DELETE FROM scryfall_types WHERE scryfall_id = ? AND type = ?
+'''
+
+sql_insert_scryfall_type_if_missing = '''
+INSERT OR IGNORE INTO scryfall_types (scryfall_id, type) VALUES (?, ?)
+'''
+
 sql_get_type = '''
 SELECT name FROM types WHERE name LIKE ?
 '''
@@ -201,6 +361,10 @@ sql_insert_type = '''
 INSERT INTO types (name) VALUES (?)
 '''
 
+sql_insert_type_if_missing = '''
+INSERT OR IGNORE INTO types (name) VALUES (?)
+'''
+
 sql_insert_scryfall_type = '''
 INSERT INTO scryfall_types (scryfall_id, type) VALUES (?, ?)
 '''
\ No newline at end of file
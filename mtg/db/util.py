@@ -1,8 +1,45 @@
+import os.path
 import sqlite3
 import sys
+import threading
+
+from contextlib import contextmanager
+from typing import Iterable, Iterator
 
 from ..types import Card
-from .errors import DBOpenError
+from .errors import DBError, DBOpenError
+
+
+# Number of prepared statements each connection keeps cached. The db modules
+# use a few dozen distinct queries in total, so this keeps all of them warm on
+# a pooled connection.
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+# Config keys that hold settings applied to every connection, along with the
+# value used for each when a DB does not have it set. cache_size and mmap_size
+# take the same values as their PRAGMAs; a negative cache_size is in KiB.
+# journal_mode is the exception: it is stored in the DB file itself rather than
+# being set per connection, so it is only changed when the DB has it set. The
+# value here is what migration sets it to.
+connection_setting_defaults = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+# Most values bound into a single IN (...) list by the batch lookups. Older
+# SQLite builds cap a statement at 999 bound parameters.
+MAX_IN_PARAMS = 900
+
+journal_modes = ['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF']
+temp_stores = ['DEFAULT', 'FILE', 'MEMORY']
+
+
+_pools: dict[str, 'ConnectionPool'] = {}
+_pools_lock = threading.Lock()
 
 
 def none_to_empty_str(data):
@@ -15,26 +52,362 @@ def int_to_bool(data):
     return data > 0
 
 
+def py_lower(text: str | None) -> str:
+    if text is None:
+        return ''
+    return text.lower()
+
+
+def chunked(items: Iterable, size: int=MAX_IN_PARAMS) -> Iterator[list]:
+    """
+    Yield lists of up to size items at a time from items, in order.
+    """
+    chunk = []
+    for i in items:
+        chunk.append(i)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def in_params(count: int) -> str:
+    """
+    Return the parameter placeholders for an IN (...) list of count values.
+    """
+    return ','.join(['?'] * count)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection that belongs to a ConnectionPool. Calling close() on it releases
+    it back to its pool rather than closing it, so the db functions can keep
+    their usual connect/close pattern. Any transaction the caller left open is
+    rolled back on release, which matches what closing a connection would do.
+
+    While a unit of work is active on the connection (see transaction()),
+    commit() called by db functions is deferred to the end of the unit so that
+    all of their changes land in one transaction. Each db function that gets
+    the connection from connect() during the unit works inside a savepoint of
+    its own, so its rollback() undoes only its changes and not those of the
+    rest of the unit. A rollback() that is not inside any such savepoint can
+    not be undone on its own, so it makes the whole unit roll back instead of
+    committing.
+    """
+
+    pool: 'ConnectionPool | None' = None
+    unit_depth: int = 0
+    unit_aborted: bool = False
+    savepoints: list[str] | None = None
+
+    # results db functions have computed from this connection that are reused
+    # until the DB changes, by name of the function that cached them.
+    cached_results: dict[str, dict] | None = None
+
+    def commit(self):
+        if self.unit_depth > 0:
+            return
+        super().commit()
+
+    def rollback(self):
+        if self.unit_depth > 0:
+            if len(self.savepoints) > 0:
+                self.execute('ROLLBACK TO "{:s}"'.format(self.savepoints[-1]))
+            else:
+                self.unit_aborted = True
+            return
+        super().rollback()
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+            return
+
+        if self.unit_depth > 0:
+            if len(self.savepoints) > 0:
+                self.execute('RELEASE "{:s}"'.format(self.savepoints.pop()))
+        elif self.in_transaction:
+            self.rollback()
+
+    def begin_call(self):
+        """
+        Start the savepoint for a db function that got this connection from
+        connect(), if a unit of work is active. It is released when the
+        function calls close().
+        """
+        if self.unit_depth < 1:
+            return
+        name = 'call_{:d}'.format(len(self.savepoints))
+        self.execute('SAVEPOINT "{:s}"'.format(name))
+        self.savepoints.append(name)
+
+    def begin_unit(self):
+        if self.unit_depth == 0:
+            if not self.in_transaction:
+                self.execute('BEGIN')
+            self.unit_aborted = False
+            self.savepoints = []
+        self.unit_depth += 1
+
+    def end_unit(self, commit: bool):
+        self.unit_depth -= 1
+        if self.unit_depth > 0:
+            return
+
+        # savepoints of db functions that raised before closing are ended
+        # along with the transaction.
+        self.savepoints = []
+        if commit and not self.unit_aborted:
+            super().commit()
+            return
+
+        super().rollback()
+        if commit:
+            raise DBError("unit of work was rolled back by a db call within it and has not been committed")
+
+    def close_for_real(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """
+    ConnectionPool keeps connections to a single DB file open for as long as
+    the pool is open. While it is, every call to connect() with that filename
+    gets a connection from the pool instead of opening a new one, so the
+    statement cache and SQLite page cache stay warm across calls. One
+    connection is kept per thread, as sqlite3 connections must not be shared
+    between threads that use them at the same time.
+
+    Do not create these directly; use open_pool(). Pools are reference-counted
+    so that nested owners (a CLI invocation that starts an interactive session,
+    for instance) can each open and close the same pool.
+    """
+
+    def __init__(self, db_filename: str):
+        self.db_filename = db_filename
+        self._key = _pool_key(db_filename)
+        self._refs = 0
+        self._local = threading.local()
+        self._all_cons: list[PooledConnection] = []
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self) -> bool:
+        return self._refs < 1
+
+    def connection(self) -> PooledConnection:
+        """
+        Return the connection for the calling thread, opening it if needed.
+        """
+        con: PooledConnection | None = getattr(self._local, 'con', None)
+
+        if con is None:
+            con = _open(self.db_filename, factory=PooledConnection, check_same_thread=False)
+            con.pool = self
+            self._local.con = con
+            with self._lock:
+                self._all_cons.append(con)
+        elif con.in_transaction and con.unit_depth < 1:
+            # a previous caller raised before committing; do not let its
+            # partial changes leak into the next unit of work.
+            con.rollback()
+
+        return con
+
+    def close(self):
+        """
+        Release this reference to the pool. Once every reference has been
+        released, all connections held by the pool are closed and connect()
+        goes back to opening a fresh connection on each call.
+        """
+        with _pools_lock:
+            if self._refs < 1:
+                return
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            if _pools.get(self._key) is self:
+                del _pools[self._key]
+
+        with self._lock:
+            for con in self._all_cons:
+                try:
+                    con.close_for_real()
+                except sqlite3.Error:
+                    pass
+            self._all_cons = []
+        self._local = threading.local()
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        return "ConnectionPool(db_filename={!r}, refs={!r}, connections={!r})".format(self.db_filename, self._refs, len(self._all_cons))
+
+
+def open_pool(db_filename: str) -> ConnectionPool:
+    """
+    Open a connection pool for the given DB file, or take another reference to
+    the one that is already open for it. The caller owns the returned pool and
+    must call close() on it (or use it in a with-statement) when done.
+
+    The DB file is not opened until the first connection is requested, so a
+    pool can be opened for a DB that has not yet been initialized.
+    """
+    key = _pool_key(db_filename)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_filename)
+            _pools[key] = pool
+        pool._refs += 1
+    return pool
+
+
+def get_pool(db_filename: str) -> ConnectionPool | None:
+    """
+    Return the open pool for the given DB file, or None if there is not one.
+    """
+    return _pools.get(_pool_key(db_filename))
+
+
+@contextmanager
+def transaction(db_filename: str):
+    """
+    Run every db call made on db_filename inside the with-block as a single
+    unit of work: all of their changes are committed together when the block
+    exits normally, and all of them are rolled back if it raises. Yields the
+    connection in use for callers that want to execute statements directly.
+
+    A pool is opened for the duration of the block if one is not already open,
+    so that all calls share one connection. Units of work may be nested; inner
+    ones simply join the outermost, which alone decides whether to commit.
+    """
+    pool = open_pool(db_filename)
+    try:
+        con = pool.connection()
+        con.begin_unit()
+        try:
+            yield con
+        except BaseException:
+            con.end_unit(commit=False)
+            raise
+        else:
+            con.end_unit(commit=True)
+    finally:
+        pool.close()
+
+
 def connect(db_filename):
+    pool = get_pool(db_filename)
+    if pool is not None:
+        con = pool.connection()
+        con.begin_call()
+        return con
+    return _open(db_filename)
+
+
+def _pool_key(db_filename: str) -> str:
+    return os.path.normcase(os.path.abspath(db_filename))
+
+
+def _open(db_filename, **kwargs):
     try:
-        con = sqlite3.connect("file:" + db_filename + "?mode=rw", uri=True)
+        con = sqlite3.connect("file:" + db_filename + "?mode=rw", uri=True, cached_statements=DEFAULT_CACHED_STATEMENTS, **kwargs)
     except sqlite3.OperationalError as e:
         cant_open = False
         if sys.version_info[0] >= 3 and sys.version_info[1] >= 11:
             cant_open = (e.sqlite_errorcode & 0xff) == 0x0e
         else:
             cant_open = "unable to open database file" in str(e).lower()
-        
+
         if cant_open:
             raise DBOpenError("Cannot open DB file {!r}; does it exist?".format(db_filename))
         else:
             raise DBOpenError("SQLITE returned an error opening DB: {:s}({:d})".format(e.sqlite_errorname, e.sqlite_errorcode))
 
     con.execute(sql_enable_foreign_keys)
-        
+    _apply_connection_settings(con)
+
+    # matching that must fold case exactly as python does uses this, as
+    # SQLite's LOWER() does not do so for non-ASCII names.
+    con.create_function('py_lower', 1, py_lower, deterministic=True)
+
     return con
 
 
+def check_connection_setting(key: str, value) -> str | int:
+    """
+    Return the normalized form of the given value for a connection setting, or
+    raise ValueError if it is not valid for that setting.
+    """
+    if key not in connection_setting_defaults:
+        raise ValueError("{!r} is not a connection setting".format(key))
+
+    if key == 'journal_mode':
+        value = str(value).strip().upper()
+        if value not in journal_modes:
+            raise ValueError("journal_mode must be one of {:s}".format(', '.join(journal_modes)))
+        return value
+    if key == 'temp_store':
+        value = str(value).strip().upper()
+        if value not in temp_stores:
+            raise ValueError("temp_store must be one of {:s}".format(', '.join(temp_stores)))
+        return value
+
+    try:
+        value = int(str(value).strip())
+    except ValueError:
+        raise ValueError("{:s} must be an integer".format(key))
+    if key in ['busy_timeout', 'mmap_size'] and value < 0:
+        raise ValueError("{:s} cannot be negative".format(key))
+    return value
+
+
+def _apply_connection_settings(con: sqlite3.Connection):
+    settings = dict(connection_setting_defaults)
+    del settings['journal_mode']
+    try:
+        for r in con.execute(sql_get_connection_settings):
+            if r[1] is None or r[1] == '':
+                continue
+            try:
+                settings[r[0]] = check_connection_setting(r[0], r[1])
+            except ValueError:
+                # bad value written to the DB by hand; stick with the default.
+                pass
+    except sqlite3.OperationalError:
+        # no config table, so the DB has not been initialized yet.
+        pass
+
+    # set the timeout first so that changing journal mode waits on other
+    # connections instead of failing right away.
+    con.execute('PRAGMA busy_timeout = {:d}'.format(settings['busy_timeout']))
+
+    journal_mode = settings.get('journal_mode')
+    cur_mode = con.execute('PRAGMA journal_mode').fetchone()[0]
+    if journal_mode is not None and cur_mode.upper() != journal_mode:
+        try:
+            cur_mode = con.execute('PRAGMA journal_mode = {:s}'.format(journal_mode)).fetchone()[0]
+        except sqlite3.OperationalError:
+            # another connection is in the middle of something; it will be
+            # switched on a later connect.
+            pass
+
+    # WAL is safe from corruption with NORMAL sync; only durability of the
+    # last few commits on power loss is traded for far fewer fsyncs.
+    sync = 'NORMAL' if cur_mode.upper() == 'WAL' else 'FULL'
+    con.execute('PRAGMA synchronous = {:s}'.format(sync))
+    con.execute('PRAGMA cache_size = {:d}'.format(settings['cache_size']))
+    con.execute('PRAGMA mmap_size = {:d}'.format(settings['mmap_size']))
+    con.execute('PRAGMA temp_store = {:s}'.format(settings['temp_store']))
+
+
 def card_row_to_card(r) -> Card:
     return Card(
         id=r[0],
@@ -59,4 +432,8 @@ def card_row_to_card(r) -> Card:
 
 sql_enable_foreign_keys = '''
 PRAGMA foreign_keys = ON;
-'''
\ No newline at end of file
+'''
+
+sql_get_connection_settings = '''
+SELECT key, value FROM config WHERE key IN ('journal_mode', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store');
+'''
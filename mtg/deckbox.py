@@ -1,10 +1,11 @@
 import csv
 import sys
 
-from typing import List
+from typing import Any, Callable, Iterable, Iterator, List
 
-from . import cardutil, scryfall, cio, elog, get_editions
+from . import cardutil, scryfall, cio, elog, timer, get_editions
 from .db import carddb, editiondb, DBError
+from .db import util as dbutil
 from .errors import UserCancelledError, DataConflictError
 from .types import Card, DeckChangeRecord, CardWithUsage
 
@@ -21,7 +22,8 @@ class UpdateCounts:
             counts: int,
             deck_removals: int,
             owned_to_wishlisteds: int,
-            wishlisted_to_owneds: int
+            wishlisted_to_owneds: int,
+            phase_times: dict[str, float] | None=None
         ):
 
         self.created = created
@@ -31,6 +33,9 @@ class UpdateCounts:
         self.owned_to_wishlisteds = owned_to_wishlisteds
         self.wishlisted_to_owneds = wishlisted_to_owneds
 
+        # wall-clock seconds spent in each phase of the import, by phase name.
+        self.phase_times = phase_times if phase_times is not None else {}
+
     def __str__(self):
         s = "{:d}x created, {:d}x scryfall IDs updated, {:d}x counts, {:d}x removed from decks, {:d}x owned -> WL, {:d}x WL -> owned"
         return s.format(
@@ -46,52 +51,78 @@ class UpdateCounts:
 def import_csv(db_filename: str, csv_filename: str, confirm_changes: bool=True, log: elog.Logger | None=None) -> UpdateCounts | None:
     """
     Return an UpdateCounts struct, or None if there were no changes.
+
+    All changes are written in a single transaction; if anything fails while
+    writing, none of them are applied. Time spent in each phase of the import
+    is logged and recorded in the returned UpdateCounts.
     """
 
     if log is None:
         log = elog.get(__name__)
 
-    new_cards_data = parse_deckbox_csv(csv_filename)
-    drop_unused_fields(new_cards_data)
-    update_deckbox_values_to_mtgdb(new_cards_data)
-    update_deckbox_fieldnames_to_mtgdb(new_cards_data)
-
-    new_cards = list()
-    for data in new_cards_data:
-        c = Card(
-            count=data['count'],
-            name=data['name'],
-            edition=data['edition'],
-            tcg_num=data['tcg_num'],
-            condition=data['condition'],
-            language=data['language'],
-            foil=data['foil'],
-            signed=data['signed'],
-            artist_proof=data['artist_proof'],
-            altered_art=data['altered_art'],
-            misprint=data['misprint'],
-            promo=data['promo'],
-            textless=data['textless'],
-            printing_id=data['printing_id'],
-            printing_note=data['printing_note'],
-            scryfall_id=data['scryfall_id']
-        )
-        new_cards.append(c)
+    phases = timer.PhaseTimer()
 
-    new_cards = dedupe_cards(new_cards, log=log)
-    
-    # then pull everyfin from the db
-    existing_cards = carddb.get_all(db_filename)
+    # cards are deduped as they are read so only unique ones are kept.
+    with phases.phase('parse'):
+        new_cards = dedupe_cards(iter_deckbox_csv(csv_filename), log=log)
     
     # eliminate dupes that already exist
-    new_imports, scryfall_id_updates, count_updates, deck_removals, deck_wl_to_owneds, deck_owned_to_wls = analyze_changes(db_filename, new_cards, existing_cards)
+    with phases.phase('analyze'):
+        new_imports, scryfall_id_updates, count_updates, deck_removals, deck_wl_to_owneds, deck_owned_to_wls = analyze_import(db_filename, new_cards)
     
     if len(new_imports) == 0 and len(count_updates) == 0 and len(scryfall_id_updates) == 0 and len(deck_removals) == 0 and len(deck_wl_to_owneds) == 0 and len(deck_owned_to_wls) == 0:
+        log.info("Import phase times: %s", str(phases))
         print("No new cards to import and no counts need updating", file=sys.stderr)
         return None
     
     # if we get this far, verify that we actually have every single edition code
     # on file or we will get nondescript Foreign Key failure errors on insert.
+    with phases.phase('editions'):
+        missing_codes = _fetch_missing_editions(db_filename, new_imports)
+
+    if len(missing_codes) > 0:
+        full_msg = 'Uncorrectable error: cards contain edition codes not in the database: {:s}'.format(', '.join(missing_codes))
+        raise DataConflictError(full_msg)
+
+    
+    # prep for db insertion by printing things out:
+    if confirm_changes:
+        _print_changes(new_imports, scryfall_id_updates, count_updates, deck_removals, deck_owned_to_wls, deck_wl_to_owneds)
+        
+        if not cio.confirm("Write changes to {:s}?".format(db_filename)):
+            raise UserCancelledError("user cancelled changes")
+
+    # if the card is moved entirely to wishlist, the count update will probably go to 0. We don't remove
+    # 0's at this time, but if we do, we need to make shore that any such are not there due to wishlist.
+    with phases.phase('write'):
+        with dbutil.transaction(db_filename):
+            carddb.insert_multiple(db_filename, new_imports)
+            carddb.update_multiple_scryfall_ids(db_filename, [x.card for x in scryfall_id_updates])
+            carddb.update_multiple_counts(db_filename, [x.card for x in count_updates])
+            carddb.remove_amount_from_decks(db_filename, deck_removals)
+            carddb.move_amount_from_owned_to_wishlist_in_decks(db_filename, deck_owned_to_wls)
+            carddb.move_amount_from_wishlist_to_owned_in_decks(db_filename, deck_wl_to_owneds)
+
+    log.info("Import phase times: %s", str(phases))
+
+    counts = UpdateCounts(
+        created=len(new_imports),
+        scryfall_ids=len(scryfall_id_updates),
+        counts=len(count_updates),
+        deck_removals=len(deck_removals),
+        owned_to_wishlisteds=len(deck_owned_to_wls),
+        wishlisted_to_owneds=len(deck_wl_to_owneds),
+        phase_times=dict(phases.phases)
+    )
+
+    return counts
+
+
+def _fetch_missing_editions(db_filename: str, new_imports: list[Card]) -> set[str]:
+    """
+    Retrieve from Scryfall any editions used by the given cards that are not in
+    the database, and return the set of codes that could not be retrieved.
+    """
     editions = get_editions(db_filename)
     missing_codes = set()
     for card in new_imports:
@@ -117,89 +148,63 @@ def import_csv(db_filename: str, csv_filename: str, confirm_changes: bool=True,
                 print("DONE")
         missing_codes = still_missing
 
-    if len(missing_codes) > 0:
-        full_msg = 'Uncorrectable error: cards contain edition codes not in the database: {:s}'.format(', '.join(missing_codes))
-        raise DataConflictError(full_msg)
-
-    
-    # prep for db insertion by printing things out:
-    if confirm_changes:
-        if len(new_imports) > 0:
-            print("New cards to import:")
-            for card in new_imports:
-                print("{:d}x {:s}".format(card.count, str(card)))
-            print("")
-
-        if len(scryfall_id_updates) > 0:
-            print("Scryfall ID updates:")
-            for upd8 in scryfall_id_updates:
-                orig_id = '(none)' if upd8.old_scryfall_id is None else '(no scryfall ID)'
-                print("{:s} -> {:s} in {:s}".format(orig_id, upd8.card.scryfall_id, str(upd8.card)))
-            print("")
-        
-        if len(count_updates) > 0:
-            print("Update counts:")
-            for upd8 in count_updates:
-                print("{:d}x -> {:d}x {:s}".format(upd8.old_count, upd8.card.count, str(upd8.card)))
-            print("")
-
-        if len(deck_removals) > 0:
-            print("Removals from decks:")
-            for removal in deck_removals:
-                print("{:d}x {:s} from {:s}".format(removal.amount, str(removal.card_data), removal.deck_name))
-            print("")
-
-        if len(deck_owned_to_wls) > 0:
-            print("Owned to wishlist:")
-            for move in deck_owned_to_wls:
-                print("{:d}x {:s} moved from owned to wishlist in {:s}".format(move.amount, str(move.card_data), move.deck_name))
-            print("")
-
-        if len(deck_wl_to_owneds) > 0:
-            print("Wishlist to owned:")
-            for move in deck_wl_to_owneds:
-                print("{:d}x {:s} moved from wishlist to owned in {:s}".format(move.amount, str(move.card_data), move.deck_name))
-            print("")
-        
-        s_count = 's' if len(count_updates) != 1 else ''
-        s_card = 's' if len(new_imports) != 1 else ''
-        s_scryfall = 's' if len(scryfall_id_updates) != 1 else ''
-        s_remove = 's' if len(deck_removals) != 1 else ''
-        s_o_to_wl = 's' if len(deck_owned_to_wls) != 1 else ''
-        s_wl_to_o = 's' if len(deck_wl_to_owneds) != 1 else ''
-        
-        summary = "{:d} new card{:s} will be imported\n".format(len(new_imports), s_card)
-        summary += "{:d} scryfall ID{:s} will be updated\n".format(len(scryfall_id_updates), s_scryfall)
-        summary += "{:d} count{:s} will be updated\n".format(len(count_updates), s_count)
-        summary += "{:d} card{:s} will be removed from decks\n".format(len(deck_removals), s_remove)
-        summary += "{:d} card{:s} will be moved from owned to wishlisted\n".format(len(deck_owned_to_wls), s_o_to_wl)
-        summary += "{:d} card{:s} will be moved from wishlisted to owned\n".format(len(deck_wl_to_owneds), s_wl_to_o)
-        
-        print(summary)
-        
-        if not cio.confirm("Write changes to {:s}?".format(db_filename)):
-            raise UserCancelledError("user cancelled changes")
+    return missing_codes
 
-    counts = UpdateCounts(
-        created=len(new_imports),
-        scryfall_ids=len(scryfall_id_updates),
-        counts=len(count_updates),
-        deck_removals=len(deck_removals),
-        owned_to_wishlisteds=len(deck_owned_to_wls),
-        wishlisted_to_owneds=len(deck_wl_to_owneds)
-    )
 
-    # if the card is moved entirely to wishlist, the count update will probably go to 0. We don't remove
-    # 0's at this time, but if we do, we need to make shore that any such are not there due to wishlist.
-    carddb.insert_multiple(db_filename, new_imports)
-    carddb.update_multiple_scryfall_ids(db_filename, [x.card for x in scryfall_id_updates])
-    carddb.update_multiple_counts(db_filename, [x.card for x in count_updates])
-    carddb.remove_amount_from_decks(db_filename, deck_removals)
-    carddb.move_amount_from_owned_to_wishlist_in_decks(db_filename, deck_owned_to_wls)
-    carddb.move_amount_from_wishlist_to_owned_in_decks(db_filename, deck_wl_to_owneds)
+def _print_changes(new_imports: list[Card], scryfall_id_updates: list['ScryfallIDUpdate'], count_updates: list['CountUpdate'], deck_removals: list[DeckChangeRecord], deck_owned_to_wls: list[DeckChangeRecord], deck_wl_to_owneds: list[DeckChangeRecord]):
+    if len(new_imports) > 0:
+        print("New cards to import:")
+        for card in new_imports:
+            print("{:d}x {:s}".format(card.count, str(card)))
+        print("")
 
-    return counts
+    if len(scryfall_id_updates) > 0:
+        print("Scryfall ID updates:")
+        for upd8 in scryfall_id_updates:
+            orig_id = '(none)' if upd8.old_scryfall_id is None else '(no scryfall ID)'
+            print("{:s} -> {:s} in {:s}".format(orig_id, upd8.card.scryfall_id, str(upd8.card)))
+        print("")
+    
+    if len(count_updates) > 0:
+        print("Update counts:")
+        for upd8 in count_updates:
+            print("{:d}x -> {:d}x {:s}".format(upd8.old_count, upd8.card.count, str(upd8.card)))
+        print("")
+
+    if len(deck_removals) > 0:
+        print("Removals from decks:")
+        for removal in deck_removals:
+            print("{:d}x {:s} from {:s}".format(removal.amount, str(removal.card_data), removal.deck_name))
+        print("")
+
+    if len(deck_owned_to_wls) > 0:
+        print("Owned to wishlist:")
+        for move in deck_owned_to_wls:
+            print("{:d}x {:s} moved from owned to wishlist in {:s}".format(move.amount, str(move.card_data), move.deck_name))
+        print("")
+
+    if len(deck_wl_to_owneds) > 0:
+        print("Wishlist to owned:")
+        for move in deck_wl_to_owneds:
+            print("{:d}x {:s} moved from wishlist to owned in {:s}".format(move.amount, str(move.card_data), move.deck_name))
+        print("")
+    
+    s_count = 's' if len(count_updates) != 1 else ''
+    s_card = 's' if len(new_imports) != 1 else ''
+    s_scryfall = 's' if len(scryfall_id_updates) != 1 else ''
+    s_remove = 's' if len(deck_removals) != 1 else ''
+    s_o_to_wl = 's' if len(deck_owned_to_wls) != 1 else ''
+    s_wl_to_o = 's' if len(deck_wl_to_owneds) != 1 else ''
     
+    summary = "{:d} new card{:s} will be imported\n".format(len(new_imports), s_card)
+    summary += "{:d} scryfall ID{:s} will be updated\n".format(len(scryfall_id_updates), s_scryfall)
+    summary += "{:d} count{:s} will be updated\n".format(len(count_updates), s_count)
+    summary += "{:d} card{:s} will be removed from decks\n".format(len(deck_removals), s_remove)
+    summary += "{:d} card{:s} will be moved from owned to wishlisted\n".format(len(deck_owned_to_wls), s_o_to_wl)
+    summary += "{:d} card{:s} will be moved from wishlisted to owned\n".format(len(deck_wl_to_owneds), s_wl_to_o)
+    
+    print(summary)
+
 
 class CountUpdate:
     def __init__(self, card: Card, old_count: int):
@@ -212,7 +217,7 @@ class ScryfallIDUpdate:
         self.old_scryfall_id = old_scryfall_id
 
 
-def dedupe_cards(cards: list[Card], log: elog.Logger | None=None) -> list[Card]:
+def dedupe_cards(cards: Iterable[Card], log: elog.Logger | None=None) -> list[Card]:
     """
     Return a list of cards with duplicate cards joined into single cards with
     the same total count. Assumes we are reading from deckbox cards, and
@@ -256,168 +261,122 @@ def dedupe_cards(cards: list[Card], log: elog.Logger | None=None) -> list[Card]:
     return [seen_cards[k] for k in ordered_keys]
 
     
+def identity_key(c: Card) -> tuple:
+    """
+    Return the key that identifies a particular print and instance of a card
+    for the purpose of matching imported cards against the inventory. Two cards
+    with equal keys are considered the same entry; text fields are compared
+    case-insensitively, and count, id, and scryfall_id are not considered.
+    """
+    return (
+        c.name.lower(),
+        c.edition.lower(),
+        c.tcg_num,
+        c.condition.lower(),
+        c.language.lower(),
+        c.foil,
+        c.signed,
+        c.artist_proof,
+        c.altered_art,
+        c.misprint,
+        c.promo,
+        c.textless,
+        c.printing_id,
+        c.printing_note.lower()
+    )
+
+
+def index_by_identity(cards: list[Card]) -> dict[tuple, Card]:
+    """
+    Build a lookup of cards by their identity_key(). If more than one card has
+    the same key, the first one in the list is the one that is indexed.
+    """
+    idx = {}
+    for c in cards:
+        idx.setdefault(identity_key(c), c)
+    return idx
+
+    
 # returns the set of card listings de-duped against inventory as well as any
-# changes that need to be made to existing cards.
-# TODO: due to nested card check this is O(n^2) and could be improved to O(n) by just doing a lookup of each card
-# which is already implemented for purposes of deck importing.
+# changes that need to be made to existing cards. The diff itself is done in
+# the DB so that only cards which differ need to be loaded.
+def analyze_import(db_filename: str, importing: list[Card]) -> tuple[list[Card], list[ScryfallIDUpdate], list[CountUpdate], list[DeckChangeRecord], list[DeckChangeRecord], list[DeckChangeRecord]]:
+    no_dupes, changed, unchanged_count = carddb.diff_import(db_filename, importing)
+
+    if unchanged_count > 0:
+        s_card = 's' if unchanged_count != 1 else ''
+        print("{:d} card{:s} already exist with no changes; skipping".format(unchanged_count, s_card), file=sys.stderr)
+
+    return (no_dupes,) + _analyze_matches(db_filename, changed)
+
+
+# same as analyze_import but diffs against already-loaded inventory cards.
 def analyze_changes(db_filename: str, importing: list[Card], existing: list[CardWithUsage]) -> tuple[list[Card], list[ScryfallIDUpdate], list[CountUpdate], list[DeckChangeRecord], list[DeckChangeRecord], list[DeckChangeRecord]]:
     no_dupes: list[Card] = list()
+    matched: list[tuple[Card, CardWithUsage]] = list()
+
+    existing_index = index_by_identity(existing)
+
+    for card in importing:
+        check = existing_index.get(identity_key(card), None)
+        if check is None:
+            no_dupes.append(card)
+        else:
+            matched.append((card, check))
+
+    return (no_dupes,) + _analyze_matches(db_filename, matched)
+
+
+def _analyze_matches(db_filename: str, matched: list[tuple[Card, CardWithUsage]]) -> tuple[list[ScryfallIDUpdate], list[CountUpdate], list[DeckChangeRecord], list[DeckChangeRecord], list[DeckChangeRecord]]:
+    """
+    Work out the changes needed for each imported card that matches an existing
+    one, prompting for how deck usage should be adjusted where needed.
+    """
     scryfall_updates: list[ScryfallIDUpdate] = list()
     count_only: list[CountUpdate] = list()
     remove_from_deck: list[DeckChangeRecord] = list()
     wishlist_to_owned: list[DeckChangeRecord] = list()
     owned_to_wishlist: list[DeckChangeRecord] = list()
-    for card in importing:
-        already_exists = False
+
+    for card, check in matched:
+        # they are the same print and instance of card; is count different?
         update_count = False
         update_scryfall_id = False
-        existing_id = 0
-        existing_count = 0
-        for check in existing:
-            # first, check if same print. if so, we still might need to bump up count.
-            if card.name.lower() != check.name.lower():
-                continue
-            if card.edition.lower() != check.edition.lower():
-                continue
-            if card.tcg_num != check.tcg_num:
-                continue
-            if card.condition.lower() != check.condition.lower():
-                continue
-            if card.language.lower() != check.language.lower():
-                continue
-            if card.foil != check.foil:
-                continue
-            if card.signed != check.signed:
-                continue
-            if card.artist_proof != check.artist_proof:
-                continue
-            if card.altered_art != check.altered_art:
-                continue
-            if card.misprint != check.misprint:
-                continue
-            if card.promo != check.promo:
-                continue
-            if card.textless != check.textless:
-                continue
-            if card.printing_id != check.printing_id:
-                continue
-            if card.printing_note.lower() != check.printing_note.lower():
-                continue
-            
-            already_exists = True
-            existing_id = check.id
-            existing_count = check.count
-            # they are the same print and instance of card; is count different?
-            if card.count != check.count:
-                print("{:s} already exists (MTGDB ID {:d}), but count will be updated from {:d} to {:d}".format(str(card), check.id, check.count, card.count), file=sys.stderr)
-                update_count = True
-
-                # if the count is incremented, and existing is set to wishlisted, we need to ask if we want to just move wishlist to owned
-                if card.count > check.count:
-                    moves = cardutil.get_deck_wishlisted_changes(db_filename, card, check)
-                    wishlist_to_owned.extend(moves)
-
-                # if the count is decremented, and card is in decks, and is decremented below total owned count, we need to ask which cards to
-                # remove or move to wishlist.
-                if card.count < check.count:
-                    removals, moves = cardutil.get_deck_owned_changes(card, check)
-                    remove_from_deck.extend(removals)
-                    owned_to_wishlist.extend(moves)
-            if card.scryfall_id is not None and card.scryfall_id != check.scryfall_id:
-                action = '{:s} will be added'.format(card.scryfall_id)
-                if check.scryfall_id is not None:
-                    action = 'will be updated from {:s} to {:s}'.format(check.scryfall_id, card.scryfall_id)
-                print("{:s} already exists (MTGDB ID {:d}), but scryfall_id {:s}".format(str(card), check.id, action, file=sys.stderr))
-                update_scryfall_id = True
-
-            if not update_count and not update_scryfall_id:
-                print("{:s} already exists (MTGDB ID {:d}) with no changes; skipping".format(str(card), check.id), file=sys.stderr)
-                
-            # stop checking other cards, if we are here it is time to stop
-            break
-        
-        if already_exists:
-            if update_count:
-                card.id = existing_id
-                count_only.append(CountUpdate(card, existing_count))
-            if update_scryfall_id:
-                card.id = existing_id
-                scryfall_updates.append(ScryfallIDUpdate(card, check.scryfall_id))
-        else:
-            no_dupes.append(card)
-            
-    return no_dupes, scryfall_updates, count_only, remove_from_deck, wishlist_to_owned, owned_to_wishlist
+        if card.count != check.count:
+            print("{:s} already exists (MTGDB ID {:d}), but count will be updated from {:d} to {:d}".format(str(card), check.id, check.count, card.count), file=sys.stderr)
+            update_count = True
+
+            # if the count is incremented, and existing is set to wishlisted, we need to ask if we want to just move wishlist to owned
+            if card.count > check.count:
+                moves = cardutil.get_deck_wishlisted_changes(db_filename, card, check)
+                wishlist_to_owned.extend(moves)
+
+            # if the count is decremented, and card is in decks, and is decremented below total owned count, we need to ask which cards to
+            # remove or move to wishlist.
+            if card.count < check.count:
+                removals, moves = cardutil.get_deck_owned_changes(card, check)
+                remove_from_deck.extend(removals)
+                owned_to_wishlist.extend(moves)
+        if card.scryfall_id is not None and card.scryfall_id != check.scryfall_id:
+            action = '{:s} will be added'.format(card.scryfall_id)
+            if check.scryfall_id is not None:
+                action = 'will be updated from {:s} to {:s}'.format(check.scryfall_id, card.scryfall_id)
+            print("{:s} already exists (MTGDB ID {:d}), but scryfall_id {:s}".format(str(card), check.id, action, file=sys.stderr))
+            update_scryfall_id = True
+
+        if not update_count and not update_scryfall_id:
+            print("{:s} already exists (MTGDB ID {:d}) with no changes; skipping".format(str(card), check.id), file=sys.stderr)
+
+        if update_count:
+            card.id = check.id
+            count_only.append(CountUpdate(card, check.count))
+        if update_scryfall_id:
+            card.id = check.id
+            scryfall_updates.append(ScryfallIDUpdate(card, check.scryfall_id))
+
+    return scryfall_updates, count_only, remove_from_deck, wishlist_to_owned, owned_to_wishlist
 
 
-
-def update_deckbox_fieldnames_to_mtgdb(cards):
-    deckbox_to_mtgdb_columns = {
-        'card_number': 'tcg_num',
-        'edition_code': 'edition',
-    }
-    
-    rn = 0
-    for c in cards:
-        for deckbox_col, new_col in deckbox_to_mtgdb_columns.items():
-            c[new_col] = c[deckbox_col]
-            del c[deckbox_col]
-        
-        rn += 1
-
-
-def update_deckbox_values_to_mtgdb(cards):
-    ed_code_updates = {
-        'IN': 'INV',
-        'PO': 'POR',
-        'OD': 'ODY',
-    }
-    
-    cond_codes = {
-        'Near Mint': 'NM',
-        'Mint': 'M',
-        'Good': 'LP',
-        'Lightly Played': 'LP',
-        'Good (Lightly Played)': 'LP',
-        'Played': 'MP',
-        'Heavily Played': 'HP',
-        'Poor': 'P',
-    }
-
-    rn = 0
-    for c in cards:
-        ed = c['edition_code']
-        if len(ed) != 3:
-            if ed in ed_code_updates:
-                c['edition_code'] = ed_code_updates[ed]
-            else:
-                raise DataConflictError("unaccounted-for non-3-len edition code row {:d}: {!r}".format(rn, ed))
-        
-        cond = c['condition']
-        if cond not in cond_codes:
-            raise DataConflictError("unaccounted-for condition row {:d}: {!r}".format(rn, cond))
-        c['condition'] = cond_codes[cond]
-        
-        rn += 1
-
-
-def drop_unused_fields(cards):
-    unused_fields = [
-        'edition',
-        'my_price',
-        'tags',
-        'tradelist_count',
-    ]
-
-    rn = 0
-    for c in cards:
-        try:
-            for uf in unused_fields:
-                del c[uf]
-        except KeyError:
-            raise DataConflictError("Unexpected format row {:d}: {!r}".format(rn, c))
-        rn += 1
-
-    
 def filled(text):
     return text != ''
 
@@ -456,46 +415,110 @@ deckbox_column_parsers = {
     'scryfall_id': empty_str_to_none,
 }
 
-def parse_deckbox_csv(filename: str, row_limit: int=0) -> list[dict]:
-    data = list()
-    headers = list()
+# deckbox columns that must be present but are not imported.
+deckbox_unused_columns = [
+    'edition',
+    'my_price',
+    'tags',
+    'tradelist_count',
+]
+
+# deckbox columns whose name differs from the Card attribute they go in.
+deckbox_to_mtgdb_columns = {
+    'card_number': 'tcg_num',
+    'edition_code': 'edition',
+}
+
+deckbox_edition_code_updates = {
+    'IN': 'INV',
+    'PO': 'POR',
+    'OD': 'ODY',
+}
+
+deckbox_condition_codes = {
+    'Near Mint': 'NM',
+    'Mint': 'M',
+    'Good': 'LP',
+    'Lightly Played': 'LP',
+    'Good (Lightly Played)': 'LP',
+    'Played': 'MP',
+    'Heavily Played': 'HP',
+    'Poor': 'P',
+}
+
+
+def iter_deckbox_csv(filename: str, row_limit: int=0) -> Iterator[Card]:
+    """
+    Read a deckbox CSV export and yield a Card for each row in it, one at a
+    time, so that the whole file never needs to be held in memory. The parser
+    for each column is resolved once from the header row. Values are converted
+    to their mtgdb equivalents as they are read.
+
+    If row_limit is given, at most that many cards are read.
+    """
     with open(filename, newline='') as f:
         csvr = csv.reader(f)
+
+        header = next(csvr, None)
+        if header is None:
+            return
+        columns = _resolve_deckbox_columns(header)
+
         rn = 0
-        hit_scryfall_id = False
         for row in csvr:
-            cn = 0
-            
-            row_data = dict()
-            for cell in row:
-                if rn == 0:
-                    # on header row
-                    key = cell.lower().replace(' ', '_')
-                    headers.append(key)
-                    if key == 'scryfall_id':
-                        hit_scryfall_id = True
+            if len(row) == 0:
+                continue
+            if len(row) != len(columns):
+                raise DataConflictError("Unexpected format row {:d}: {!r}".format(rn, row))
+
+            card_data = dict()
+            for (field, parser), cell in zip(columns, row):
+                if field is not None:
+                    card_data[field] = parser(cell)
+            card = Card(**card_data)
+
+            if len(card.edition) != 3:
+                if card.edition in deckbox_edition_code_updates:
+                    card.edition = deckbox_edition_code_updates[card.edition]
                 else:
-                    col_name = headers[cn]
-                    parser = None
-                    if col_name not in deckbox_column_parsers:
-                        print("No parser defined for column {!r}; using str".format(col_name), file=sys.stderr)
-                        parser = str
-                    else:
-                        parser = deckbox_column_parsers[col_name]
-                    row_data[col_name] = parser(cell)
-                cn += 1
-
-            if rn == 0 and len(headers) > 0 and headers[0] != 'count':
-                raise DataConflictError("First column was expected to be 'count' but is {!r}; are you sure this is in deckbox format?".format(headers[0]))
-            if rn == 0 and not hit_scryfall_id:
-                print("No scryfall_id column found; this import will not be able to update scryfall_id values", file=sys.stderr)
-            if rn > 0 and 'scryfall_id' not in row_data and len(row_data) > 0:
-                row_data['scryfall_id'] = None
-                
-            if rn > 0 and len(row_data) > 0:
-                data.append(row_data)
-            
+                    raise DataConflictError("unaccounted-for non-3-len edition code row {:d}: {!r}".format(rn, card.edition))
+
+            if card.condition not in deckbox_condition_codes:
+                raise DataConflictError("unaccounted-for condition row {:d}: {!r}".format(rn, card.condition))
+            card.condition = deckbox_condition_codes[card.condition]
+
+            yield card
+
             rn += 1
-            if row_limit > 0 and rn > row_limit:
+            if row_limit > 0 and rn >= row_limit:
                 break
-    return data
+
+
+def _resolve_deckbox_columns(header: list[str]) -> list[tuple[str | None, Callable[[str], Any] | None]]:
+    """
+    Return the Card attribute and parser for each column in a deckbox CSV
+    header row. Columns that are not imported have None for both.
+    """
+    headers = [cell.lower().replace(' ', '_') for cell in header]
+
+    if len(headers) > 0 and headers[0] != 'count':
+        raise DataConflictError("First column was expected to be 'count' but is {!r}; are you sure this is in deckbox format?".format(headers[0]))
+    if 'scryfall_id' not in headers:
+        print("No scryfall_id column found; this import will not be able to update scryfall_id values", file=sys.stderr)
+
+    missing = [col for col in deckbox_column_parsers if col not in headers and col != 'scryfall_id']
+    if len(missing) > 0:
+        raise DataConflictError("Unexpected format; missing column(s): {:s}".format(', '.join(missing)))
+
+    columns = list()
+    for col_name in headers:
+        if col_name in deckbox_unused_columns:
+            columns.append((None, None))
+        elif col_name not in deckbox_column_parsers:
+            print("No parser defined for column {!r}; ignoring".format(col_name), file=sys.stderr)
+            columns.append((None, None))
+        else:
+            field = deckbox_to_mtgdb_columns.get(col_name, col_name)
+            columns.append((field, deckbox_column_parsers[col_name]))
+
+    return columns
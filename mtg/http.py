@@ -2,13 +2,23 @@
 Functions for working with HTTP and connections.
 """
 
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 import requests
+import requests.adapters
+import requests.structures
 import pickle
+import asyncio
 import concurrent.futures
+import functools
+import hashlib
+import json
 import logging
+import os
+import sqlite3
+import threading
 import time
+import email.utils
 import decimal
 
 from . import timer
@@ -18,6 +28,14 @@ _log = logging.getLogger(__name__)
 _log.setLevel(logging.DEBUG)
 
 
+# Bytes read at a time by download(). Large enough that per-chunk overhead is
+# negligible even for bulk data files of several hundred MB.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_CACHE_MAX_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_MAX_AGE = timedelta(days=90)
+
+
 default_agent_headers = {
 	"User-Agent": 'python-http-agent-by-dekarrin/1.0',
 	"Accept-Encoding": "deflate,gzip,identity",
@@ -42,18 +60,277 @@ def _log_http_response(resp, full):
 		_log.debug("Body: " + str(resp.content))
 
 
+def _retry_after_secs(resp):
+	"""
+	Return the number of seconds a response's Retry-After header asks to wait, or None if it has no usable one. The
+	header may give either a number of seconds or an HTTP date.
+	"""
+	value = resp.headers.get('Retry-After')
+	if value is None:
+		return None
+	value = value.strip()
+	if value.isdigit():
+		return float(value)
+	try:
+		when = email.utils.parsedate_to_datetime(value)
+	except (TypeError, ValueError):
+		return None
+	if when.tzinfo is None:
+		when = when.replace(tzinfo=timezone.utc)
+	return max((when - datetime.now(tz=timezone.utc)).total_seconds(), 0.0)
+
+
+# Response headers that are kept along with a cached response body. The body is
+# stored already decoded, so none that describe its encoding on the wire are.
+_cached_headers = ['Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Date']
+
+
+class CachedResponse(object):
+	"""
+	A response that was read from a ResponseCache.
+	"""
+
+	def __init__(self, url, status, headers, body, stored_at):
+		"""
+		:param url: The URL that the response is for.
+		:param status: The HTTP status code of the response.
+		:param headers: The headers kept from the response.
+		:param body: The body of the response.
+		:param stored_at: The time that the response was last fetched or confirmed to be current, as a unix timestamp.
+		"""
+		self.url = url
+		self.status = status
+		self.headers = requests.structures.CaseInsensitiveDict(headers)
+		self.body = body
+		self.stored_at = stored_at
+
+	def is_fresh(self, fresh_for):
+		"""
+		Return whether the response can be used without checking with the server that it is still current. That is for
+		as long as its Cache-Control max-age says, or for fresh_for if it does not give one.
+
+		:type fresh_for: ``timedelta``
+		"""
+		lifetime = fresh_for.total_seconds()
+		for directive in self.headers.get('Cache-Control', '').split(','):
+			directive = directive.strip().lower()
+			if directive in ('no-cache', 'no-store'):
+				return False
+			if directive.startswith('max-age='):
+				try:
+					lifetime = int(directive[len('max-age='):])
+				except ValueError:
+					pass
+		return time.time() - self.stored_at < lifetime
+
+	def conditional_headers(self):
+		"""
+		Return the headers that ask the server to send the response only if it has changed since this one.
+
+		:rtype: ``dict[str, str]``
+		"""
+		headers = {}
+		if 'ETag' in self.headers:
+			headers['If-None-Match'] = self.headers['ETag']
+		if 'Last-Modified' in self.headers:
+			headers['If-Modified-Since'] = self.headers['Last-Modified']
+		return headers
+
+	def to_response(self, req):
+		"""
+		Return this as a requests.Response to the given request.
+
+		:type req: ``requests.PreparedRequest``
+		:rtype: ``requests.Response``
+		"""
+		resp = requests.Response()
+		resp.status_code = self.status
+		resp.headers = requests.structures.CaseInsensitiveDict(self.headers)
+		resp._content = self.body
+		resp.url = self.url
+		resp.request = req
+		resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+		return resp
+
+
+class ResponseCache(object):
+	"""
+	Persistent cache of HTTP responses, kept in an SQLite file so that it lasts between runs. Each response is stored
+	with its ETag and Last-Modified headers so that, once it is no longer fresh, the server can be asked to send it
+	again only if it has changed. Responses that have not been confirmed current within max_age are dropped, as are
+	the least recently used ones whenever the cache grows past max_size bytes.
+
+	A cache may be used by several threads and agents at once. The file is not created until it is first needed. Any
+	error reading or writing it is logged and otherwise treated as a cache miss, so a broken cache never stops a
+	request from being sent.
+	"""
+
+	def __init__(self, path, max_size=DEFAULT_CACHE_MAX_SIZE, max_age=DEFAULT_CACHE_MAX_AGE, fresh_for=timedelta(0)):
+		"""
+		Create a new ResponseCache.
+		:param path: The file to keep the cache in. Its directory is created if needed.
+		:param max_size: The most bytes of response bodies to keep.
+		:param max_age: How long a response is kept after it was last fetched or confirmed to be current.
+		:param fresh_for: How long a response is used without checking with the server, for responses that do not say
+		themselves. By default they are always checked.
+		"""
+		self.path = path
+		self.max_size = max_size
+		self.max_age = max_age
+		self.fresh_for = fresh_for
+		self._con = None
+		self._size = 0
+		self._lock = threading.Lock()
+		self._warned = False
+
+	def get(self, url):
+		"""
+		Return the cached response for the given URL, or None if there is not one.
+
+		:rtype: ``CachedResponse | None``
+		"""
+		with self._lock:
+			try:
+				con = self._connect()
+				r = con.execute(_sql_cache_get, (url, time.time() - self.max_age.total_seconds())).fetchone()
+				if r is None:
+					return None
+				con.execute(_sql_cache_touch, (time.time(), url))
+				con.commit()
+			except sqlite3.Error as e:
+				self._warn("read", e)
+				return None
+		return CachedResponse(url, r[0], json.loads(r[1]), r[2], r[3])
+
+	def put(self, url, resp):
+		"""
+		Store a response for the given URL, replacing any that is already cached, unless it asks not to be stored.
+
+		:type resp: ``requests.Response``
+		"""
+		if 'no-store' in resp.headers.get('Cache-Control', '').lower():
+			return
+
+		headers = {k: resp.headers[k] for k in _cached_headers if k in resp.headers}
+		body = resp.content if resp.content is not None else b''
+		now = time.time()
+
+		with self._lock:
+			try:
+				con = self._connect()
+				old = con.execute(_sql_cache_get_size, (url,)).fetchone()
+				con.execute(_sql_cache_put, (url, resp.status_code, json.dumps(headers), len(body), body, now, now))
+				con.commit()
+				self._size += len(body) - (old[0] if old is not None else 0)
+				if self._size > self.max_size:
+					self._evict(con)
+			except sqlite3.Error as e:
+				self._warn("write", e)
+
+	def revalidated(self, url, resp):
+		"""
+		Record that the server confirmed with resp (a 304 response) that the cached response for the given URL is still
+		current, updating the validators and caching rules it was sent with.
+
+		:type resp: ``requests.Response``
+		"""
+		with self._lock:
+			try:
+				con = self._connect()
+				r = con.execute(_sql_cache_get_headers, (url,)).fetchone()
+				if r is None:
+					return
+				headers = json.loads(r[0])
+				headers.update({k: resp.headers[k] for k in _cached_headers if k in resp.headers and k != 'Content-Type'})
+				now = time.time()
+				con.execute(_sql_cache_revalidate, (json.dumps(headers), now, now, url))
+				con.commit()
+			except sqlite3.Error as e:
+				self._warn("write", e)
+
+	def evict(self):
+		"""
+		Drop every response that is past max_age, then the least recently used ones until the cache is no larger than
+		max_size.
+		"""
+		with self._lock:
+			try:
+				self._evict(self._connect())
+			except sqlite3.Error as e:
+				self._warn("write", e)
+
+	def clear(self):
+		"""
+		Drop every cached response.
+		"""
+		with self._lock:
+			try:
+				con = self._connect()
+				con.execute(_sql_cache_clear)
+				con.commit()
+				self._size = 0
+			except sqlite3.Error as e:
+				self._warn("write", e)
+
+	def close(self):
+		with self._lock:
+			if self._con is not None:
+				self._con.close()
+				self._con = None
+
+	def _warn(self, action, e):
+		# a cache that cannot be used fails the same way on every request; only say so once.
+		if self._warned:
+			_log.debug("Could not " + action + " HTTP cache " + self.path + ": " + str(e))
+			return
+		_log.warning("Could not " + action + " HTTP cache " + self.path + ": " + str(e))
+		self._warned = True
+
+	def _connect(self):
+		if self._con is None:
+			cache_dir = os.path.dirname(self.path)
+			if cache_dir != '':
+				try:
+					os.makedirs(cache_dir, exist_ok=True)
+				except OSError as e:
+					raise sqlite3.OperationalError("cannot create cache directory: " + str(e))
+			con = sqlite3.connect(self.path, check_same_thread=False)
+			con.execute('PRAGMA journal_mode = WAL')
+			con.execute(_sql_cache_create)
+			con.execute(_sql_cache_create_index)
+			con.commit()
+			self._size = con.execute(_sql_cache_total_size).fetchone()[0]
+			self._con = con
+			self._evict(con)
+		return self._con
+
+	def _evict(self, con):
+		con.execute(_sql_cache_delete_older, (time.time() - self.max_age.total_seconds(),))
+		self._size = con.execute(_sql_cache_total_size).fetchone()[0]
+
+		while self._size > self.max_size:
+			r = con.execute(_sql_cache_get_lru).fetchone()
+			if r is None:
+				break
+			con.execute(_sql_cache_delete, (r[0],))
+			self._size -= r[1]
+		con.commit()
+
+
 class AsyncHTTPError(Exception):
 	"""
 	Raised when at least one of the HTTP requests in an asynchronous group fails.
 	"""
-	def __init__(self, failed):
+	def __init__(self, failed, errors=None):
 		"""
 		Creates a new AsyncHTTPError.
 
 		:param failed: The indexes of the requests that failed.
+		:param errors: A map of the index of each request that failed to the exception that it failed with.
 		"""
-		super().__init__("One or more asynchronous HTTP requests failed: " + failed)
+		super().__init__("One or more asynchronous HTTP requests failed: " + ', '.join(str(i) for i in failed))
 		self.failed = failed
+		self.errors = errors if errors is not None else {}
 
 
 class HttpAgent(object):
@@ -72,7 +349,12 @@ class HttpAgent(object):
 			log_full_response: bool=True,
 			auth_func: Callable[[requests.PreparedRequest], requests.PreparedRequest] = lambda x: x.prepare(),
 			antiflood_secs: float=0,
-			headers: Optional[dict]=None
+			headers: Optional[dict]=None,
+			antiflood_burst: int=1,
+			rate_limiter: Optional[timer.RateLimiter]=None,
+			throttle_retries: int=3,
+			pool_size: int=requests.adapters.DEFAULT_POOLSIZE,
+			cache: Optional[ResponseCache]=None
 	):
 		"""
 		Create a new client.
@@ -100,11 +382,23 @@ class HttpAgent(object):
 		:param antiflood_secs: Number of seconds to wait between requests. Set to
 		<= 0 to disable anti-flood (the default). Can be fractional seconds
 		for milliseconds; e.g. 0.2 would be 200 milliseconds. This antiflood
-		protection only applies to synchronous requests; async requests are sent
-		as soon as possible.
+		protection applies to both synchronous and async requests, and is shared
+		between all threads using the agent.
 		:param headers: Headers to send in every request. If this is left unset, a global set of default headers
 		will be used. If this is set, keys in the global defaults that are not overridden in this dict will still be
 		used. Note that individual requests may still override these default headers.
+		:param antiflood_burst: Number of requests that may be sent at once without waiting after a quiet period, as
+		long as over time they average no more than one per antiflood_secs.
+		:param rate_limiter: Limiter to take a token from before each request. Give the same one to several agents to
+		have them share one rate limit. If given, antiflood_secs and antiflood_burst are ignored.
+		:param throttle_retries: Number of times to retry a request that the server answers with HTTP 429 (Too Many
+		Requests). Before each retry, the agent backs off for as long as the server's Retry-After header asks, and
+		slows down all further requests. If every retry is throttled as well, the 429 response is returned as-is.
+		:param pool_size: Number of connections to each host that are kept open between requests. Should be at least
+		the number of threads that send requests with the agent at once, or connections will be closed and reopened.
+		:param cache: Cache to serve GET requests from. Fresh cached responses are used without sending a request, and
+		stale ones are revalidated with the server so that the body is only sent again if it changed. Only requests
+		sent with request() use the cache.
 		"""
 		global default_agent_headers
 		
@@ -126,13 +420,13 @@ class HttpAgent(object):
 		self._log_full_request = log_full_request
 		self._log_full_response = log_full_response
 
-		self._antiflood_wait = lambda: None
-		self._antiflood_reset = lambda: None
-		if antiflood_secs > 0:
-			self._antiflood_timer = timer.WaitPeriodTimer(timedelta(seconds=antiflood_secs))
-			self._antiflood_timer.start()
-			self._antiflood_wait = self._antiflood_timer.next
-			self._antiflood_reset = self._antiflood_timer.reset
+		self._limiter = rate_limiter
+		if self._limiter is None and antiflood_secs > 0:
+			self._limiter = timer.RateLimiter(1 / antiflood_secs, burst=antiflood_burst)
+		self._throttle_retries = throttle_retries
+		self._pool_size = pool_size
+		self._cache = cache
+		self._session_lock = threading.Lock()
 
 		self._default_headers = dict(default_agent_headers)
 		self._default_headers.update(headers or {})
@@ -142,6 +436,16 @@ class HttpAgent(object):
 			self._session.close()
 		self._session = requests.Session()
 		self._session.headers.update(self._default_headers)
+		adapter = requests.adapters.HTTPAdapter(pool_maxsize=self._pool_size)
+		self._session.mount('http://', adapter)
+		self._session.mount('https://', adapter)
+
+	def _get_session(self):
+		# several threads may send their first request at the same time; only one of them should make the session.
+		with self._session_lock:
+			if self._session is None:
+				self.start_new_session()
+			return self._session
 
 	def add_async_request(
 			self,
@@ -199,84 +503,111 @@ class HttpAgent(object):
 		self._async_http_requests.clear()
 		return self
 
-	def send_async_requests(self):
+	def send_async_requests(self, on_result=None, on_error=None):
 		"""
 		Sends all HTTP requests that have been requested by calls to add_async(). Returns when all requests
 		have completed. Raises an exception if any of the calls fail, but waits until all are completed before doing so.
-		ANTIFLOOD IS NOT APPLIED.
+		Requests are started no faster than the rate limit allows, and each one is handled as soon as it completes, in
+		whatever order that happens.
+
+		:type on_result: ``(int, Any) -> None``
+		:param on_result: Called with the index of each request that succeeds and its response, transformed by its
+		transform function, as soon as that request completes.
+		:type on_error: ``(int, Exception) -> None``
+		:param on_error: Called with the index of each request that fails and the exception it failed with, as soon as
+		that request completes.
 		:rtype: ``list[Any]`` A list of the requested items, transformed by their transform function.
 		:return:
 		"""
 		if len(self._async_http_requests) <= 0:
 			return ()
 
-		if self._session is None:
-			self.start_new_session()
-		session = self._session
+		session = self._get_session()
+
+		requests_to_send = self._async_http_requests
+		transforms = self._async_transforms
+		self._async_http_requests = []
+		self._async_transforms = []
 
-		responses = [None] * len(self._async_http_requests)
-		":type : list"
+		futures = {}
+		":type : dict[concurrent.futures.Future, int]"
 
-		futures = []
-		
-		for req, uri, host, auth, decode, ignored in self._async_http_requests:
+		for idx, (req, uri, host, auth, decode, ignored) in enumerate(requests_to_send):
 			if host is None:
 				host = self._host
-			_log_http_request(req, uri, host, auth, self.log_full_request)
-			f = self._async_executor.submit(session.send, req)
-			# mini data-structure, Tuple[done_yet, future]
-			futures.append((False, f, decode, ignored))
-		self._async_http_requests = []
+			f = self._async_executor.submit(self._send_async, session, req, uri, host, auth)
+			futures[f] = idx
+
+		transformed = [None] * len(requests_to_send)
+		errors = {}
+
+		for f in concurrent.futures.as_completed(futures):
+			idx = futures[f]
+			_, _, _, _, decode, ignored = requests_to_send[idx]
+			try:
+				r = f.result()
+				_log_http_response(r, self.log_full_response)
+				if r.status_code not in ignored:
+					r.raise_for_status()
+				transformed[idx] = self._decode_response(r, decode, transforms[idx])
+			except Exception as e:
+				_log.exception("Error in request #" + str(idx) + ": " + str(e))
+				errors[idx] = e
+				if on_error is not None:
+					on_error(idx, e)
+			else:
+				if on_result is not None:
+					on_result(idx, transformed[idx])
+
+		if len(errors) > 0:
+			raise AsyncHTTPError(sorted(errors.keys()), errors)
 
-		# now wait for them to complete
-		while len([x for x in futures if not x[0]]) > 0:
-			next_futures = []
-			for idx, f in enumerate(futures):
-				done_now = f[0]
-				if not done_now:
-					if f[1].done():
-						r = f[1].result()
-						_log_http_response(r, self.log_full_response)
-						responses[idx] = (r, f[2], f[3])
-						done_now = True
-				next_futures.append((done_now, f[1], f[2], f[3]))
-			futures = next_futures
-			time.sleep(0.01)
-		# they are now done
-
-		# we need to re-raise any exceptions that occur
-		bad_responses = []
-		for idx, resp_items in enumerate(responses):
-			resp, decode, ignored = resp_items
-			if resp.status_code not in ignored:
-				try:
-					resp.raise_for_status()
-				except requests.HTTPError as e:
-					_log.exception("HTTPError in request #" + str(idx) + ": " + str(e))
-					bad_responses.append(idx)
-		if len(bad_responses) > 0:
-			self._async_transforms = []
-			raise AsyncHTTPError(bad_responses)
-
-		# finally, call the transform function on each one
-		transformed = []
-		for r_items, xform in zip(responses, self._async_transforms):
-			r, decode, ignored = r_items
-			data = None
-			if r.content is not None:
-				if decode == 'text':
-					data = r.text
-				elif decode == 'json':
-					data = r.json(parse_float=decimal.Decimal)
-				elif decode == 'binary':
-					data = r.content
-				else:
-					raise ValueError("Bad response_payload encoding: " + decode)
-				data = xform(data)
-			transformed.append(data)
-		self._async_transforms = []
 		return transformed
 
+	def _send_async(self, session, req, uri, host, auth):
+		_log_http_request(req, uri, host, auth, self.log_full_request)
+		return self._send(session, req)
+
+	def _send(self, session, req):
+		"""
+		Send a prepared request once the rate limit allows it, retrying it if the server says that it is being sent too
+		quickly.
+		"""
+		retries = 0
+		while True:
+			if self._limiter is not None:
+				self._limiter.acquire()
+			resp = session.send(req)
+
+			if resp.status_code != 429:
+				if self._limiter is not None:
+					self._limiter.succeeded()
+				return resp
+
+			if retries >= self._throttle_retries:
+				return resp
+			retries += 1
+
+			retry_after = _retry_after_secs(resp)
+			_log.warning("Request to " + req.url + " was throttled; retrying (" + str(retries) + " of " + str(self._throttle_retries) + ")")
+			if self._limiter is not None:
+				self._limiter.backoff(retry_after)
+			else:
+				time.sleep(retry_after if retry_after is not None else 1)
+
+	def _decode_response(self, resp, decode, xform):
+		if resp.content is None:
+			return None
+		if decode == 'text':
+			data = resp.text
+		elif decode == 'json':
+			data = resp.json(parse_float=decimal.Decimal)
+		elif decode == 'binary':
+			data = resp.content
+		else:
+			raise ValueError("Bad response_payload encoding: " + decode)
+		return xform(data)
+
 	def request(self,
 			method: str, uri: str, host: Optional[str]=None,
 			query: Optional[Dict[str, Any]]=None,
@@ -312,29 +643,33 @@ class HttpAgent(object):
 		prepared = self._prepare_http_request(method, uri, host, query, payload, headers, auth, encode_payload, use_ssl)
 		if host is None:
 			host = self._host
-		_log_http_request(prepared, uri, host, auth, self.log_full_request)
 
-		if self._session is None:
-			self.start_new_session()
-		sess = self._session
+		sess = self._get_session()
+
+		cached = None
+		if self._cache is not None and prepared.method == 'GET':
+			cached = self._cache.get(prepared.url)
 
-		self._antiflood_wait()
-		resp = sess.send(prepared)
-		self._antiflood_reset()
-		_log_http_response(resp, self.log_full_response)
+		if cached is not None and cached.is_fresh(self._cache.fresh_for):
+			_log.debug("Using cached response for " + prepared.url)
+			resp = cached.to_response(prepared)
+		else:
+			if cached is not None:
+				prepared.headers.update(cached.conditional_headers())
+			_log_http_request(prepared, uri, host, auth, self.log_full_request)
+			resp = self._send(sess, prepared)
+			_log_http_response(resp, self.log_full_response)
+
+			if cached is not None and resp.status_code == 304:
+				_log.debug("Cached response for " + prepared.url + " is still current")
+				self._cache.revalidated(prepared.url, resp)
+				resp = cached.to_response(prepared)
+			elif self._cache is not None and prepared.method == 'GET' and resp.status_code == 200:
+				self._cache.put(prepared.url, resp)
 
 		if resp.status_code not in ignored_errors:
 			resp.raise_for_status()  # raise if an error occured (will only raise if the status code is 4XX or 5XX)
-		resp_data = None
-		if resp.content is not None:
-			if decode_payload == 'text':
-				resp_data = resp.text
-			elif decode_payload == 'json':
-				resp_data = resp.json(parse_float=decimal.Decimal)
-			elif decode_payload == 'binary':
-				resp_data = resp.content
-			else:
-				raise ValueError("Bad response_payload encoding: " + decode_payload)
+		resp_data = self._decode_response(resp, decode_payload, lambda x: x)
 		return resp.status_code, resp_data
 
 	def save_cookies(self, filename):
@@ -396,6 +731,27 @@ class HttpAgent(object):
 		"""
 		self._log_full_response = value
 
+	@property
+	def cache(self):
+		"""
+		:rtype: ResponseCache | None
+		"""
+		return self._cache
+
+	@cache.setter
+	def cache(self, value):
+		"""
+		:type value: ResponseCache | None
+		"""
+		self._cache = value
+
+	@property
+	def rate_limiter(self):
+		"""
+		:rtype: timer.RateLimiter | None
+		"""
+		return self._limiter
+
 	@property
 	def ssl(self):
 		"""
@@ -510,21 +866,264 @@ class HttpAgent(object):
 			prepared = req.prepare()
 		return prepared
 
-def download(url: str) -> bytes:
+class AsyncHttpAgent(object):
+	"""
+	Sends requests with an HttpAgent from asyncio code. Each request runs on one of a fixed number of worker threads,
+	so up to that many can be in flight at once without blocking the event loop, while any more wait their turn. The
+	requests are subject to the agent's rate limit as usual, and its session keeps their connections alive between
+	requests.
+	"""
+
+	def __init__(self, agent: HttpAgent, max_in_flight: int=8):
+		"""
+		Create a new async client.
+		:param agent: The agent that sends the requests. Its pool_size should be at least max_in_flight.
+		:param max_in_flight: The most requests that will be sent at once.
+		"""
+		if max_in_flight < 1:
+			raise ValueError("max_in_flight must be at least 1")
+		self._agent = agent
+		self._max_in_flight = max_in_flight
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='async-http')
+
+		# the session is created lazily by request(); do it now so that worker threads do not race to make it.
+		agent.start_new_session()
+
+	@property
+	def agent(self):
+		"""
+		:rtype: HttpAgent
+		"""
+		return self._agent
+
+	@property
+	def max_in_flight(self):
+		"""
+		:rtype: int
+		"""
+		return self._max_in_flight
+
+	async def request(self,
+			method: str, uri: str, host: Optional[str]=None,
+			query: Optional[Dict[str, Any]]=None,
+			payload: Optional[Union[Dict[str, Any], Sequence[Any]]]=None,
+			headers: Optional[dict]=None,
+			auth: bool=False, **kwargs
+		) -> Tuple[int, Optional[Union[Dict[str, Any], List[Any]]]]:
+		"""
+		Send an HTTP request and wait for its response without blocking the event loop. Takes the same parameters and
+		returns the same thing as HttpAgent.request.
+		"""
+		loop = asyncio.get_running_loop()
+		send = functools.partial(self._agent.request, method, uri, host=host, query=query, payload=payload, headers=headers, auth=auth, **kwargs)
+		return await loop.run_in_executor(self._executor, send)
+
+	def close(self):
+		"""
+		Stop the worker threads once any requests still in flight complete.
+		"""
+		self._executor.shutdown(wait=False)
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc_value, tb):
+		self.close()
+
+
+def download(url, dest=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None, resume=False, checksum=None, headers=None):
 	"""
 	Download a file from the internet using a GET request. If it fails for any
 	reason, an exception is raised. For more complicated behavior, use an
 	HttpAgent object.
 
-	Returns the bytes of the downloaded object.
+	The body is streamed to dest as it arrives, so only chunk_size bytes of it
+	are held in memory at once.
+
+	:param url: The URL to download.
+	:param dest: Where to put the body. May be the path of a file to write, an
+	open binary file or other object with a write() method, a bytearray to
+	append to, or a writable memoryview to fill from the start. If not given,
+	the body is returned as bytes.
+	:param chunk_size: The most bytes read from the connection at a time.
+	:param progress: Called after each chunk with the number of bytes
+	downloaded so far and the total size of the file, or None if the server
+	did not say.
+	:param resume: If dest is a path to a partly downloaded file, ask the server
+	for only the rest of it and append that. If the server does not support
+	this, the file is downloaded again from the start.
+	:param checksum: Expected digest of the whole file, as the name of a
+	hashlib algorithm and the hex digest, separated by a colon; e.g.
+	'sha256:9f86d0...'. If the file does not match, ValueError is raised, and
+	if dest is a path, the file is removed.
+	:param headers: Extra headers to send with the request.
+	:return: The bytes of the downloaded object if dest is not given, otherwise
+	the total number of bytes in the file.
 	"""
-	resp = requests.get(url, stream=True)
-
-	if not resp.ok:
-		raise ValueError("problem with download: {:s}".format(str(resp)))
-
-	all_data = b''
-	for block in resp.iter_content(1024):
-		all_data += block
-	
-	return all_data
\ No newline at end of file
+	hasher = None
+	expected_digest = None
+	if checksum is not None:
+		algo, _, expected_digest = checksum.partition(':')
+		if expected_digest == '':
+			raise ValueError("checksum must be in the form 'algorithm:hexdigest'")
+		hasher = hashlib.new(algo.strip().lower())
+		expected_digest = expected_digest.strip().lower()
+
+	req_headers = dict(headers or {})
+	offset = 0
+	path = dest if isinstance(dest, (str, os.PathLike)) else None
+	if path is not None and resume and os.path.exists(path):
+		offset = os.path.getsize(path)
+		if offset > 0:
+			req_headers['Range'] = 'bytes=' + str(offset) + '-'
+			# ranges count bytes on the wire, so the file on disk only lines up with them if it is sent unencoded.
+			req_headers['Accept-Encoding'] = 'identity'
+
+	resp = requests.get(url, stream=True, headers=req_headers)
+	try:
+		if offset > 0 and resp.status_code == 416:
+			# there is nothing past what we already have
+			total = offset
+			resp.close()
+			_hash_file(path, hasher)
+			_verify_download(hasher, expected_digest, path)
+			if progress is not None:
+				progress(total, total)
+			return total
+
+		if not resp.ok:
+			raise ValueError("problem with download: {:s}".format(str(resp)))
+
+		if offset > 0 and resp.status_code != 206:
+			_log.debug("Server did not honor range request for " + url + "; downloading from the start")
+			offset = 0
+
+		total = None
+		if 'Content-Length' in resp.headers and 'Content-Encoding' not in resp.headers:
+			total = offset + int(resp.headers['Content-Length'])
+
+		if path is not None:
+			if offset > 0:
+				_hash_file(path, hasher)
+			with open(path, 'ab' if offset > 0 else 'wb') as fp:
+				done = _stream_body(resp, fp.write, offset, total, chunk_size, progress, hasher)
+			_verify_download(hasher, expected_digest, path)
+			return done
+
+		if dest is None:
+			buf = bytearray()
+			_stream_body(resp, buf.extend, 0, total, chunk_size, progress, hasher)
+			_verify_download(hasher, expected_digest, None)
+			return bytes(buf)
+
+		if isinstance(dest, bytearray):
+			write = dest.extend
+		elif isinstance(dest, memoryview):
+			view = dest.cast('B')
+			pos = 0
+
+			def write(block):
+				nonlocal pos
+				if pos + len(block) > len(view):
+					raise ValueError("download is larger than the {:d} bytes of the buffer".format(len(view)))
+				view[pos:pos + len(block)] = block
+				pos += len(block)
+		else:
+			write = dest.write
+
+		done = _stream_body(resp, write, 0, total, chunk_size, progress, hasher)
+		_verify_download(hasher, expected_digest, None)
+		return done
+	finally:
+		resp.close()
+
+
+def _stream_body(resp, write, done, total, chunk_size, progress, hasher):
+	for block in resp.iter_content(chunk_size):
+		write(block)
+		if hasher is not None:
+			hasher.update(block)
+		done += len(block)
+		if progress is not None:
+			progress(done, total)
+	return done
+
+
+def _hash_file(path, hasher):
+	if hasher is None:
+		return
+	with open(path, 'rb') as fp:
+		for block in iter(lambda: fp.read(DOWNLOAD_CHUNK_SIZE), b''):
+			hasher.update(block)
+
+
+def _verify_download(hasher, expected_digest, path):
+	if hasher is None:
+		return
+	actual = hasher.hexdigest()
+	if actual != expected_digest:
+		if path is not None:
+			os.remove(path)
+		raise ValueError("downloaded file has {:s} digest {:s}, expected {:s}".format(hasher.name, actual, expected_digest))
+
+
+_sql_cache_create = '''
+CREATE TABLE IF NOT EXISTS "responses" (
+	"url"          TEXT NOT NULL,
+	"status"       INTEGER NOT NULL,
+	"headers"      TEXT NOT NULL,
+	"size"         INTEGER NOT NULL,
+	"body"         BLOB NOT NULL,
+	"stored_at"    REAL NOT NULL,
+	"used_at"      REAL NOT NULL,
+	PRIMARY KEY("url")
+);
+'''
+
+_sql_cache_create_index = '''
+CREATE INDEX IF NOT EXISTS "idx_responses_used_at" ON "responses" ("used_at");
+'''
+
+_sql_cache_get = '''
+SELECT status, headers, body, stored_at FROM responses WHERE url = ? AND stored_at >= ?;
+'''
+
+_sql_cache_get_size = '''
+SELECT size FROM responses WHERE url = ?;
+'''
+
+_sql_cache_get_headers = '''
+SELECT headers FROM responses WHERE url = ?;
+'''
+
+_sql_cache_touch = '''
+UPDATE responses SET used_at = ? WHERE url = ?;
+'''
+
+_sql_cache_put = '''
+INSERT OR REPLACE INTO responses (url, status, headers, size, body, stored_at, used_at) VALUES (?, ?, ?, ?, ?, ?, ?);
+'''
+
+_sql_cache_revalidate = '''
+UPDATE responses SET headers = ?, stored_at = ?, used_at = ? WHERE url = ?;
+'''
+
+_sql_cache_total_size = '''
+SELECT COALESCE(SUM(size), 0) FROM responses;
+'''
+
+_sql_cache_get_lru = '''
+SELECT url, size FROM responses ORDER BY used_at LIMIT 1;
+'''
+
+_sql_cache_delete = '''
+DELETE FROM responses WHERE url = ?;
+'''
+
+_sql_cache_delete_older = '''
+DELETE FROM responses WHERE stored_at < ?;
+'''
+
+_sql_cache_clear = '''
+DELETE FROM responses;
+'''
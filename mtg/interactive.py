@@ -6,6 +6,8 @@ import os.path
 import sys
 import datetime
 import time
+import threading
+import concurrent.futures
 
 if os.name != 'nt':
     # IMPORTING HAS SIDE EFFECTS; DO NOT REMOVE
@@ -17,6 +19,7 @@ import textwrap
 
 import traceback
 
+from collections import OrderedDict
 from typing import Optional, Any, Tuple, Callable
 
 from .types import Deck, DeckCard, Card, CardWithUsage, ScryfallCardData, Config, deck_state_to_name, parse_cardnum, card_condition_to_name
@@ -27,7 +30,8 @@ from . import deckbox as deckboxops
 from . import scryfall as scryfallops
 from . import maint
 from .errors import DataConflictError, UserCancelledError
-from .db import schema, deckdb, carddb, configdb, DBError, NotFoundError, DBOpenError
+from .db import schema, deckdb, carddb, configdb, scryfalldb, DBError, NotFoundError, DBOpenError
+from .db import util as dbutil
 
 
 class DataSiblingSwapper:
@@ -77,9 +81,196 @@ class DataSiblingSwapper:
         return "DataSiblingSwapper(getter={:s}, pos={!r}, ids={!r})".format("None" if self.getter is None else "(SET)", self.pos, self.all_ids)
 
 
+# Number of cards on either side of the one being viewed whose data is fetched
+# in the background while paging through them.
+SIBLING_PREFETCH_COUNT = 3
+
+# Most seconds to wait for a background fetch of the card being viewed to
+# finish before fetching it directly instead.
+SIBLING_PREFETCH_WAIT_SECS = 15
+
+# Most seconds to wait on closing a session for a running cache warmer to store
+# what it has already downloaded.
+CACHE_WARMER_STOP_WAIT_SECS = 30
+
+
+class CardDataCache:
+    """
+    Keeps the inventory cards and scryfall data most recently viewed in a
+    session so that paging back and forth between cards does not go to the DB
+    or to scryfall for each one again. Both are bounded; the least recently
+    used entries are dropped first. prefetch() fetches the data of cards that
+    are likely to be viewed next on a background thread.
+    """
+
+    def __init__(self, db_filename: str, max_entries: int=256, logger: elog.Logger | None=None):
+        self.db_filename = db_filename
+        self.max_entries = max_entries
+        self.log = logger or elog.get(__name__)
+        self._cards: OrderedDict[int, CardWithUsage] = OrderedDict()
+        self._scryfall: OrderedDict[str, ScryfallCardData] = OrderedDict()
+        self._pending: dict[int, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._closing = threading.Event()
+
+    def forget_cards(self):
+        """
+        Drop every cached card, but not its scryfall data, so that cards are
+        read from the DB again the next time they are needed. Call when they
+        may have changed since they were cached.
+        """
+        with self._lock:
+            self._cards.clear()
+
+    def get_card(self, card: Card) -> CardWithUsage:
+        """
+        Return the given card with its usage, reading it from the DB only if it
+        is not already cached.
+        """
+        if isinstance(card, CardWithUsage):
+            self._put(self._cards, card.id, card)
+            return card
+
+        self._wait_for(card.id)
+        cached = self._get(self._cards, card.id)
+        if cached is None:
+            cached = carddb.get_one(self.db_filename, card.id)
+            self._put(self._cards, card.id, cached)
+        return cached
+
+    def get_scryfall_data(self, card: Card) -> ScryfallCardData | None:
+        """
+        Return the cached scryfall data for the given card, or None if it has
+        none. If the card is being fetched in the background, this waits for
+        that to finish first.
+        """
+        self._wait_for(card.id)
+        if card.scryfall_id is None:
+            return None
+        return self._get(self._scryfall, card.scryfall_id)
+
+    def put_scryfall_data(self, data: ScryfallCardData):
+        self._put(self._scryfall, data.id, data)
+
+    def prefetch(self, cards: list[Card]):
+        """
+        Start fetching the data of each of the given cards that is not already
+        cached on a background thread, in the order given.
+        """
+        with self._lock:
+            todo = []
+            for c in cards:
+                if c.id in self._pending:
+                    continue
+                if c.scryfall_id is not None and c.scryfall_id in self._scryfall and (isinstance(c, CardWithUsage) or c.id in self._cards):
+                    continue
+                todo.append(c)
+            if len(todo) == 0:
+                return
+
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='card-prefetch')
+            f = self._executor.submit(self._fetch, todo)
+            for c in todo:
+                self._pending[c.id] = f
+
+        f.add_done_callback(lambda done: self._finish(done, todo))
+
+    def close(self):
+        """
+        Stop fetching in the background. Fetches that have not started yet are
+        dropped, and the one in progress stops after the card it is on. This
+        waits for it to do so, as it may be writing to the DB, which must not
+        happen after the caller releases its connections.
+        """
+        self._closing.set()
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch(self, cards: list[Card]):
+        try:
+            # anything already in the DB is read in one go; only what is
+            # missing or expired goes to scryfall, one card at a time.
+            need_ids = [c.id for c in cards if not isinstance(c, CardWithUsage) and self._get(self._cards, c.id) is None]
+            read = carddb.get_many(self.db_filename, need_ids) if len(need_ids) > 0 else {}
+
+            full_cards: list[CardWithUsage] = []
+            for c in cards:
+                if not isinstance(c, CardWithUsage):
+                    c = read.get(c.id) or self._get(self._cards, c.id)
+                    if c is None:
+                        continue
+                    self._put(self._cards, c.id, c)
+                full_cards.append(c)
+
+            need_sids = [c.scryfall_id for c in full_cards if c.scryfall_id is not None and self._get(self._scryfall, c.scryfall_id) is None]
+            stored = scryfalldb.get_many(self.db_filename, need_sids) if len(need_sids) > 0 else {}
+
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            expire_age = datetime.timedelta(days=carddb.DEFAULT_EXPIRE_DAYS)
+            for c in full_cards:
+                if self._closing.is_set():
+                    return
+                if c.scryfall_id is not None and self._get(self._scryfall, c.scryfall_id) is not None:
+                    continue
+
+                data = stored.get(c.scryfall_id) if c.scryfall_id is not None else None
+                if data is None or now - data.last_updated > expire_age:
+                    try:
+                        data = scryfallops.get_card_data(self.db_filename, c)
+                    except Exception:
+                        # it is fetched again, with errors shown, if it is viewed
+                        self.log.debug("Could not prefetch scryfall data for %s", c.cardnum, exc_info=True)
+                        continue
+
+                if c.scryfall_id is None:
+                    c.scryfall_id = data.id
+                self.put_scryfall_data(data)
+        except Exception:
+            self.log.warning("Prefetching card data failed", exc_info=True)
+
+    def _finish(self, f: concurrent.futures.Future, cards: list[Card]):
+        with self._lock:
+            for c in cards:
+                if self._pending.get(c.id) is f:
+                    del self._pending[c.id]
+
+    def _wait_for(self, card_id: int):
+        with self._lock:
+            f = self._pending.get(card_id)
+        if f is None:
+            return
+        try:
+            f.result(timeout=SIBLING_PREFETCH_WAIT_SECS)
+        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+            pass
+
+    def _get(self, entries: OrderedDict, key):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def _put(self, entries: OrderedDict, key, value):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+
 class Session:
     def __init__(self, db_filename: str):
         self.db_filename: str = db_filename
+        self.db_pool: dbutil.ConnectionPool = dbutil.open_pool(db_filename)
+        self.card_data_cache: CardDataCache = CardDataCache(db_filename)
+        self.cache_warmer: maint.CacheWarmer | None = None
         self.running: bool = True
         self.deck_cat_state: Optional[cio.CatState] = None
         self.inven_cat_state: Optional[cio.CatState] = None
@@ -97,6 +288,41 @@ class Session:
             self.config = Config()
             self.config_from_db = False
 
+    def use_db(self, db_filename: str):
+        """
+        Switch the session to a different DB file, moving its connection pool
+        over to the new file and reloading config from it. A cache warmer
+        running on the old file is stopped.
+        """
+        self.stop_cache_warmer()
+        old_pool = self.db_pool
+        self.card_data_cache.close()
+        self.db_filename = db_filename
+        self.db_pool = dbutil.open_pool(db_filename)
+        self.card_data_cache = CardDataCache(db_filename, logger=self.log)
+        old_pool.close()
+        self.load_config_from_db()
+
+    def close(self):
+        """
+        Release the DB connections held by the session.
+        """
+        self.stop_cache_warmer()
+        self.card_data_cache.close()
+        self.db_pool.close()
+
+    def stop_cache_warmer(self):
+        """
+        Stop the background cache warmer if it is running, waiting a short while
+        for it to store what it has already fetched.
+        """
+        if self.cache_warmer is None:
+            return
+        self.cache_warmer.stop()
+        if not self.cache_warmer.join(CACHE_WARMER_STOP_WAIT_SECS):
+            self.log.warning("Cache warmer did not finish storing data before the session closed")
+        self.cache_warmer = None
+
 
 def create_sibling_swapper_from_cat_select(s: Session, r: cio.CatResult, per_page: int=10, logger: elog.Logger | None=None) -> DataSiblingSwapper:
     """
@@ -120,34 +346,61 @@ def create_sibling_swapper_from_cat_select(s: Session, r: cio.CatResult, per_pag
 
     cur_pos = (r.state.page_num * per_page) + matched_idx
     
-    filtered_items: list[Card] = [x[0] for x in r.filtered_items]
+    # for a paged catalog this fetches pages from the DB only as they are
+    # needed, so it is not turned into a list of cards up front.
+    filtered_items = r.filtered_items
 
     # verify that cur_pos is the correct one
-    if filtered_items[cur_pos].id != card.id:
+    if filtered_items[cur_pos][0].id != card.id:
         raise ValueError("Card not found in filtered items")
 
-    # TODO: cache the data so scryfall retrieve does not require hitting the DB
+    # cards in this listing may have been changed since they were last viewed;
+    # their scryfall data is still good.
+    cache = s.card_data_cache
+    cache.forget_cards()
+
+    def prefetch_around(i: int):
+        # nearest first, as those are the ones most likely to be viewed next
+        near = []
+        for dist in range(1, SIBLING_PREFETCH_COUNT + 1):
+            for j in (i + dist, i - dist):
+                if 0 <= j < len(filtered_items):
+                    near.append(filtered_items[j][0])
+        cache.prefetch(near)
+
     def get_item(i: int) -> tuple[CardWithUsage, ScryfallCardData]:
-        c = filtered_items[i]
-        if not isinstance(c, CardWithUsage):
-            c = carddb.get_one(s.db_filename, c.id)
+        c = cache.get_card(filtered_items[i][0])
+        prefetch_around(i)
+
+        scryfall_data = cache.get_scryfall_data(c)
+        if scryfall_data is None:
+            scryfall_data = retrieve_scryfall_data(s, c)
+            if scryfall_data is None:
+                logger.error("could not retrieve card data from Scryfall")
+                print("ERROR: could not retrieve card data from Scryfall")
+                return None, None
+            cache.put_scryfall_data(scryfall_data)
 
-        scryfall_data = retrieve_scryfall_data(s, c)
         if c.scryfall_id is None:
             c.scryfall_id = scryfall_data.id
-        if scryfall_data is None:
-            logger.error("could not retrieve card data from Scryfall")
-            print("ERROR: could not retrieve card data from Scryfall")
-            return None, None
         return c, scryfall_data
     
-    sibling_swapper = DataSiblingSwapper(list(range(len(filtered_items))), cur_pos, get_item)
+    prefetch_around(cur_pos)
+
+    sibling_swapper = DataSiblingSwapper(range(len(filtered_items)), cur_pos, get_item)
     return sibling_swapper
 
 
 def start(db_filename, alt_buffer: bool=True):
     s = Session(db_filename)
 
+    try:
+        run_session(s, alt_buffer)
+    finally:
+        s.close()
+
+
+def run_session(s: Session, alt_buffer: bool=True):
     try:
         warn_mintty()
     except KeyboardInterrupt:
@@ -283,8 +536,7 @@ def change_db(s: Session):
         logger.error("new DB filename is empty; not updating")
         return
 
-    s.db_filename = new_name
-    s.load_config_from_db()
+    s.use_db(new_name)
     print("Now using database file {:s}".format(s.db_filename))
 
 
@@ -309,6 +561,31 @@ def do_init(s: Session) -> bool:
     return True
 
 
+def do_migrate(s: Session):
+    logger = s.log.with_fields(action='migrate')
+
+    current = schema.get_version(s.db_filename)
+    latest = schema.latest_version()
+
+    rerun = False
+    if current >= latest:
+        print("Database schema is up to date (version {:d})".format(current))
+        if not cio.confirm("Re-apply all migrations anyways?", default=False):
+            return
+        rerun = True
+    else:
+        print("Database schema will be upgraded from version {:d} to {:d}".format(current, latest))
+        if not cio.confirm("Continue?"):
+            logger.info("Action canceled: user declined confirmation prompt")
+            return
+
+    results = schema.migrate(s.db_filename, rerun=rerun, log=logger)
+    for r in results:
+        print("Applied migration {:s}".format(str(r)))
+    print("Done! Database is at schema version {:d}".format(schema.get_version(s.db_filename)))
+    cio.pause()
+
+
 def settings_menu(s: Session):
     logger = s.log.with_fields(menu='settings')
 
@@ -397,9 +674,12 @@ def db_fixes_menu(s: Session):
 
     fix_actions = [
         ('init', 'Initialize the database file ({:s})'.format(s.db_filename)),
+        ('migrate', 'Upgrade the database schema'),
         ('dedupe', 'Deduplicate inventory entries'),
         ('clear-scryfall', 'Clear all scryfall data'),
-        ('download-all-scryfall', 'Download missing and expired scryfall data')
+        ('download-all-scryfall', 'Download missing and expired scryfall data'),
+        ('import-scryfall-bulk', 'Import scryfall data from a bulk data file'),
+        ('warm-cache', 'Download scryfall data in the background'),
     ]
 
     letter_items = [
@@ -421,12 +701,18 @@ def db_fixes_menu(s: Session):
             logger.info("Initialized database")
 
             cio.pause()
+        elif action == 'migrate':
+            do_migrate(s)
         elif action == 'dedupe':
             fix_duplicate_inventory_entires(s)
         elif action == 'clear-scryfall':
             clear_scryfall_cache(s)
         elif action == 'download-all-scryfall':
             complete_scryfall_cache(s)
+        elif action == 'import-scryfall-bulk':
+            import_scryfall_bulk_file(s)
+        elif action == 'warm-cache':
+            cache_warmer_menu(s)
         elif action == 'exit':
             break
         else:
@@ -447,30 +733,20 @@ def cards_master_menu(s: Session):
     filters = card_cat_filters(with_usage=True, with_scryfall_fetch=True)
 
     
-    def fetch(filters: dict[str, str]) -> list[Tuple[CardWithUsage, str]]:
-        types = None
-
-        for k in filters:
-            if k.upper() == 'TYPE':
-                types = filters[k].split(',')
-
-        cards = carddb.find(s.db_filename, None, None, None, types)
-        cards = sorted(cards, key=lambda c: (c.edition, c.tcg_num))
+    def fetch(filters: dict[str, str], per_page: int, after: Tuple[str, int, int] | None) -> cio.CatPage:
+        cards, total = carddb.find_page(s.db_filename, None, None, None, catalog=filters, per_page=per_page, after=after)
         cat_items = [(c, "{:d}x {:s}".format(c.count, str(c))) for c in cards]
-        return cat_items
+        next_cursor = carddb.page_cursor(cards[-1]) if len(cards) > 0 else None
+        return cio.CatPage(cat_items, total, next_cursor)
     
 
     while True:
         logger.debug("Entered menu")
 
-        # TODO: since we have deferred fetch to inside the catalog, there is
-        # likely a more efficient db call that gets us just the count.
-        cards = carddb.get_all(s.db_filename)
-        total = sum([c.count for c in cards])
-        wl_total = sum([sum([u.wishlist_count for u in c.usage]) for c in cards])
+        totals = carddb.get_totals(s.db_filename, s.config.deck_used_states)
         
-        menu_title = "MANAGE CARDS - {:d} owned, {:d} WL".format(total, wl_total)
-        selection = cio.catalog_select(menu_title, items=fetch, extra_options=extra_actions, include_create=False, filters=filters, state=s.inven_cat_state)
+        menu_title = "MANAGE CARDS - {:d} owned, {:d} free, {:d} WL".format(totals.owned, totals.free, totals.wishlisted)
+        selection = cio.catalog_select(menu_title, items=fetch, extra_options=extra_actions, include_create=False, filters=filters, state=s.inven_cat_state, paged=True)
 
         action = selection[0]
         card: CardWithUsage = selection[1]
@@ -1013,7 +1289,7 @@ def card_large_view(c: CardWithUsage, scryfall_data: ScryfallCardData, subboxes=
             c, scryfall_data = siblings.get()
             if c is None or scryfall_data is None:
                 cio.pause()
-                siblings.next()
+                siblings.prev()
                 c, scryfall_data = last_c, last_data
         
         elif action == 'X':
@@ -1482,12 +1758,7 @@ def deck_cards_menu(s: Session, deck: Deck) -> Deck:
     filters = card_cat_filters(with_usage=False, with_scryfall_fetch=True)
 
     def fetch(filters: dict[str, str]) -> list[Tuple[DeckCard, str]]:
-        types = None
-
-        for k in filters:
-            if k.upper() == 'TYPE':
-                types = filters[k].split(',')
-        cards = deckdb.find_cards(s.db_filename, deck.id, None, None, None, types)
+        cards = deckdb.find_cards(s.db_filename, deck.id, None, None, None, catalog=filters)
         cards.sort(key=lambda c: (c.name, c.tcg_num))
 
         cat_items = []
@@ -1643,13 +1914,7 @@ def deck_detail_wishlist(s: Session, deck: Deck) -> Deck:
     filters = card_cat_filters(with_usage=True, with_scryfall_fetch=True)
     
     def fetch(filters: dict[str, str]) -> list[Tuple[CardWithUsage, str]]:
-        types = None
-
-        for k in filters:
-            if k.upper() == 'TYPE':
-                types = filters[k].split(',')
-
-        cards = carddb.find(s.db_filename, None, None, None, types)
+        cards = carddb.find(s.db_filename, None, None, None, catalog=filters)
         cards = sorted(cards, key=lambda c: (c.name, c.special_print_items, c.condition))
         cat_items = [(c, str(c)) for c in cards]
         return cat_items
@@ -1700,13 +1965,7 @@ def deck_detail_add(s: Session, deck: Deck) -> Deck:
     filters = card_cat_filters(with_usage=True, with_scryfall_fetch=True)
 
     def fetch(filters: dict[str, str]) -> list[Tuple[CardWithUsage, str]]:
-        types = None
-
-        for k in filters:
-            if k.upper() == 'TYPE':
-                types = filters[k].split(',')
-
-        cards = carddb.find(s.db_filename, None, None, None, types)
+        cards = carddb.find(s.db_filename, None, None, None, catalog=filters)
         cards = sorted(cards, key=lambda c: (c.name, c.special_print_items, c.condition))
         cat_items = []
         for c in cards:
@@ -2149,6 +2408,125 @@ def complete_scryfall_cache(s: Session):
     cio.pause()
 
 
+def import_scryfall_bulk_file(s: Session):
+    logger = s.log.with_fields(action='import-scryfall-bulk')
+
+    bulk_file = input("Scryfall bulk data file (default-cards or oracle-cards JSON): ").strip()
+    if bulk_file == '':
+        logger.info("Action canceled: no file given")
+        return
+    if not os.path.isfile(bulk_file):
+        print("ERROR: {!r} is not a file".format(bulk_file))
+        logger.warning("Bulk data file %s does not exist", bulk_file)
+        cio.pause()
+        return
+
+    def prog_func(read: int, matched: int, total: int):
+        cio.clear()
+        print("Read {:d} entries; found data for {:d}/{:d} cards...\n(Ctrl-C to stop)".format(read, matched, total))
+
+    logger.debug("Importing scryfall data from %s...", bulk_file)
+    start_time = datetime.datetime.now(tz=datetime.timezone.utc)
+
+    try:
+        matched, not_found = maint.import_scryfall_bulk_data(s.db_filename, bulk_file, apply=True, log=logger, progress=prog_func)
+    except KeyboardInterrupt:
+        logger.info("Ctrl-C; stop requested")
+        cio.clear()
+        print("Canceled; data for cards read before stopping has been stored")
+        cio.pause()
+        return
+    except ValueError as e:
+        logger.exception("Could not read bulk data file")
+        cio.clear()
+        print("ERROR: Could not read bulk data file: {!s}".format(e))
+        cio.pause()
+        return
+
+    time_taken = round((datetime.datetime.now(tz=datetime.timezone.utc) - start_time).total_seconds())
+    mm = time_taken // 60
+    ss = time_taken % 60
+
+    logger.debug("Import complete")
+    cio.clear()
+    print("Done! Imported scryfall data for {:d} of {:d} cards".format(len(matched), len(matched) + len(not_found)))
+    if len(not_found) > 0:
+        print("{:d} cards were not in the file; use 'Download missing and expired scryfall data' to get them".format(len(not_found)))
+    print("Operation took {:d} minutes, {:d} seconds".format(mm, ss))
+    cio.pause()
+
+
+def cache_warmer_menu(s: Session):
+    logger = s.log.with_fields(menu='warm-cache')
+
+    while True:
+        logger.debug("Entered menu")
+
+        warmer = s.cache_warmer
+        if warmer is None:
+            status = "Not started"
+        elif warmer.paused:
+            status = "Paused"
+        elif warmer.running:
+            status = "Running"
+        else:
+            status = "Finished"
+
+        cio.clear()
+        print("Status: {:s}".format(status))
+        if warmer is not None:
+            st = warmer.stats()
+            print(str(st))
+            ss = round(st.elapsed)
+            print("Running for {:d} minutes, {:d} seconds".format(ss // 60, ss % 60))
+            if st.last_error is not None:
+                print("Last error: {:s}".format(st.last_error))
+        print("The download keeps running after leaving this menu.")
+        print("")
+
+        actions = []
+        if warmer is None or not warmer.running:
+            actions.append(('start', 'Start downloading'))
+        elif warmer.paused:
+            actions.append(('resume', 'Resume'))
+            actions.append(('stop', 'Stop'))
+        else:
+            actions.append(('pause', 'Pause'))
+            actions.append(('stop', 'Stop'))
+
+        letter_items = [
+            ('R', 'refresh', 'Refresh'),
+            ('X', 'exit', 'Exit'),
+        ]
+
+        action = cio.select("BACKGROUND SCRYFALL DOWNLOAD", options=actions, non_number_choices=letter_items)
+        logger.debug("Selected action %s", action)
+
+        if action == 'start':
+            s.cache_warmer = maint.CacheWarmer(s.db_filename, log=logger)
+            s.cache_warmer.start()
+            logger.info("Started cache warmer")
+        elif action == 'pause':
+            warmer.pause()
+        elif action == 'resume':
+            warmer.resume()
+        elif action == 'stop':
+            warmer.stop()
+            cio.clear()
+            print("Stopping; storing data that was already downloaded...")
+            warmer.join()
+            logger.info("Stopped cache warmer")
+        elif action == 'refresh':
+            pass
+        elif action == 'exit':
+            break
+        else:
+            # should never get here
+            print("Unknown option")
+            logger.warning("unknown option %s selected; ignoring", repr(action))
+            cio.pause()
+
+
 def card_cat_filters(with_usage: bool, with_scryfall_fetch: bool=False) -> list[cio.CatFilter]:
     def num_expr(val: str):
         # it can either be an exact number, or a comparator followed by a number
@@ -2196,49 +2574,20 @@ def card_cat_filters(with_usage: bool, with_scryfall_fetch: bool=False) -> list[
 
         return op + num
     
-    def num_expr_matches(against: int, expr: str) -> bool:
-        # assume above func already normalized it.
-
-        num = 0
-        op = ''
-        if expr.startswith(('<=', '>=', '!=')):
-            num = int(expr[2:])
-            op = expr[:2]
-        elif expr.startswith(('<', '>', '=')):
-            num = int(expr[1:])
-            op = expr[:1]
-        else:
-            # should never happen
-            raise ValueError("Unknown operator")
-        
-        if op == '<':
-            return against < num
-        elif op == '>':
-            return against > num
-        elif op == '=':
-            return against == num
-        elif op == '<=':
-            return against <= num
-        elif op == '>=':
-            return against >= num
-        elif op == '!=':
-            return against != num
-        else:
-            # should never happen
-            raise ValueError("Unknown operator")
-        
     def normal_comma_sep(val: str) -> str:
         return ','.join(v.strip() for v in val.split(','))
     
+    # these are all applied by the DB query in the fetch function; see
+    # db.filters.card_catalog.
     filters = [
-        cio.CatFilter('name', lambda c, v: v.lower() in c.name.lower()),
-        cio.CatFilter('edition', lambda c, v: v.lower() in c.edition.lower()),
-        cio.CatFilter('cardnum', lambda c, v: v.upper() in c.cardnum)
+        cio.CatFilter('name', None, on_fetch=True),
+        cio.CatFilter('edition', None, on_fetch=True),
+        cio.CatFilter('cardnum', None, on_fetch=True)
     ]
 
     if with_usage:
         filters.extend([
-            cio.CatFilter('in_decks', lambda c, v: num_expr_matches(c.deck_count(), v), normalize=num_expr)
+            cio.CatFilter('in_decks', None, normalize=num_expr, on_fetch=True)
         ])
 
     if with_scryfall_fetch:
@@ -1,10 +1,36 @@
 # repairs.py handles checks of the database and fixes as needed.
 
-from typing import Tuple, Callable
+import asyncio
+import datetime
+import threading
+import time
+
+from typing import Tuple, Callable, Any, Iterator
 
 from . import elog, scryfall
-from .types import Card, CardWithUsage, Deck, DeckCard
-from .db import carddb, deckdb, scryfalldb, NotFoundError
+from .types import Card, CardWithUsage, Deck, DeckCard, Edition, ScryfallCardData
+from .db import carddb, deckdb, editiondb, scryfalldb, NotFoundError, util as dbutil
+
+
+# Most cards from a bulk data file that are stored in one transaction.
+BULK_IMPORT_BATCH_SIZE = 500
+
+# Number of entries read from a bulk data file between calls to progress.
+BULK_PROGRESS_INTERVAL = 5000
+
+# Number of requests a CacheWarmer has in flight to scryfall at once by
+# default. They all share the one rate limit for scryfall, so more than a few
+# only adds requests that sit waiting on it.
+DEFAULT_WARM_FETCHERS = 4
+
+# Most cards a CacheWarmer reads from the DB at once.
+WARM_PAGE_SIZE = 300
+
+# A CacheWarmer commits what it has fetched once it has data for this many
+# printings waiting to be stored, or once this many seconds have passed since
+# it last committed, whichever comes first.
+WARM_COMMIT_SIZE = 500
+WARM_COMMIT_SECS = 2.0
 
 
 
@@ -166,15 +192,17 @@ def merge_duplicates(db_filename: str, apply: bool=False, log: elog.Logger | Non
     return fix_actions
 
 
-def download_all_scryfall_data(db_filename: str, apply: bool=False, log: elog.Logger | None=None, progress: Callable[[int, int, Card], None] | None=None) -> list[Card]:
+def download_all_scryfall_data(db_filename: str, apply: bool=False, log: elog.Logger | None=None, progress: Callable[[int, int, Card], None] | None=None, scryfall_host: str='api.scryfall.com') -> list[Card]:
     """
     Download all scryfall data for all cards in the database.
     
     Return a list of all of the cards that do not have scryfall data or have
     expired scryfall data at the time the function is called. If apply is set to
-    True, all cards will have their scryfall data downloaded. When progress is
-    set to a function, it will be called before each card is downloaded with the
-    current card index and total count of cards to download.
+    True, all cards will have their scryfall data downloaded, many cards to a
+    request with several requests in flight at once. When progress is set to a
+    function, it will be called before each request with the number of cards
+    done so far, the total count of cards to download, and the next card to be
+    downloaded.
     """
     if log is None:
         log = elog.get(__name__)
@@ -191,19 +219,384 @@ def download_all_scryfall_data(db_filename: str, apply: bool=False, log: elog.Lo
 
     cards.sort(key=lambda c: c.cardnum)
 
-    for idx, c in enumerate(cards):
-        card_log = log.with_fields(card_id=c.id, card_name=c.name)
-        card_log.debug("Downloading scryfall data...")
-
+    def log_progress(done: int, total: int, next_card: Card):
+        log.debug("Downloading scryfall data for cards %d-%d of %d...", done + 1, min(done + scryfall.COLLECTION_MAX_IDENTIFIERS, total), total)
         if progress is not None:
-            pre_wait = lambda: progress(idx, len(cards), c)
-        else:
-            pre_wait = None
-        scryfall.get_card_data(db_filename, card=c, http_pre_wait_fn=pre_wait)
+            progress(done, total, next_card)
+
+    _, not_found = asyncio.run(scryfall.get_many_card_data_async(db_filename, cards, progress=log_progress, scryfall_host=scryfall_host))
+
+    for c in not_found:
+        card_log = log.with_fields(card_id=c.id, card_name=c.name)
+        card_log.warning("No scryfall data found for card")
 
     return cards
 
 
+class WarmStats:
+    """
+    Snapshot of the progress of a CacheWarmer. Counts are of cards in
+    inventory, except for requests and errors. elapsed is the number of
+    seconds the warmer has been running for, not counting time spent paused.
+    """
+    def __init__(self, total: int=0, queued: int=0, fetched: int=0, stored: int=0, not_found: int=0, requests: int=0, errors: int=0, elapsed: float=0.0, last_error: str | None=None):
+        self.total = total
+        self.queued = queued
+        self.fetched = fetched
+        self.stored = stored
+        self.not_found = not_found
+        self.requests = requests
+        self.errors = errors
+        self.elapsed = elapsed
+        self.last_error = last_error
+
+    @property
+    def cards_per_sec(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.stored / self.elapsed
+
+    def __str__(self):
+        s = "Stored {:d}/{:d} cards ({:.1f} cards/sec); {:d} fetched, {:d} not found, {:d} requests".format(self.stored, self.total, self.cards_per_sec, self.fetched, self.not_found, self.requests)
+        if self.errors > 0:
+            s += ", {:d} errors".format(self.errors)
+        return s
+
+    def __repr__(self):
+        return "WarmStats(total={!r}, queued={!r}, fetched={!r}, stored={!r}, not_found={!r}, requests={!r}, errors={!r}, elapsed={!r}, last_error={!r})".format(self.total, self.queued, self.fetched, self.stored, self.not_found, self.requests, self.errors, self.elapsed, self.last_error)
+
+
+class CacheWarmer:
+    """
+    CacheWarmer downloads scryfall data for every card whose data is missing or
+    expired in the background, the same as download_all_scryfall_data does but
+    without blocking the caller. It runs a scryfall.CardDataDownload on its own
+    thread, which reads cards that need data from the DB a page at a time as it
+    goes, has up to fetchers requests in flight at once under the shared
+    scryfall rate limit, and commits the results in batches of
+    WARM_COMMIT_SIZE printings or every WARM_COMMIT_SECS seconds.
+
+    Call start() to begin. While running, the warmer can be paused and resumed,
+    and stats() gives its progress at any time. stop() asks it to finish early;
+    data that was already fetched is still stored before it exits.
+    """
+
+    def __init__(self, db_filename: str, fetchers: int=DEFAULT_WARM_FETCHERS, scryfall_host: str='api.scryfall.com', log: elog.Logger | None=None):
+        if fetchers < 1:
+            raise ValueError("fetchers must be at least 1")
+
+        self.db_filename = db_filename
+        self.scryfall_host = scryfall_host
+        self._fetcher_count = fetchers
+        self._log = log if log is not None else elog.get(__name__)
+
+        self._thread: threading.Thread | None = None
+        self._download: scryfall.CardDataDownload | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._done = threading.Event()
+
+        self._lock = threading.Lock()
+        self._total = 0
+        self._errors = 0
+        self._last_error: str | None = None
+        self._started_at: float | None = None
+        self._finished_at: float | None = None
+        self._paused_at: float | None = None
+        self._paused_secs = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._started_at is not None and not self._done.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return self._paused_at is not None
+
+    @property
+    def not_found(self) -> list[Card]:
+        """
+        The cards that scryfall had no data for so far.
+        """
+        if self._download is None:
+            return []
+        return list(self._download.not_found)
+
+    def start(self):
+        """
+        Count the cards that need data and start the download. May only be
+        called once.
+        """
+        if self._started_at is not None:
+            raise RuntimeError("cache warmer has already been started")
+
+        self._total = carddb.count_without_scryfall_data(self.db_filename)
+        self._log.info("Warming scryfall data for {:d} cards with {:d} fetchers".format(self._total, self._fetcher_count))
+
+        client = scryfall.AsyncClient(self.scryfall_host, max_in_flight=self._fetcher_count)
+        self._download = scryfall.CardDataDownload(self.db_filename, client, commit_size=WARM_COMMIT_SIZE, commit_secs=WARM_COMMIT_SECS, on_error=self._fetch_failed, keep_results=False)
+        self._started_at = time.monotonic()
+
+        self._thread = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        """
+        Stop sending requests to scryfall until resume() is called. Requests
+        already sent are finished and their data is stored.
+        """
+        with self._lock:
+            if self._paused_at is not None or not self.running:
+                return
+            self._paused_at = time.monotonic()
+        self._call(self._download.pause)
+        self._log.info("Paused warming scryfall data")
+
+    def resume(self):
+        with self._lock:
+            if self._paused_at is None:
+                return
+            self._paused_secs += time.monotonic() - self._paused_at
+            self._paused_at = None
+        self._call(self._download.resume)
+        self._log.info("Resumed warming scryfall data")
+
+    def stop(self):
+        """
+        Ask the warmer to stop early. No more requests are sent, but data that
+        has already been fetched is stored before it finishes. Use join() to
+        wait for that.
+        """
+        if self._download is None:
+            return
+        self.resume()
+        self._call(self._download.stop)
+
+    def join(self, timeout: float | None=None) -> bool:
+        """
+        Wait for the warmer to finish, or for timeout seconds if it is given.
+        Return whether it has finished.
+        """
+        return self._done.wait(timeout)
+
+    def stats(self) -> WarmStats:
+        with self._lock:
+            st = WarmStats(total=self._total, errors=self._errors, last_error=self._last_error)
+            if self._started_at is not None:
+                end = self._finished_at
+                if end is None:
+                    end = self._paused_at if self._paused_at is not None else time.monotonic()
+                st.elapsed = end - self._started_at - self._paused_secs
+
+        dl = self._download
+        if dl is not None:
+            st.queued = dl.read
+            st.fetched = dl.fetched
+            st.stored = dl.stored
+            st.not_found = len(dl.not_found)
+            st.requests = dl.requests
+            st.errors += dl.errors
+        return st
+
+    def _call(self, fn: Callable[[], None]):
+        # the download may only be touched from its event loop once that is
+        # running.
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(fn)
+                return
+        fn()
+
+    def _error(self, msg: str, e: Exception):
+        with self._lock:
+            self._last_error = "{:s}: {!s}".format(msg, e)
+        # logged below warning level; this runs in the background and the UI
+        # in the foreground should not be written over.
+        self._log.info("%s", msg, exc_info=e)
+
+    def _fetch_failed(self, e: Exception, cards: list[Card]):
+        self._error("Fetching scryfall data for {:d} cards failed".format(len(cards)), e)
+
+    def _cards(self) -> Iterator[Card]:
+        after_id = None
+        while True:
+            cards = carddb.get_page_without_scryfall_data(self.db_filename, after_id, WARM_PAGE_SIZE)
+            if len(cards) == 0:
+                return
+            after_id = cards[-1].id
+            yield from cards
+
+    async def _warm(self):
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+        try:
+            await self._download.run(self._cards())
+        finally:
+            with self._lock:
+                self._loop = None
+
+    def _run(self):
+        try:
+            asyncio.run(self._warm())
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            self._error("Warming scryfall data failed", e)
+        finally:
+            self._download.client.close()
+            with self._lock:
+                self._finished_at = time.monotonic()
+                if self._paused_at is not None:
+                    self._paused_secs += self._finished_at - self._paused_at
+                    self._paused_at = None
+
+            for c in self._download.not_found:
+                self._log.with_fields(card_id=c.id, card_name=c.name).debug("No scryfall data found for card")
+            self._log.info("Finished warming scryfall data: {!s}".format(self.stats()))
+            self._done.set()
+
+
+def import_scryfall_bulk_data(db_filename: str, path: str, apply: bool=False, log: elog.Logger | None=None, progress: Callable[[int, int, int], None] | None=None) -> Tuple[list[Card], list[Card]]:
+    """
+    Import scryfall data for all cards in the database from a scryfall bulk
+    data file (such as default-cards or oracle-cards) instead of downloading it
+    card by card. Cards are matched to entries in the file by their scryfall_id
+    if they have one, or else by edition, collector number, and name. The file
+    is read incrementally, so it may be far larger than available memory.
+
+    Return a tuple containing the list of cards that were matched to an entry
+    in the file and the list of cards that were not. If apply is set to True,
+    the data of every matched card is stored, cards that did not have a
+    scryfall_id have it set, and any editions of inventory cards that are
+    missing from the database are added. When progress is set to a function, it
+    will be called periodically with the number of entries read from the file
+    so far, the number of cards matched so far, and the total count of cards.
+    If the import is interrupted with KeyboardInterrupt, data for the cards
+    matched up to that point is still stored before it is raised again.
+    """
+    if log is None:
+        log = elog.get(__name__)
+
+    # several cards in inventory can be the same printing, so each one is only
+    # matched once.
+    by_key: dict[tuple, list[Card]] = {}
+    total = 0
+    for c in carddb.iter_all(db_filename):
+        by_key.setdefault(_bulk_key(c), []).append(c)
+        total += 1
+
+    known_editions = set(code.upper() for code in editiondb.get_all(db_filename))
+    missing_editions = set(c.edition.upper() for cards in by_key.values() for c in cards) - known_editions
+    new_editions: dict[str, Edition] = {}
+
+    log.info("Matching {:d} cards against bulk data file {:s}".format(total, path))
+
+    matched_keys = set()
+    matched: list[Card] = []
+    to_store: dict[str, ScryfallCardData] = {}
+    id_updates: list[Card] = []
+    read = 0
+
+    def store_batch():
+        nonlocal to_store, id_updates
+        if apply and len(to_store) > 0:
+            with dbutil.transaction(db_filename):
+                scryfalldb.upsert_many(db_filename, to_store.values())
+                carddb.update_multiple_scryfall_ids(db_filename, id_updates)
+            log.debug("Stored scryfall data for %d cards", len(to_store))
+        to_store = {}
+        id_updates = []
+
+    try:
+        for raw in scryfall.iter_bulk_data(path):
+            read += 1
+            if progress is not None and read % BULK_PROGRESS_INTERVAL == 0:
+                progress(read, len(matched), total)
+
+            if raw.get('object', '') != 'card':
+                continue
+
+            set_code = raw.get('set', '').upper()
+            if set_code in missing_editions and 'released_at' in raw:
+                # the edition came out when its earliest card did
+                released = datetime.date.fromisoformat(raw['released_at'])
+                ed = new_editions.get(set_code)
+                if ed is None or released < ed.release_date:
+                    new_editions[set_code] = Edition(code=set_code, name=raw.get('set_name', set_code), release_date=released)
+
+            keys = [k for k in _bulk_match_keys(raw) if k in by_key and k not in matched_keys]
+            if len(keys) == 0:
+                continue
+
+            try:
+                card_data = scryfall._parse_resp_card_game_data(raw)
+            except (KeyError, ValueError) as e:
+                log.warning("Skipping bulk data entry %s that could not be read: %s", raw.get('id', '(no ID)'), str(e))
+                continue
+
+            for k in keys:
+                matched_keys.add(k)
+                for c in by_key[k]:
+                    matched.append(c)
+                    if apply and c.scryfall_id != card_data.id:
+                        c.scryfall_id = card_data.id
+                        id_updates.append(c)
+            to_store[card_data.id] = card_data
+
+            if len(to_store) >= BULK_IMPORT_BATCH_SIZE:
+                store_batch()
+    except KeyboardInterrupt:
+        # keep the data matched before the stop, as the caller is told it was.
+        store_batch()
+        raise
+
+    store_batch()
+    if progress is not None:
+        progress(read, len(matched), total)
+
+    not_found = [c for k, cards in by_key.items() if k not in matched_keys for c in cards]
+
+    log.info("Found bulk data for {:d} of {:d} cards in {:d} entries".format(len(matched), total, read))
+
+    if not apply:
+        log.debug("Dry-run complete")
+        return matched, not_found
+
+    if len(new_editions) > 0:
+        added = editiondb.insert_missing(db_filename, new_editions.values())
+        log.info("Added {:d} missing editions".format(added))
+
+    for c in not_found:
+        card_log = log.with_fields(card_id=c.id, card_name=c.name)
+        card_log.warning("No scryfall data found for card in bulk data file")
+
+    return matched, not_found
+
+
+def _bulk_key(c: Card) -> tuple:
+    if c.scryfall_id is not None:
+        return ('id', c.scryfall_id)
+    return ('num', c.edition.lower(), str(c.tcg_num), c.name.lower())
+
+
+def _bulk_match_keys(raw: dict[str, Any]) -> list[tuple]:
+    """
+    Return every key that a card in the inventory could have that matches the
+    given bulk data entry.
+    """
+    keys = [('id', raw['id'])]
+
+    set_code = raw.get('set', '').lower()
+    num = raw.get('collector_number', '')
+    name = raw.get('name', '')
+    keys.append(('num', set_code, num, name.lower()))
+
+    # inventory may name a multi-faced card by its front face alone
+    if ' // ' in name:
+        keys.append(('num', set_code, num, name.split(' // ', 1)[0].lower()))
+
+    return keys
+
+
 def reset_scryfall_data(db_filename: str, apply: bool=False, reset_ids: bool=False, log: elog.Logger | None=None) -> Tuple[list[Card], int]:
     """
     Reset all scryfall data for all cards in the database.
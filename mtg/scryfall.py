@@ -1,15 +1,43 @@
+import asyncio
+import concurrent.futures
 import datetime
+import gzip
+import itertools
+import json
+import threading
 
-from typing import Sequence, Any, Tuple, Callable
+from typing import Sequence, Any, Tuple, Callable, Iterable, Iterator, AsyncIterator
 
 from .types import Card, ScryfallCardData, ScryfallFace, ScryfallSet, CardWithUsage
-from .http import HttpAgent
-from .db import carddb, NotFoundError, AlreadyExistsError, scryfalldb
+from .http import HttpAgent, AsyncHttpAgent, ResponseCache
+from .db import carddb, NotFoundError, scryfalldb, util as dbutil
 from . import version
 
-DEFAULT_ANTIFLOOD_SECS = 0.25
+DEFAULT_ANTIFLOOD_SECS = 0.1
 INITIAL_TIME_PER_REQ = 0.1
 
+# Most requests an AsyncClient has in flight at once by default. They are still
+# sent no faster than the rate limit allows; this only bounds how many can be
+# waiting on scryfall at the same time.
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Most cards that can be asked for in one request to /cards/collection.
+COLLECTION_MAX_IDENTIFIERS = 75
+
+# Characters read from a bulk data file at a time. Each card object is only a
+# few KiB, so this keeps memory use flat no matter how large the file is.
+BULK_READ_CHUNK_SIZE = 1024 * 1024
+
+# Most characters a single entry of a bulk data file may take up. Real entries
+# are far smaller; one that is not done by this point is taken to be malformed
+# rather than read on to the end of the file.
+BULK_MAX_ENTRY_SIZE = 8 * 1024 * 1024
+
+# A failure to decode an entry within this many characters of the end of what
+# has been read so far may only be because the rest of it has not been read
+# yet, such as a \uXXXX escape that is cut off.
+BULK_DECODE_LOOKBACK = 16
+
 
 class APIError(Exception):
     """
@@ -100,12 +128,7 @@ def get_card_data(db_filename: str, card: Card | None=None, scryfall_id: str='',
                 card_data, _ = fetch_card_data_by_name(card.name, set=card.edition)
                 card_data.last_updated = datetime.datetime.now(tz=datetime.timezone.utc)
 
-                try:
-                    scryfalldb.insert(db_filename, card_data)
-                except AlreadyExistsError:
-                    # clear it and reinsert
-                    scryfalldb.delete_one(db_filename, card_data.id)
-                    scryfalldb.insert(db_filename, card_data)
+                scryfalldb.upsert(db_filename, card_data)
 
                 if db_cards is not None:
                     for c in db_cards:
@@ -120,8 +143,8 @@ def get_card_data(db_filename: str, card: Card | None=None, scryfall_id: str='',
     try:
         card_data = scryfalldb.get_one(db_filename, scryfall_id)
         if datetime.datetime.now(tz=datetime.timezone.utc) - card_data.last_updated > datetime.timedelta(days=carddb.DEFAULT_EXPIRE_DAYS):
+            # expired; it is brought up to date in place once it is fetched
             card_data = None
-            scryfalldb.delete_one(db_filename, scryfall_id)
     except NotFoundError:
         pass
 
@@ -130,7 +153,7 @@ def get_card_data(db_filename: str, card: Card | None=None, scryfall_id: str='',
             http_pre_wait_fn()
         card_data, raw_resp = fetch_card_data_by_id(scryfall_id)
         card_data.last_updated = datetime.datetime.now(tz=datetime.timezone.utc)
-        scryfalldb.insert(db_filename, card_data)
+        scryfalldb.upsert(db_filename, card_data)
         name = raw_resp['name']
         card_num = raw_resp['set'] + '-' + raw_resp['collector_number']
         db_cards = carddb.find(db_filename, name=name, card_num=card_num, edition=None)
@@ -141,49 +164,591 @@ def get_card_data(db_filename: str, card: Card | None=None, scryfall_id: str='',
     return card_data
 
 
-def fetch_set_data_by_code(code: str, scryfall_host='api.scryfall.com') -> Tuple[ScryfallSet, dict]:
-    client = _get_http_client(scryfall_host)
+def get_many_card_data(db_filename: str, cards: Sequence[Card], progress: Callable[[int, int, Card], None] | None=None, scryfall_host='api.scryfall.com') -> Tuple[dict[int, ScryfallCardData], list[Card]]:
+    """
+    Download gameplay data for all of the given cards from scryfall and store
+    it, asking for up to COLLECTION_MAX_IDENTIFIERS cards per request. Cards
+    are looked up by their scryfall_id if they have one, or else by edition and
+    collector number, and then by name and edition for any that are not found
+    that way. Cards that did not have a scryfall_id have it set.
 
-    params = {
-        'pretty': False,
-        'format': 'json',
-    }
+    If progress is given, it is called before each request with the number of
+    cards that data has been found for so far, the total number of cards, and
+    the first card of the next batch.
 
-    path = '/sets/{:s}'.format(code.lower())
-    status, resp = client.request('GET', path, query=params)
-    if status >= 400:
-        err = APIError.parse(resp)
-        raise err
-    
-    data = _parse_resp_set_data(resp)
-    return data, resp
-    
+    Returns a dict mapping the ID of each card that data was found for to its
+    data, and the list of cards that no data was found for.
 
-def fetch_card_data_by_id(scryfall_id: str, scryfall_host='api.scryfall.com') -> Tuple[ScryfallCardData, dict]:
-    client = _get_http_client(scryfall_host)
+    Requests are sent one at a time; use get_many_card_data_async to have more
+    of them in flight at once.
+    """
+    async def download():
+        async with AsyncClient(scryfall_host, max_in_flight=1) as client:
+            return await CardDataDownload(db_filename, client).run(cards, progress=progress)
 
-    params = {
-        'pretty': False,
-        'format': 'json',
-    }
+    return asyncio.run(download())
 
-    path = '/cards/{:s}'.format(scryfall_id)
-    status, resp = client.request('GET', path, query=params)
-    if status >= 400:
-        err = APIError.parse(resp)
-        raise err
+
+async def get_many_card_data_async(db_filename: str, cards: Sequence[Card], progress: Callable[[int, int, Card], None] | None=None, client: 'AsyncClient | None'=None, scryfall_host='api.scryfall.com') -> Tuple[dict[int, ScryfallCardData], list[Card]]:
+    """
+    Do the same as get_many_card_data, but with up to the client's
+    max_in_flight requests in flight at once. If client is not given, one is
+    created for scryfall_host and closed when done.
+    """
+    own_client = client is None
+    if own_client:
+        client = AsyncClient(scryfall_host)
+
+    try:
+        return await CardDataDownload(db_filename, client).run(cards, progress=progress)
+    finally:
+        if own_client:
+            client.close()
+
+
+class CardDataDownload:
+    """
+    Downloads gameplay data for many cards with an AsyncClient and stores it,
+    the way get_many_card_data describes. Requests are sent for batches of
+    cards as they are read, with up to the client's max_in_flight of them in
+    flight at once, and cards that are not found by collector number are
+    gathered up and asked for again by name.
+
+    Reading the cards and storing the data all happen on one thread, so they
+    all use that thread's DB connection. Data is committed once there is data
+    for commit_size printings waiting to be stored, or commit_secs seconds
+    after the first of it came in if commit_secs is given.
+
+    If on_error is given, a request that fails is passed to it along with the
+    cards it was for and the download goes on without them; otherwise, the
+    first error stops the download and is raised from run(). Either way, all
+    data that was already fetched is stored before run() returns.
+
+    The counts of cards read, requests sent, cards fetched and stored, and
+    request errors, and the list of cards not found, are kept up to date while
+    it runs. pause(), resume() and stop() must be called from the thread of the
+    event loop it runs in.
+    """
+
+    def __init__(self, db_filename: str, client: 'AsyncClient', commit_size: int=1, commit_secs: float | None=None, on_error: Callable[[Exception, list[Card]], None] | None=None, keep_results: bool=True):
+        if commit_size < 1:
+            raise ValueError("commit_size must be at least 1")
+
+        self.db_filename = db_filename
+        self.client = client
+        self.commit_size = commit_size
+        self.commit_secs = commit_secs
+        self.on_error = on_error
+        self.keep_results = keep_results
+
+        self.read = 0
+        self.requests = 0
+        self.fetched = 0
+        self.stored = 0
+        self.errors = 0
+        self.not_found: list[Card] = []
+
+        self._unpaused = asyncio.Event()
+        self._unpaused.set()
+        self._stopping = False
+        self._failure: BaseException | None = None
+
+    @property
+    def paused(self) -> bool:
+        return not self._unpaused.is_set()
+
+    def pause(self):
+        """
+        Stop sending requests until resume() is called. Requests already sent
+        are finished and their data is stored.
+        """
+        self._unpaused.clear()
+
+    def resume(self):
+        self._unpaused.set()
+
+    def stop(self):
+        """
+        Stop sending requests and have run() return once the ones already sent
+        are finished and their data is stored.
+        """
+        self._stopping = True
+        self._unpaused.set()
+
+    async def run(self, cards: Iterable[Card], progress: Callable[[int, int, Card], None] | None=None) -> Tuple[dict[int, ScryfallCardData], list[Card]]:
+        """
+        Download and store data for the given cards. If cards is a Sequence,
+        every card that is the same printing is asked for in the same request;
+        otherwise, cards are read from it a batch at a time on the DB thread,
+        so it may read them from the DB as it goes.
+
+        progress is called as for get_many_card_data; if cards is not a
+        Sequence, the total passed to it is the number of cards read so far.
+
+        Returns a dict mapping the ID of each card that data was found for to
+        its data (empty if keep_results is not set), and the list of cards
+        that no data was found for.
+        """
+        results: dict[int, ScryfallCardData] = {}
+        retry: dict[tuple, list[Card]] = {}
+        total = len(cards) if isinstance(cards, Sequence) else None
+
+        tasks: set[asyncio.Task] = set()
+        slots = asyncio.Semaphore(self.client.max_in_flight)
+        store_queue: asyncio.Queue = asyncio.Queue()
+
+        # keep the pool open for the whole download so the DB thread reuses
+        # one connection instead of opening one per page or commit.
+        pool = dbutil.open_pool(self.db_filename)
+        db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='scryfall-db')
+        store_task = asyncio.create_task(self._store_all(store_queue, db_executor))
+        batches = self._batches(cards, db_executor)
+
+        def check():
+            # raise the first error hit by a request or by storing
+            if self._failure is not None:
+                raise self._failure
+            if store_task.done():
+                store_task.result()
+
+        def finished(t: asyncio.Task):
+            tasks.discard(t)
+            slots.release()
+            if not t.cancelled() and t.exception() is not None and self._failure is None:
+                self._failure = t.exception()
+
+        async def dispatch(batch: dict[tuple, list[Card]], by_name: bool):
+            await slots.acquire()
+            check()
+            t = asyncio.create_task(self._fetch(batch, by_name, results, retry, store_queue, progress, total))
+            tasks.add(t)
+            t.add_done_callback(finished)
+
+        def take_retry() -> dict[tuple, list[Card]]:
+            keys = list(retry.keys())[:COLLECTION_MAX_IDENTIFIERS]
+            return {k: retry.pop(k) for k in keys}
+
+        try:
+            async for batch in batches:
+                if self._stopping:
+                    break
+                await dispatch(batch, False)
+
+                # collector numbers do not always line up with scryfall's, so
+                # give the ones without an ID another shot by name.
+                while len(retry) >= COLLECTION_MAX_IDENTIFIERS and not self._stopping:
+                    await dispatch(take_retry(), True)
+
+            while True:
+                check()
+                if len(retry) > 0 and not self._stopping and (len(retry) >= COLLECTION_MAX_IDENTIFIERS or len(tasks) == 0):
+                    await dispatch(take_retry(), True)
+                    continue
+                if len(tasks) == 0:
+                    break
+                await asyncio.wait(tasks | {store_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            await batches.aclose()
+
+            # nothing may be put on the queue after the end of it, so make sure
+            # every request is done with first.
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            store_queue.put_nowait(None)
+            try:
+                await store_task
+            finally:
+                db_executor.shutdown()
+                pool.close()
+
+        return results, list(self.not_found)
+
+    async def _batches(self, cards: Iterable[Card], db_executor: concurrent.futures.Executor) -> AsyncIterator[dict[tuple, list[Card]]]:
+        if isinstance(cards, Sequence):
+            by_key = _collection_keys(cards)
+            self.read = len(cards)
+            for keys in dbutil.chunked(list(by_key.keys()), COLLECTION_MAX_IDENTIFIERS):
+                yield {k: by_key[k] for k in keys}
+            return
+
+        loop = asyncio.get_running_loop()
+        source = iter(cards)
+        pending: dict[tuple, list[Card]] = {}
+        while True:
+            chunk = await loop.run_in_executor(db_executor, _take, source, COLLECTION_MAX_IDENTIFIERS)
+            self.read += len(chunk)
+            for c in chunk:
+                pending.setdefault(_collection_key(c), []).append(c)
+
+            while len(pending) >= COLLECTION_MAX_IDENTIFIERS or (len(chunk) == 0 and len(pending) > 0):
+                keys = list(pending.keys())[:COLLECTION_MAX_IDENTIFIERS]
+                yield {k: pending.pop(k) for k in keys}
+
+            if len(chunk) == 0:
+                return
+
+    async def _fetch(self, batch: dict[tuple, list[Card]], by_name: bool, results: dict[int, ScryfallCardData], retry: dict[tuple, list[Card]], store_queue: asyncio.Queue, progress: Callable[[int, int, Card], None] | None, total: int | None):
+        await self._unpaused.wait()
+        if self._stopping:
+            return
+
+        first = next(iter(batch.values()))[0]
+        if progress is not None:
+            progress(self.fetched, total if total is not None else self.read, first)
+
+        identifiers, wanted = _collection_request(list(batch.keys()), batch, by_name)
+        self.requests += 1
+        try:
+            found, _ = await self.client.fetch_card_data_collection(identifiers)
+        except Exception as e:
+            if self.on_error is None:
+                raise
+            self.errors += 1
+            self.on_error(e, [c for cs in batch.values() for c in cs])
+            return
+
+        if not self.keep_results:
+            results = {}
+        to_store, id_updates, matched = _match_collection(found, wanted, batch, results)
+
+        matched_cards = sum(len(batch[k]) for k in matched)
+        self.fetched += matched_cards
+        if len(to_store) > 0:
+            store_queue.put_nowait((to_store, id_updates, matched_cards))
+
+        for k, cs in batch.items():
+            if k in matched:
+                continue
+            if not by_name and k[0] == 'num':
+                # the same printing can come up again in a later batch
+                retry.setdefault(k, []).extend(cs)
+            else:
+                self.not_found.extend(cs)
+
+    async def _store_all(self, store_queue: asyncio.Queue, db_executor: concurrent.futures.Executor):
+        loop = asyncio.get_running_loop()
+        to_store: dict[str, ScryfallCardData] = {}
+        id_updates: list[Card] = []
+        waiting = 0
+        deadline: float | None = None
+
+        async def commit():
+            nonlocal to_store, id_updates, waiting, deadline
+            if len(to_store) > 0:
+                await loop.run_in_executor(db_executor, _store_collection, self.db_filename, to_store, id_updates)
+                self.stored += waiting
+            to_store = {}
+            id_updates = []
+            waiting = 0
+            deadline = None
+
+        while True:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                item = await asyncio.wait_for(store_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await commit()
+                continue
+            if item is None:
+                await commit()
+                return
+
+            batch_store, batch_ids, batch_cards = item
+            to_store.update(batch_store)
+            id_updates.extend(batch_ids)
+            waiting += batch_cards
+            if deadline is None and self.commit_secs is not None:
+                deadline = loop.time() + self.commit_secs
+            if len(to_store) >= self.commit_size:
+                await commit()
+
+
+def _take(source: Iterator[Card], n: int) -> list[Card]:
+    return list(itertools.islice(source, n))
+
+
+def _collection_keys(cards: Sequence[Card]) -> dict[tuple, list[Card]]:
+    """
+    Group cards by the key they are asked for by in a request to
+    /cards/collection. Several cards in inventory can be the same printing, so
+    each one is only asked for once.
+    """
+    by_key: dict[tuple, list[Card]] = {}
+    for c in cards:
+        by_key.setdefault(_collection_key(c), []).append(c)
+    return by_key
+
+
+def _collection_request(keys: list[tuple], by_key: dict[tuple, list[Card]], by_name: bool) -> Tuple[list[dict[str, str]], dict[tuple, list[tuple]]]:
+    """
+    Return the identifiers to ask for the given keys with, along with a map of
+    each way a returned card can be matched to the keys it was asked for by.
+    When asking by name, several keys (different collector numbers of the same
+    card in one set) can share a name; it is only asked for once, and the card
+    returned for it matches all of them.
+    """
+    identifiers = []
+    wanted: dict[tuple, list[tuple]] = {}
+    for k in keys:
+        if by_name:
+            name = by_key[k][0].name
+            name_key = ('name', k[1], name.lower())
+            if name_key not in wanted:
+                identifiers.append({'name': name, 'set': k[1]})
+                wanted[name_key] = []
+            wanted[name_key].append(k)
+        elif k[0] == 'id':
+            identifiers.append({'id': k[1]})
+            wanted[k] = [k]
+        else:
+            identifiers.append({'set': k[1], 'collector_number': k[2]})
+            wanted[k] = [k]
+    return identifiers, wanted
+
+
+def _match_collection(found: list[Tuple[ScryfallCardData, dict]], wanted: dict[tuple, list[tuple]], by_key: dict[tuple, list[Card]], results: dict[int, ScryfallCardData]) -> Tuple[dict[str, ScryfallCardData], list[Card], set[tuple]]:
+    """
+    Match the cards returned from a request to /cards/collection to the keys
+    they were asked for by, adding each matched card to results. Returns the
+    data to store, the cards whose scryfall_id needs to be updated, and the
+    keys that were matched.
+    """
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    matched = set()
+    to_store: dict[str, ScryfallCardData] = {}
+    id_updates: list[Card] = []
+    for card_data, raw in found:
+        card_data.last_updated = now
+        for mk in _collection_match_keys(raw):
+            for k in wanted.get(mk, []):
+                if k in matched:
+                    continue
+                matched.add(k)
+                to_store[card_data.id] = card_data
+                for c in by_key[k]:
+                    results[c.id] = card_data
+                    if c.scryfall_id != card_data.id:
+                        c.scryfall_id = card_data.id
+                        id_updates.append(c)
+    return to_store, id_updates, matched
+
+
+def _store_collection(db_filename: str, to_store: dict[str, ScryfallCardData], id_updates: list[Card]):
+    with dbutil.transaction(db_filename):
+        scryfalldb.upsert_many(db_filename, to_store.values())
+        carddb.update_multiple_scryfall_ids(db_filename, id_updates)
+
+
+def _collection_key(c: Card) -> tuple:
+    if c.scryfall_id is not None:
+        return ('id', c.scryfall_id)
+    return ('num', c.edition.lower(), str(c.tcg_num))
+
+
+def _collection_match_keys(raw: dict[str, Any]) -> list[tuple]:
+    """
+    Return every key that the card in a /cards/collection response could have
+    been asked for by.
+    """
+    keys = [
+        ('id', raw['id']),
+        ('num', raw['set'].lower(), raw['collector_number']),
+        ('name', raw['set'].lower(), raw['name'].lower()),
+    ]
+
+    # inventory may name a multi-faced card by its front face alone
+    if ' // ' in raw['name']:
+        keys.append(('name', raw['set'].lower(), raw['name'].split(' // ', 1)[0].lower()))
+
+    return keys
+
+
+def iter_bulk_data(path: str, chunk_size: int=BULK_READ_CHUNK_SIZE) -> Iterator[dict[str, Any]]:
+    """
+    Yield each object in a scryfall bulk data file (such as default-cards or
+    oracle-cards) one at a time as it is read, so that the whole file, which
+    can be several hundred MB, is never held in memory at once. Files ending in
+    '.gz' are decompressed as they are read.
+
+    Raises ValueError as soon as the file is found not to be a valid JSON list,
+    including when it ends before the list does.
+    """
+    decoder = json.JSONDecoder()
+    opener = gzip.open if path.lower().endswith('.gz') else open
+
+    with opener(path, 'rt', encoding='utf-8') as fp:
+        buf = ''
+        pos = 0
+        started = False
+
+        def read_more() -> bool:
+            nonlocal buf, pos
+            more = fp.read(chunk_size)
+            buf = buf[pos:] + more
+            pos = 0
+            return len(more) > 0
+
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos >= len(buf):
+                if not read_more():
+                    raise ValueError("Bulk data file ends before its list of cards does")
+                continue
+
+            ch = buf[pos]
+            if not started:
+                if ch != '[':
+                    raise ValueError("Bulk data file does not contain a JSON list")
+                started = True
+                pos += 1
+                continue
+            if ch == ']':
+                pos += 1
+                break
+            if ch == ',':
+                pos += 1
+                continue
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # an object cut off by the end of the buffer fails to decode at
+                # the end, or where a string that runs past the end starts. A
+                # failure anywhere else is malformed whatever comes after it.
+                cut_off = e.pos >= len(buf) - BULK_DECODE_LOOKBACK or e.msg.startswith('Unterminated string')
+                if not cut_off:
+                    raise ValueError("Bulk data file is not valid JSON: {:s}".format(e.msg))
+                if len(buf) - pos > BULK_MAX_ENTRY_SIZE:
+                    raise ValueError("Bulk data file has an entry larger than {:d} characters; it is most likely not valid JSON".format(BULK_MAX_ENTRY_SIZE))
+
+                # it was only cut off if there is more to read; if not, the
+                # error stands, unless it is that the data simply stops.
+                at_end = e.pos >= len(buf)
+                if not read_more():
+                    if at_end:
+                        raise ValueError("Bulk data file ends in the middle of an entry")
+                    raise ValueError("Bulk data file is not valid JSON: {:s}".format(e.msg))
+                continue
+
+            pos = end
+            yield obj
+
+        # nothing but whitespace may follow the list.
+        while True:
+            if buf[pos:].strip() != '':
+                raise ValueError("Bulk data file has data after its list of cards")
+            pos = len(buf)
+            if not read_more():
+                return
+
+
+def fetch_card_data_collection(identifiers: Sequence[dict[str, str]], scryfall_host='api.scryfall.com') -> Tuple[list[Tuple[ScryfallCardData, dict]], list[dict[str, str]]]:
+    """
+    Get the data for up to COLLECTION_MAX_IDENTIFIERS cards with a single
+    request. Each identifier is a dict in one of the forms accepted by the
+    /cards/collection endpoint, such as {'id': scryfall_id} or
+    {'set': code, 'collector_number': num}.
+
+    Returns a list of each card found paired with its raw response object, and
+    a list of the identifiers that did not match any card.
+    """
+    method, path, params, payload = _collection_request_args(identifiers)
+    status, resp = _get_http_client(scryfall_host).request(method, path, query=params, payload=payload)
+    return _parse_collection_resp(status, resp)
+
+
+def fetch_set_data_by_code(code: str, scryfall_host='api.scryfall.com') -> Tuple[ScryfallSet, dict]:
+    method, path, params, payload = _set_by_code_request_args(code)
+    status, resp = _get_http_client(scryfall_host).request(method, path, query=params, payload=payload)
+    return _parse_set_resp(status, resp)
     
-    data = _parse_resp_card_game_data(resp)
-    return data, resp
+
+def fetch_card_data_by_id(scryfall_id: str, scryfall_host='api.scryfall.com') -> Tuple[ScryfallCardData, dict]:
+    method, path, params, payload = _card_by_id_request_args(scryfall_id)
+    status, resp = _get_http_client(scryfall_host).request(method, path, query=params, payload=payload)
+    return _parse_card_resp(status, resp)
 
 
 def fetch_card_data_by_name(name: str, fuzzy: bool=False, set: str='', scryfall_host='api.scryfall.com') -> Tuple[ScryfallCardData, dict]:
-    client = _get_http_client(scryfall_host)
+    method, path, params, payload = _card_by_name_request_args(name, fuzzy, set)
+    status, resp = _get_http_client(scryfall_host).request(method, path, query=params, payload=payload)
+    return _parse_card_resp(status, resp)
 
-    params = {
-        'pretty': False,
-        'format': 'json',
+
+class AsyncClient:
+    """
+    Scryfall client for use from asyncio code, with the same fetch functions as
+    this module. Up to max_in_flight requests are sent at once over connections
+    that are kept alive between them, all under the same rate limit as the rest
+    of the requests made to the same host by this module. Call close() or use
+    it in an async with-statement when done with it.
+    """
+
+    def __init__(self, scryfall_host='api.scryfall.com', max_in_flight: int=DEFAULT_MAX_IN_FLIGHT):
+        shared = _get_http_client(scryfall_host)
+        agent = _new_http_client(shared.host, shared.ssl, rate_limiter=shared.rate_limiter, pool_size=max_in_flight)
+        self._http = AsyncHttpAgent(agent, max_in_flight=max_in_flight)
+
+    @property
+    def max_in_flight(self) -> int:
+        return self._http.max_in_flight
+
+    async def fetch_card_data_collection(self, identifiers: Sequence[dict[str, str]]) -> Tuple[list[Tuple[ScryfallCardData, dict]], list[dict[str, str]]]:
+        method, path, params, payload = _collection_request_args(identifiers)
+        status, resp = await self._http.request(method, path, query=params, payload=payload)
+        return _parse_collection_resp(status, resp)
+
+    async def fetch_set_data_by_code(self, code: str) -> Tuple[ScryfallSet, dict]:
+        method, path, params, payload = _set_by_code_request_args(code)
+        status, resp = await self._http.request(method, path, query=params, payload=payload)
+        return _parse_set_resp(status, resp)
+
+    async def fetch_card_data_by_id(self, scryfall_id: str) -> Tuple[ScryfallCardData, dict]:
+        method, path, params, payload = _card_by_id_request_args(scryfall_id)
+        status, resp = await self._http.request(method, path, query=params, payload=payload)
+        return _parse_card_resp(status, resp)
+
+    async def fetch_card_data_by_name(self, name: str, fuzzy: bool=False, set: str='') -> Tuple[ScryfallCardData, dict]:
+        method, path, params, payload = _card_by_name_request_args(name, fuzzy, set)
+        status, resp = await self._http.request(method, path, query=params, payload=payload)
+        return _parse_card_resp(status, resp)
+
+    def close(self):
+        self._http.close()
+
+    async def __aenter__(self) -> 'AsyncClient':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+# Each of the *_request_args functions returns the method, path, query params,
+# and payload of a request, for the sync and async fetch functions to send.
+
+def _collection_request_args(identifiers: Sequence[dict[str, str]]) -> Tuple[str, str, dict[str, Any], dict[str, Any] | None]:
+    if len(identifiers) > COLLECTION_MAX_IDENTIFIERS:
+        raise ValueError("Cannot request more than {:d} cards at once".format(COLLECTION_MAX_IDENTIFIERS))
+
+    payload = {
+        'identifiers': list(identifiers),
     }
+    return 'POST', '/cards/collection', _default_params(), payload
+
+
+def _set_by_code_request_args(code: str) -> Tuple[str, str, dict[str, Any], dict[str, Any] | None]:
+    return 'GET', '/sets/{:s}'.format(code.lower()), _default_params(), None
+
+
+def _card_by_id_request_args(scryfall_id: str) -> Tuple[str, str, dict[str, Any], dict[str, Any] | None]:
+    return 'GET', '/cards/{:s}'.format(scryfall_id), _default_params(), None
+
+
+def _card_by_name_request_args(name: str, fuzzy: bool, set: str) -> Tuple[str, str, dict[str, Any], dict[str, Any] | None]:
+    params = _default_params()
 
     if fuzzy:
         params['fuzzy'] = name
@@ -193,8 +758,36 @@ def fetch_card_data_by_name(name: str, fuzzy: bool=False, set: str='', scryfall_
     if len(set) > 0:
         params['set'] = set.lower()
     
-    path = '/cards/named'
-    status, resp = client.request('GET', path, query=params)
+    return 'GET', '/cards/named', params, None
+
+
+def _default_params() -> dict[str, Any]:
+    return {
+        'pretty': False,
+        'format': 'json',
+    }
+
+
+def _parse_collection_resp(status: int, resp: dict[str, Any]) -> Tuple[list[Tuple[ScryfallCardData, dict]], list[dict[str, str]]]:
+    if status >= 400:
+        err = APIError.parse(resp)
+        raise err
+
+    found = [(_parse_resp_card_game_data(c), c) for c in resp.get('data', [])]
+    not_found = list(resp.get('not_found', []))
+    return found, not_found
+
+
+def _parse_set_resp(status: int, resp: dict[str, Any]) -> Tuple[ScryfallSet, dict]:
+    if status >= 400:
+        err = APIError.parse(resp)
+        raise err
+    
+    data = _parse_resp_set_data(resp)
+    return data, resp
+
+
+def _parse_card_resp(status: int, resp: dict[str, Any]) -> Tuple[ScryfallCardData, dict]:
     if status >= 400:
         err = APIError.parse(resp)
         raise err
@@ -291,22 +884,58 @@ def _parse_resp_face(f: dict[str, Any]) -> ScryfallFace:
 
 
 _client: HttpAgent = None
+_cache: ResponseCache | None = None
+_client_lock = threading.Lock()
+
+
+def use_http_cache(cache: ResponseCache | None):
+    """
+    Set the cache that responses from scryfall are kept in and served from, so
+    that data which has not changed since it was last fetched is not sent
+    again. Set to None to stop caching.
+
+    Only GET requests are cached, which covers looking up a single card or set.
+    The POSTs to /cards/collection that get_many_card_data and CardDataDownload
+    send for many cards at once are not.
+    """
+    global _cache
+    _cache = cache
+    if _client is not None:
+        _client.cache = cache
+
 
 def _get_http_client(scryfall_host='api.scryfall.com') -> HttpAgent:
+    """
+    Return the client for the given host. The host may be prefixed with
+    'http://' to talk to a server without TLS, such as a local stand-in for
+    scryfall used in testing.
+    """
     global _client
 
-    if _client is None or _client.host != scryfall_host:
-        _client = HttpAgent(
-            scryfall_host,
-            ssl=True,
-            antiflood_secs=DEFAULT_ANTIFLOOD_SECS,
-            ignored_errors=[400, 401, 403, 404, 422, 429, 500],
-            log_full_response=False,
-            log_full_request=False,
-            headers={
-                "User-Agent": 'mtgdb-by-dekarrin/' + version.version,
-                "Accept": "application/json;q=0.9,*/*;q=0.8"
-            }
-        )
-
-    return _client
+    use_ssl = True
+    if scryfall_host.startswith('http://'):
+        scryfall_host = scryfall_host[len('http://'):]
+        use_ssl = False
+
+    # the client is shared between threads, and so must its rate limiter be.
+    with _client_lock:
+        if _client is None or _client.host != scryfall_host or _client.ssl != use_ssl:
+            _client = _new_http_client(scryfall_host, use_ssl)
+        return _client
+
+
+def _new_http_client(scryfall_host: str, use_ssl: bool, **kwargs) -> HttpAgent:
+    return HttpAgent(
+        scryfall_host,
+        **kwargs,
+        ssl=use_ssl,
+        cache=_cache,
+        antiflood_secs=DEFAULT_ANTIFLOOD_SECS,
+        ignored_errors=[400, 401, 403, 404, 422, 429, 500],
+        log_full_response=False,
+        log_full_request=False,
+        headers={
+            "User-Agent": 'mtgdb-by-dekarrin/' + version.version,
+            "Accept": "application/json;q=0.9,*/*;q=0.8"
+        }
+    )
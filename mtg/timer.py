@@ -1,4 +1,8 @@
+from contextlib import contextmanager
 from datetime import timedelta
+from typing import Tuple
+import asyncio
+import threading
 import time
 
 import logging
@@ -68,3 +72,146 @@ class WaitPeriodTimer:
 
     def _target(self) -> float:
         return self._last_called + self.period.total_seconds()
+
+
+class RateLimiter:
+    """Token-bucket rate limiter that can be shared by any number of threads
+    and asyncio tasks. Tokens are added at a steady rate up to a maximum burst
+    size, and each action takes one token, waiting for it if none are left. Up
+    to burst actions can go at once after a quiet period, while over time no
+    more than rate actions happen per second.
+
+    When the other side says to slow down (for instance, with an HTTP 429),
+    call backoff() to stop handing out tokens for a while and to lower the
+    rate; call succeeded() after each action that was not throttled to let the
+    rate climb back to where it started.
+    """
+
+    def __init__(self, rate: float, burst: int=1, min_rate: float | None=None, recovery: float=0.05):
+        """Create a new RateLimiter that allows rate actions per second with
+        up to burst of them at once. Backing off will never lower the rate
+        below min_rate, which defaults to a tenth of rate. Each success raises
+        a lowered rate by recovery times the full rate."""
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+
+        self.max_rate: float = rate
+        self.burst: int = burst
+        self.min_rate: float = min_rate if min_rate is not None else rate / 10
+        self.recovery: float = recovery
+
+        self._rate: float = rate
+        self._tokens: float = float(burst)
+        self._updated: float = time.monotonic()
+        self._blocked_until: float = 0
+        self._backoffs: int = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        """Return the number of actions currently allowed per second. This is
+        lower than max_rate while recovering from a backoff."""
+        return self._rate
+
+    def acquire(self):
+        """Take a token, sleeping until one is available. If a backoff happens
+        while sleeping, the token is given up and a new one is waited for, so
+        that nothing is sent while the backoff is in effect."""
+        while True:
+            wait_time, backoffs = self._reserve()
+            if wait_time <= 0:
+                return
+            time.sleep(wait_time)
+            if self._backoffs == backoffs:
+                return
+
+    async def acquire_async(self):
+        """Take a token, yielding to other tasks until one is available. A
+        backoff while waiting is handled the same as in acquire()."""
+        while True:
+            wait_time, backoffs = self._reserve()
+            if wait_time <= 0:
+                return
+            await asyncio.sleep(wait_time)
+            if self._backoffs == backoffs:
+                return
+
+    def backoff(self, retry_after: float | None=None):
+        """Slow down after being throttled. No tokens are handed out until
+        retry_after seconds have passed, or one period at the lowered rate if
+        it is not given, and the rate is halved."""
+        with self._lock:
+            self._refill()
+            self._rate = max(self.min_rate, self._rate / 2)
+            if retry_after is None or retry_after < 0:
+                retry_after = 1 / self._rate
+
+            # callers that are already waiting will see the backoff when they
+            # wake and take a new token then, so the ones they owe for are
+            # forgiven rather than counted twice.
+            self._tokens = 0.0
+            self._backoffs += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            _log.debug("Backing off for %.3fs; rate is now %.3f/s", retry_after, self._rate)
+
+    def succeeded(self):
+        """Record an action that was not throttled, bringing the rate back
+        toward max_rate if it had been lowered."""
+        if self._rate >= self.max_rate:
+            return
+        with self._lock:
+            self._refill()
+            self._rate = min(self.max_rate, self._rate + self.max_rate * self.recovery)
+
+    def _reserve(self) -> Tuple[float, int]:
+        """Take a token, even if that leaves the bucket owing one, and return
+        how long the caller must wait before acting on it along with the number
+        of backoffs so far."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+
+            # the bucket only starts filling again once any backoff is over
+            wait_time = max(self._blocked_until - self._updated, 0.0)
+            if self._tokens < 0:
+                wait_time += -self._tokens / self._rate
+            return wait_time, self._backoffs
+
+    def _refill(self):
+        now = time.monotonic()
+        # nothing accrues while blocked
+        start = max(self._updated, self._blocked_until)
+        if now > start:
+            self._tokens = min(float(self.burst), self._tokens + (now - start) * self._rate)
+        self._updated = now
+
+
+class PhaseTimer:
+    """Records how much wall-clock time is spent in each named phase of a
+    longer operation. Wrap each phase in a `with timer.phase('name'):` block;
+    time spent in a phase that is entered more than once is summed.
+    """
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as part of the given phase."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            _log.debug("Phase %s took %.3fs", name, elapsed)
+
+    @property
+    def total(self) -> float:
+        """Return the total time spent across all phases, in seconds."""
+        return sum(self.phases.values())
+
+    def __str__(self):
+        return ', '.join("{:s} {:.3f}s".format(k, v) for k, v in self.phases.items())
@@ -545,6 +545,20 @@ class DeckChangeRecord:
         self.card_data = card_data
 
 
+class InventoryTotals:
+    """InventoryTotals is a summary of the counts of all cards in inventory."""
+
+    def __init__(self, entries: int=0, owned: int=0, wishlisted: int=0, in_use: int=0, free: int=0):
+        self.entries = entries
+        self.owned = owned
+        self.wishlisted = wishlisted
+        self.in_use = in_use
+        self.free = free
+
+    def __repr__(self):
+        return "InventoryTotals(entries={!r}, owned={!r}, wishlisted={!r}, in_use={!r}, free={!r})".format(self.entries, self.owned, self.wishlisted, self.in_use, self.free)
+
+
 # TODO: make this apply to non-interactive commands as well
 class Config:
     def __init__(self, deck_used_states: list[str]=['C', 'P']):
@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 
 import logging.handlers
+import os
 import sys
 import argparse
+import datetime
 
-from mtg import cards, deckbox, decks, types, interactive, version, elog
-from mtg.db import schema
+from mtg import cards, deckbox, decks, types, interactive, maint, scryfall, version, elog, http
+from mtg.db import schema, configdb, util as dbutil
 
 import mtg.db
 import mtg
 
 
+# Seconds between progress lines printed by the warm-cache subcommand.
+WARM_CACHE_PROGRESS_SECS = 5
+
+
 class ArgumentError(ValueError):
     def __init__(self, msg):
         self.msg = msg
@@ -25,12 +31,34 @@ def main():
     parser.add_argument('-D', '--db-filename', default='inv.db', help="path to sqlite3 inventory DB file")
     parser.add_argument('-V', '--version', action='store_true', help="print version and exit")
     parser.add_argument('-l', '--log', metavar='FILE', help="Enable logging to FILE. Mostly applies to interactive mode.")
+    parser.add_argument('--http-cache', metavar='FILE', default=default_http_cache_path(), help="path to the file that responses from scryfall are cached in, so that unchanged data is not downloaded again. Only lookups of a single card or set are cached; the many-card requests sent by warm-cache and the other bulk downloads are not. Default is %(default)s")
+    parser.add_argument('--http-cache-max-mb', metavar='MB', type=int, default=256, help="Drop the least recently used responses from the HTTP cache when it grows larger than this. Default is %(default)s")
+    parser.add_argument('--http-cache-max-days', metavar='DAYS', type=int, default=90, help="Drop responses from the HTTP cache that have not been confirmed current by scryfall within this many days. Default is %(default)s")
+    parser.add_argument('--no-http-cache', action='store_true', help="Do not cache responses from scryfall")
     parser.set_defaults(func=invoke_interactive_mode)
     subs = parser.add_subparsers(title='SUBCOMMANDS', required=False, metavar='SUBCOMMAND')
 
     init_parser = subs.add_parser('init-db', help="Initialize a new database")
     init_parser.set_defaults(func=invoke_init_db)
 
+    migrate_parser = subs.add_parser('migrate-db', help="Upgrade an existing database to the latest schema version without losing any data")
+    migrate_parser.add_argument('--rerun', action='store_true', help="Re-apply every migration, even ones the database already has. Can be used to repair a database whose indexes have been lost.")
+    migrate_parser.set_defaults(func=invoke_migrate_db)
+
+    config_parser = subs.add_parser('config', help="View or change settings stored in the database. Give no key to list all settings, a key to show its value, or a key and a value to change it. Connection settings (journal_mode, busy_timeout, cache_size, mmap_size, temp_store) take effect the next time the database is opened.")
+    config_parser.add_argument('key', nargs='?', help="The setting to show or change")
+    config_parser.add_argument('value', nargs='?', help="The new value for the setting. For list settings, separate items with commas.")
+    config_parser.set_defaults(func=invoke_config)
+
+    import_bulk_parser = subs.add_parser('import-scryfall-bulk', help="Fill in scryfall data for every card in inventory from a scryfall bulk data file (such as default-cards or oracle-cards) instead of downloading it from scryfall. Cards are matched by scryfall ID, or by edition, collector number, and name.")
+    import_bulk_parser.add_argument('bulk_filename', help="path to the bulk data JSON file; may be gzipped if it ends in .gz")
+    import_bulk_parser.add_argument('-n', '--dry-run', action='store_true', help="Only report which cards have data in the file; do not store anything")
+    import_bulk_parser.set_defaults(func=invoke_import_scryfall_bulk)
+
+    warm_cache_parser = subs.add_parser('warm-cache', help="Download scryfall data for every card in inventory whose data is missing or expired, with several requests in flight at once. Progress is printed as it goes; Ctrl-C stops early and keeps what was already downloaded.")
+    warm_cache_parser.add_argument('-j', '--fetchers', type=int, default=maint.DEFAULT_WARM_FETCHERS, help="Number of requests to scryfall to have in flight at once. They all share the same rate limit. Default is %(default)s")
+    warm_cache_parser.set_defaults(func=invoke_warm_cache)
+
     import_parser = subs.add_parser('import', help="Import a list of cards from deckbox CSV file")
     import_parser.add_argument('csv_filename', help="path to csv file to import")
     import_parser.add_argument('-y', '--yes', action='store_true', help="Skip confirmation prompt")
@@ -158,8 +186,18 @@ def main():
     log = elog.get('mtgdb')
     log.debug("----- Started mtgdb v%s -----", version.version)
 
+    if not args.no_http_cache:
+        cache = http.ResponseCache(
+            args.http_cache,
+            max_size=args.http_cache_max_mb * 1024 * 1024,
+            max_age=datetime.timedelta(days=args.http_cache_max_days),
+        )
+        scryfall.use_http_cache(cache)
+
     try:
-        args.func(args)
+        # every db call made by the subcommand shares the same connections
+        with dbutil.open_pool(args.db_filename):
+            args.func(args)
     except mtg.db.DBError as e:
         print("ERROR: " + str(e), file=sys.stderr)
         log.exception("Database error")
@@ -174,6 +212,14 @@ def main():
         sys.exit(1)
 
 
+def default_http_cache_path() -> str:
+    if os.name == 'nt' and 'LOCALAPPDATA' in os.environ:
+        cache_dir = os.environ['LOCALAPPDATA']
+    else:
+        cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_dir, 'mtgdb', 'http-cache.db')
+
+
 def invoke_interactive_mode(args):
     interactive.start(args.db_filename, not args.use_main_buffer)
 
@@ -183,6 +229,82 @@ def invoke_init_db(args):
     return schema.init(db_filename)
 
 
+def invoke_migrate_db(args):
+    db_filename = args.db_filename
+    results = schema.migrate(db_filename, rerun=args.rerun)
+    for r in results:
+        print("Applied migration {:s}".format(str(r)))
+    print("Database is at schema version {:d}".format(schema.get_version(db_filename)))
+
+
+def invoke_config(args):
+    db_filename = args.db_filename
+
+    if args.key is None:
+        for key, _, value, desc in configdb.get_all(db_filename):
+            if isinstance(value, list):
+                value = ','.join(str(v) for v in value)
+            print("{:s} = {!s}\n    {:s}".format(key, value, desc))
+        return
+
+    if args.value is None:
+        value = configdb.get(db_filename, args.key)
+        if isinstance(value, list):
+            value = ','.join(str(v) for v in value)
+        print(value)
+        return
+
+    key_type = [x[1] for x in configdb.get_all(db_filename) if x[0].lower() == args.key.lower()]
+    value = args.value
+    if len(key_type) > 0 and key_type[0].upper().startswith('COMMA-LIST'):
+        value = [v.strip() for v in value.split(',') if v.strip() != '']
+
+    configdb.set(db_filename, args.key, value)
+    print("Set {:s} to {!s}".format(args.key, args.value))
+
+
+def invoke_import_scryfall_bulk(args):
+    db_filename = args.db_filename
+
+    def show_progress(read: int, matched: int, total: int):
+        print("Read {:d} entries; found data for {:d}/{:d} cards...".format(read, matched, total))
+
+    matched, not_found = maint.import_scryfall_bulk_data(db_filename, args.bulk_filename, apply=not args.dry_run, progress=show_progress)
+
+    if args.dry_run:
+        for c in not_found:
+            print("No data found for {:s} {:s} (ID {:d})".format(c.cardnum, c.name, c.id))
+        print("Found data for {:d} of {:d} cards; nothing was stored".format(len(matched), len(matched) + len(not_found)))
+    else:
+        print("Stored data for {:d} of {:d} cards".format(len(matched), len(matched) + len(not_found)))
+
+
+def invoke_warm_cache(args):
+    db_filename = args.db_filename
+
+    if args.fetchers < 1:
+        raise ArgumentError("--fetchers must be at least 1")
+
+    warmer = maint.CacheWarmer(db_filename, fetchers=args.fetchers)
+    warmer.start()
+
+    try:
+        while not warmer.join(WARM_CACHE_PROGRESS_SECS):
+            print(str(warmer.stats()))
+    except KeyboardInterrupt:
+        print("Stopping; storing data that was already downloaded...")
+        warmer.stop()
+        warmer.join()
+
+    for c in warmer.not_found:
+        print("No data found for {:s} {:s} (ID {:d})".format(c.cardnum, c.name, c.id))
+
+    st = warmer.stats()
+    print(str(st))
+    if st.last_error is not None:
+        print("{:d} errors occurred; last was: {:s}".format(st.errors, st.last_error))
+
+
 def invoke_import(args):
     db_filename = args.db_filename
     csv_filename = args.csv_filename
@@ -459,7 +581,10 @@ def invoke_remove_wish(args):
 def invoke_show_inven(args):
     card = mtg.card_from_cli_arg(args.db_filename, args.card)
     s = interactive.Session(args.db_filename)
-    interactive.show_card_large_view(s, card, None)
+    try:
+        interactive.show_card_large_view(s, card, None)
+    finally:
+        s.close()
 
 
 if __name__ == "__main__":
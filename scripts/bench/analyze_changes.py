@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# Benchmarks deckbox.analyze_changes against the nested-loop matching it
+# replaced, over a range of inventory sizes, to show where the indexed lookup
+# overtakes the linear scan. Run from the repo root:
+#
+#     python scripts/bench/analyze_changes.py [SIZE ...]
+#
+# Half of each imported list matches an existing entry with the same count, so
+# no interactive deck prompts are triggered; the other half is new cards.
+
+import contextlib
+import io
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from mtg import deckbox
+from mtg.types import Card, CardWithUsage
+
+
+DEFAULT_SIZES = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+# the nested loop gets slow quickly; sizes above this are only run indexed.
+MAX_NESTED_SIZE = 2500
+
+
+def make_cards(n: int) -> tuple[list[Card], list[CardWithUsage]]:
+    existing = []
+    importing = []
+    for i in range(n):
+        c = Card(id=i+1, count=(i % 4) + 1, name="Card {:d}".format(i), edition='ABC', tcg_num=i, foil=(i % 3 == 0))
+        existing.append(CardWithUsage(c))
+        if i % 2 == 0:
+            imp = c.clone()
+            imp.id = None
+            imp.name = imp.name.upper()
+        else:
+            imp = Card(count=1, name="New Card {:d}".format(i), edition='ABC', tcg_num=n+i)
+        importing.append(imp)
+    return importing, existing
+
+
+def nested_match(importing: list[Card], existing: list[CardWithUsage]) -> list[Card]:
+    """
+    The matching loop analyze_changes used before the identity index, minus the
+    change reporting. The indexed timings do include that reporting, so the
+    comparison slightly favors this version.
+    """
+    no_dupes = []
+    for card in importing:
+        already_exists = False
+        for check in existing:
+            if card.name.lower() != check.name.lower():
+                continue
+            if card.edition.lower() != check.edition.lower():
+                continue
+            if card.tcg_num != check.tcg_num:
+                continue
+            if card.condition.lower() != check.condition.lower():
+                continue
+            if card.language.lower() != check.language.lower():
+                continue
+            if card.foil != check.foil:
+                continue
+            if card.signed != check.signed:
+                continue
+            if card.artist_proof != check.artist_proof:
+                continue
+            if card.altered_art != check.altered_art:
+                continue
+            if card.misprint != check.misprint:
+                continue
+            if card.promo != check.promo:
+                continue
+            if card.textless != check.textless:
+                continue
+            if card.printing_id != check.printing_id:
+                continue
+            if card.printing_note.lower() != check.printing_note.lower():
+                continue
+            already_exists = True
+            break
+        if not already_exists:
+            no_dupes.append(card)
+    return no_dupes
+
+
+def indexed_match(importing: list[Card], existing: list[CardWithUsage]) -> list[Card]:
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        no_dupes, _, _, _, _, _ = deckbox.analyze_changes(':memory:', importing, existing)
+    return no_dupes
+
+
+def best_of(func, importing, existing) -> float:
+    t = timeit.Timer(lambda: func(importing, existing))
+    loops, _ = t.autorange()
+    return min(t.repeat(repeat=3, number=loops)) / loops
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] if len(sys.argv) > 1 else DEFAULT_SIZES
+
+    print("{:>8s}  {:>12s}  {:>12s}  {:>8s}".format("size", "nested (s)", "indexed (s)", "speedup"))
+    for n in sizes:
+        importing, existing = make_cards(n)
+
+        indexed = best_of(indexed_match, importing, existing)
+        if n <= MAX_NESTED_SIZE:
+            assert [c.name for c in nested_match(importing, existing)] == [c.name for c in indexed_match(importing, existing)]
+            nested = best_of(nested_match, importing, existing)
+            print("{:>8d}  {:>12.6f}  {:>12.6f}  {:>7.1f}x".format(n, nested, indexed, nested / indexed))
+        else:
+            print("{:>8d}  {:>12s}  {:>12.6f}  {:>8s}".format(n, '-', indexed, '-'))
+
+
+if __name__ == '__main__':
+    main()